@@ -0,0 +1,121 @@
+import pandas as pd
+
+from profiler import step
+from schema import day_dates
+
+# Census age bands of the ward population table, per age band of the geo view
+AGE_GROUPS = {'0-4': range(0, 5), '5-11': range(5, 12), '12-16': range(12, 17), '17-24': range(17, 25),
+              '25-34': range(25, 35), '35-44': range(35, 45), '45-64': range(45, 65), '65+': range(65, 91)}
+
+
+def geo_locate(cleaned_df: pd.DataFrame, df_postcodes: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add the latitude and longitude of each voucher's postcode, dropping vouchers whose postcode is not listed
+
+    Parameters:
+        cleaned_df (pd.DataFrame): The geo view
+        df_postcodes (pd.DataFrame): Postcode lookup with "postcode", "latitude" and "longitude" columns
+    Returns:
+        pd.DataFrame: The located vouchers
+    """
+    with step("geocode", cleaned_df) as record:
+        postcodes = df_postcodes[df_postcodes['postcode'].isin(cleaned_df['postcode'].unique())]
+        # The first row of a postcode listed more than once wins
+        postcode_coords = postcodes.drop_duplicates(subset='postcode').set_index('postcode')
+
+        cleaned_df = cleaned_df.assign(
+            latitude=cleaned_df['postcode'].map(postcode_coords['latitude']),
+            longitude=cleaned_df['postcode'].map(postcode_coords['longitude']),
+        )
+        cleaned_df = cleaned_df.dropna(subset=['latitude', 'longitude'])
+        record["rows_out"] = len(cleaned_df)
+    return cleaned_df
+
+
+def postcode_counts(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Count the vouchers and distinct addresses of each postcode, with its coordinates when the vouchers are located
+    """
+    unique_address_pair = df[['address1', 'address2']].apply(tuple, axis=1)
+    aggregations = {'count': ('postcode', 'size')}
+    if 'latitude' in df.columns:
+        aggregations.update(latitude=('latitude', 'first'), longitude=('longitude', 'first'))
+    aggregations['unique_count'] = ('unique_address_pair', 'nunique')
+    return (
+        df.assign(unique_address_pair=unique_address_pair)
+        .groupby('postcode')
+        .agg(**aggregations)
+        .reset_index()
+    )
+
+
+def historical_voucher_counts(df: pd.DataFrame, foodbanks: list) -> pd.DataFrame:
+    """
+    Return the cumulative vouchers created by each date, per selected food bank and for all food banks
+
+    Parameters:
+        df (pd.DataFrame): The filtered geo view
+        foodbanks (list): The food bank centres to count separately
+    Returns:
+        pd.DataFrame: "assigned food bank centre", "date", "voucher_count" and "cumulative_voucher_count",
+        with the "All Foodbanks" rows last
+    """
+    # Group on the integer day of creation, and turn it back into dates once the counts are small
+    df = df.assign(date=df["created at: day"])
+    filtered_df = df[df["assigned food bank centre"].isin(foodbanks)]
+
+    # Cumulative sum of vouchers by date
+    historical_counts = filtered_df.groupby(["assigned food bank centre", "date"]).size().reset_index(name="voucher_count")
+    historical_counts["cumulative_voucher_count"] = historical_counts.groupby("assigned food bank centre")["voucher_count"].cumsum()
+
+    # Combined line
+    combined_counts = df.groupby("date").size().reset_index(name="voucher_count")
+    combined_counts["cumulative_voucher_count"] = combined_counts["voucher_count"].cumsum()
+    combined_counts["assigned food bank centre"] = "All Foodbanks"
+    counts = pd.concat([historical_counts, combined_counts], ignore_index=True)
+    counts["date"] = day_dates(counts["date"])
+    return counts
+
+
+def ward_population(df: pd.DataFrame, df_wards: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return each ward's voucher users as a share of its population, overall and per age band
+
+    Parameters:
+        df (pd.DataFrame): The filtered geo view
+        df_wards (pd.DataFrame): Ward population table with "Ward Name", "Ward Code", "All ages " and one column per age
+    Returns:
+        pd.DataFrame: One row per ward found in both tables
+    """
+    ward_population_df = df.groupby('ward')[['household_size']+list(AGE_GROUPS.keys())].sum().reset_index()
+
+    df_wards = df_wards.assign(population=df_wards['All ages '].astype(str).str.replace(',', '').astype(int))
+
+    # Merge with df_wards to get the 'All ages' column
+    ward_population_df = ward_population_df.merge(df_wards,  left_on='ward', right_on='Ward Name', how='left').dropna()
+
+    # Calculate population percentage of 'All ages' for each ward
+    ward_population_df['population_percentage'] = round((ward_population_df['household_size'] / ward_population_df['population']) * 100,2)
+
+    ward_population_df['90'] = ward_population_df['90+']
+    for age_group, ages in AGE_GROUPS.items():
+        ward_population_df[f"{age_group}_percentage"] = (
+            ward_population_df[age_group]/
+            ward_population_df[[str(age) for age in ages]].sum(axis=1)
+        ) * 100
+
+    # Compute the sum of age group percentages
+    ward_population_df["age_group_total_percentage"] = ward_population_df[[f"{age_group}_percentage" for age_group in AGE_GROUPS]].sum(axis=1)
+
+    # Compute the scaling factor for each row
+    ward_population_df["scaling_factor"] = ward_population_df["population_percentage"] / ward_population_df["age_group_total_percentage"]
+
+    # Scale each age group percentage
+    for age_group in AGE_GROUPS:
+        ward_population_df[f"{age_group}_scaled_percentage"] = round((
+            ward_population_df[f"{age_group}_percentage"] * ward_population_df["scaling_factor"]
+        ),2)
+
+    ward_population_df = ward_population_df.drop('Ward Name', axis=1)
+
+    return ward_population_df
@@ -0,0 +1,6 @@
+"""
+Synthetic voucher exports and timings of the ingest and cleaning hot paths.
+
+    python -m benchmarks.generate --sizes 5k 50k --password secret
+    python -m benchmarks.run --sizes 5k 50k
+"""
@@ -0,0 +1,313 @@
+"""
+Write synthetic voucher exports with the layout of the real one, for benchmarking.
+
+    python -m benchmarks.generate --sizes 5k 50k 500k 5m --password secret
+
+Each size is written to <output>/vouchers_<size>.xlsx, plus vouchers_<size>_encrypted.xlsx
+when a password is given, with a postcodes.csv and wards.csv that locate every generated
+voucher. A sheet holds at most 1,048,576 rows, so larger sizes are split into numbered
+parts (vouchers_5m_part1.xlsx, ...) the way a long history would arrive as several exports.
+
+The data is random but shaped like the export: every column of `column_headings`, clients
+who come back for several vouchers under the same name and address, county and town
+spellings as messy as the ones dbclean_1 normalises, and a small share of duplicate rows.
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from msoffcrypto.format.ooxml import OOXMLFile
+from openpyxl import Workbook
+
+from ingest import column_headings
+
+SIZES = {"5k": 5_000, "50k": 50_000, "500k": 500_000, "5m": 5_000_000}
+# Data rows of one sheet, below Excel's 1,048,576 row limit with room for the header
+MAX_SHEET_ROWS = 1_000_000
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+FIRST_NAMES = ["Olivia", "Amelia", "Isla", "Ava", "Mia", "Ivy", "Lily", "Grace", "Freya", "Sophia",
+               "Noah", "Oliver", "George", "Arthur", "Leo", "Harry", "Oscar", "Archie", "Henry", "Jack"]
+LAST_NAMES = ["Smith", "Jones", "Williams", "Taylor", "Brown", "Davies", "Evans", "Wilson", "Thomas", "Johnson",
+              "Roberts", "Robinson", "Thompson", "Wright", "Walker", "White", "Edwards", "Hughes", "Green", "O'Neil"]
+STREETS = ["High Street", "Church Road", "Station Road", "London Road", "Victoria Road", "Park Lane",
+           "Mill Lane", "Cricklade Street", "Dyer Street", "Watermoor Road", "Chesterton Lane", "Querns Lane"]
+# Town, county spellings typed for it, postcode district and wards
+PLACES = [
+    ("Cirencester", ["Gloucestershire", "Glos", "glos.", "Gloucs", "GLOUCESTERSHIRE", "Gloucestershrie", "GL7 1AB"],
+     "GL7", ["Abbey", "Chesterton", "Beeches", "Stratton", "Watermoor"]),
+    ("Tetbury", ["Gloucestershire", "Glouchester", "Gl", "Gloucestershire GL8 8AA"],
+     "GL8", ["Tetbury Town", "Tetbury Upton"]),
+    ("Fairford", ["Gloucestershire", "Glos", "gloucestershire "], "GL7", ["Fairford North", "Fairford South"]),
+    ("Lechlade", ["Gloucestershire", "Glouces"], "GL7", ["Lechlade"]),
+    ("Malmesbury", ["Wiltshire", "Wilts", "wilts."], "SN16", ["Malmesbury"]),
+    ("Swindon", ["Wiltshire", "Swindon", "SN1"], "SN1", ["Central Swindon"]),
+    ("Burford", ["Oxfordshire", "Oxon"], "OX18", ["Burford"]),
+]
+# Spelling variants of each town, besides the plain name
+TOWN_VARIANTS = ["{}", "{}", "{}", "{}.", " {}", "{} ", str.lower, str.upper]
+CRISIS_TYPES = ["Low income", "Debt", "Benefit delays", "Benefit changes", "Sickness/ill health", "Homeless",
+                "Domestic abuse", "Child holiday meals", "No recourse to public funds", "Delayed wages",
+                "Refused short term benefit advance", "Other"]
+INCOME_SOURCES = ["Universal Credit", "Legacy benefits", "Pension", "Wages", "No income", "Unknown"]
+REFERRAL_REASONS = ["Benefit delays", "Low income", "Debt", "Sickness/ill health", "Homeless", "Domestic abuse",
+                    "Delayed wages", "Child holiday meals"]
+CENTRES = ["Cirencester", "Tetbury", "Fairford", "Lechlade"]
+AGENCIES = ["Citizens Advice", "Job Centre Plus", "GP Surgery", "Housing Association", "Social Services", "School"]
+ISSUERS = ["Jane Doe", "john smith", "SARAH BROWN", "Tom Evans ", "Amy Green", "Raj Patel"]
+VOUCHER_STATUSES = ["Fulfilled", "Fulfilled", "Fulfilled", "Unfulfilled", "Expired"]
+# The household columns changed on 4th April 2023, vouchers issued before it fill the "pre" columns
+HOUSEHOLD_CHANGE = pd.Timestamp("2023-04-04")
+
+
+def parse_size(size: str) -> int:
+    """
+    Return the row count of a size name ("5k", "50k", "500k", "5m") or a plain number
+    """
+    size = size.lower()
+    if size in SIZES:
+        return SIZES[size]
+    if size[-1:] in ("k", "m"):
+        return int(float(size[:-1]) * (1_000 if size[-1] == "k" else 1_000_000))
+    return int(size)
+
+
+def _choice(rng: np.random.Generator, values: list, n: int, p: list = None) -> np.ndarray:
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=n, p=p)]
+
+
+def _blank(rng: np.random.Generator, values: np.ndarray, share: float) -> np.ndarray:
+    """
+    Blank out a random share of the values, the way optional fields are left empty in the export
+    """
+    values = values.astype(object)
+    values[rng.random(len(values)) < share] = None
+    return values
+
+
+def generate_vouchers(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Generate a raw voucher export
+
+    Parameters:
+        n_rows (int): Number of vouchers, including the duplicated rows
+        seed (int): Seed of the random generator, the same seed gives the same export
+    Returns:
+        pd.DataFrame: The export with every column of `column_headings`, in order
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(index=range(n_rows), columns=column_headings, dtype=object)
+
+    # Clients, a few of whom come back for many vouchers
+    n_clients = max(1, n_rows // 3)
+    client = np.minimum((rng.pareto(1.2, n_rows) * n_clients / 20).astype(np.int64), n_clients - 1)
+    client = rng.permutation(n_clients)[client]
+    place = rng.choice(len(PLACES), size=n_clients, p=[0.45, 0.15, 0.1, 0.08, 0.1, 0.07, 0.05])
+    client_place = place[client]
+
+    df["Client ID"] = 100_000 + client
+    df["First name"] = np.asarray(FIRST_NAMES, dtype=object)[client % len(FIRST_NAMES)]
+    df["Last name"] = np.asarray(LAST_NAMES, dtype=object)[(client // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    # Some vouchers have the name typed in a different case or with stray spaces
+    retyped = rng.random(n_rows) < 0.05
+    df.loc[retyped, "First name"] = df.loc[retyped, "First name"].str.lower() + " "
+    df.loc[retyped, "Last name"] = df.loc[retyped, "Last name"].str.upper()
+    df["Address1"] = (
+        pd.Series(client % 120 + 1).astype(str) + " "
+        + np.asarray(STREETS, dtype=object)[client % len(STREETS)]
+    ).to_numpy()
+    df["Address2"] = _blank(rng, np.where(client % 4 == 0, "Flat " + pd.Series(client % 9 + 1).astype(str), ""), 0.3)
+    df["No fixed address"] = rng.random(n_rows) < 0.02
+
+    towns = np.array([name for name, _, _, _ in PLACES], dtype=object)[client_place]
+    variant = rng.integers(0, len(TOWN_VARIANTS), n_rows)
+    df["Town"] = _blank(rng, np.array([
+        TOWN_VARIANTS[v](t) if callable(TOWN_VARIANTS[v]) else TOWN_VARIANTS[v].format(t)
+        for v, t in zip(variant, towns)
+    ], dtype=object), 0.01)
+    counties = np.empty(n_rows, dtype=object)
+    postcodes = np.empty(n_rows, dtype=object)
+    wards = np.empty(n_rows, dtype=object)
+    for i, (_, spellings, district, place_wards) in enumerate(PLACES):
+        rows = np.flatnonzero(client_place == i)
+        counties[rows] = _choice(rng, spellings, len(rows))
+        clients = client[rows]
+        postcodes[rows] = [f"{district} {c % 9 + 1}{'ABDEFGHJLNPQRSTUWXYZ'[c % 20]}{'ABDEFGHJLNPQRSTUWXYZ'[c // 20 % 20]}"
+                           for c in clients]
+        wards[rows] = np.asarray(place_wards, dtype=object)[clients % len(place_wards)]
+    df["County"] = _blank(rng, counties, 0.03)
+    df["Postcode"] = postcodes
+    df["Ward"] = _blank(rng, wards, 0.02)
+    df["Birth year"] = _blank(rng, (1940 + client % 65).astype(object), 0.2)
+
+    # Three years of vouchers, with more issued in winter
+    start = pd.Timestamp("2021-01-01")
+    days = rng.integers(0, 3 * 365, n_rows)
+    days = np.where(rng.random(n_rows) < 0.15, (days // 365) * 365 + rng.integers(300, 365, n_rows), days) % (3 * 365)
+    issued = start + pd.to_timedelta(days, unit="D") + pd.to_timedelta(rng.integers(8 * 3600, 18 * 3600, n_rows), unit="s")
+    issued = pd.Series(issued).dt.floor("s")
+    df["Date issued to client"] = issued.to_numpy()
+    df["Created at"] = (issued - pd.to_timedelta(rng.integers(0, 3 * 3600, n_rows), unit="s")).to_numpy()
+    status = _choice(rng, VOUCHER_STATUSES, n_rows)
+    df["Voucher status"] = status
+    fulfilled = issued + pd.to_timedelta(rng.integers(0, 5, n_rows), unit="D")
+    df["Fulfilled date"] = fulfilled.where(status == "Fulfilled").to_numpy()
+    df["Voucher code"] = [f"CIR{seed:02d}{i:08d}" for i in range(n_rows)]
+
+    df["Crisis type"] = _blank(rng, _choice(rng, CRISIS_TYPES, n_rows), 0.02)
+    df["Crisis cause"] = _blank(rng, _choice(rng, ["Income", "Benefits", "Health", "Housing"], n_rows), 0.5)
+    df["Was Covid-19 a contributing factor?"] = _choice(rng, ["Yes", "No", None], n_rows)
+    df["Parcel days"] = _choice(rng, [3, 3, 5, 7], n_rows)
+    df["Consent for contacting about delivery or collection"] = _choice(rng, ["Yes", "No"], n_rows)
+    for column in column_headings:
+        if column.startswith("Secondary crisis:"):
+            df[column] = rng.random(n_rows) < 0.08
+    df["Source of income"] = _choice(rng, INCOME_SOURCES, n_rows)
+    reasons = _choice(rng, REFERRAL_REASONS, n_rows)
+    second = _choice(rng, REFERRAL_REASONS, n_rows)
+    df["Reasons for referral"] = _blank(rng, np.where(
+        (rng.random(n_rows) < 0.3) & (second != reasons), reasons + ", " + second, reasons
+    ), 0.05)
+    df["Assigned food bank centre"] = np.asarray(CENTRES, dtype=object)[np.minimum(client_place, len(CENTRES) - 1)]
+    df["Foodbank centre fulfilled at"] = df["Assigned food bank centre"].where(status == "Fulfilled")
+    df["Agency"] = _choice(rng, AGENCIES, n_rows)
+    df["Issued by"] = _choice(rng, ISSUERS, n_rows)
+    df["Delivery required"] = rng.random(n_rows) < 0.25
+    df["Consent for holding information about dietary requirements"] = _choice(rng, ["Yes", "No"], n_rows)
+    df["Dietary requirements"] = _blank(rng, _choice(rng, ["Vegetarian", "Halal", "Gluten free"], n_rows), 0.9)
+    df["Client phone number"] = "07700 9" + pd.Series(client % 100_000).astype(str).str.zfill(5).to_numpy()
+    df["Collection/Delivery notes"] = _blank(rng, _choice(rng, ["Leave at door", "Call on arrival"], n_rows), 0.8)
+
+    # Household sizes of each client, in the columns in use on the issue date
+    before_change = (issued < HOUSEHOLD_CHANGE).to_numpy()
+    for prefix in ("The usual household structure", "Number of people the voucher is for"):
+        for column in column_headings:
+            if not column.startswith(prefix):
+                continue
+            count = rng.choice([0, 0, 0, 1, 1, 2, 3], size=n_rows).astype(object)
+            in_use = before_change if "pre 4th April 2023" in column else ~before_change
+            count[~in_use] = None
+            df[column] = count
+    for column in ["Partner or spouse (usual household structure)", "Parent or carer (usual household structure)",
+                   "Partner or spouse (number of people the voucher is for)",
+                   "Parent or carer (number of people the voucher is for)"]:
+        df[column] = _choice(rng, ["Yes", "No", None], n_rows)
+
+    # Exported twice by mistake
+    duplicates = rng.choice(n_rows, size=n_rows // 200, replace=False)
+    targets = rng.choice(n_rows, size=len(duplicates), replace=False)
+    df.iloc[targets] = df.iloc[duplicates].to_numpy()
+    return df
+
+
+def postcode_lookup(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return a postcode, latitude and longitude table locating every postcode of the export
+    """
+    postcodes = pd.Series(df["Postcode"].dropna().unique())
+    rng = np.random.default_rng(len(postcodes))
+    return pd.DataFrame({
+        "postcode": postcodes,
+        "latitude": (51.72 + rng.normal(0, 0.08, len(postcodes))).round(5),
+        "longitude": (-1.97 + rng.normal(0, 0.12, len(postcodes))).round(5),
+    })
+
+
+def ward_table(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return a ward population table, in the layout of the census sheet, for every ward of the export
+    """
+    wards = sorted(df["Ward"].dropna().unique())
+    rng = np.random.default_rng(len(wards))
+    ages = rng.integers(20, 120, size=(len(wards), 91))
+    table = pd.DataFrame(ages, columns=[str(age) for age in range(90)] + ["90+"])
+    table.insert(0, "All ages ", [f"{total:,}" for total in ages.sum(axis=1)])
+    table.insert(0, "Ward Code", [f"E0500{i:04d}" for i in range(len(wards))])
+    table.insert(0, "Ward Name", wards)
+    return table
+
+
+def write_workbook(df: pd.DataFrame, path: str):
+    """
+    Write the export to an xlsx workbook
+
+    Rows are streamed through openpyxl's write-only mode, so the workbook is never held
+    in memory as cells.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Vouchers")
+    sheet.append(list(df.columns))
+    for row in df.itertuples(index=False, name=None):
+        sheet.append([None if value is None or value is pd.NaT or value != value else value for value in row])
+    workbook.save(path)
+
+
+def encrypt_workbook(path: str, encrypted_path: str, password: str):
+    """
+    Write a password protected copy of a workbook, the way Excel encrypts the export
+    """
+    with open(path, "rb") as plain, open(encrypted_path, "wb") as f:
+        OOXMLFile(plain).encrypt(password, f)
+
+
+def workbook_paths(output_dir: str, size: str, encrypted: bool = False) -> list[str]:
+    """
+    Return the workbook files of a size, one per part of at most MAX_SHEET_ROWS rows
+    """
+    n_parts = -(-parse_size(size) // MAX_SHEET_ROWS)
+    suffix = "_encrypted" if encrypted else ""
+    if n_parts == 1:
+        return [os.path.join(output_dir, f"vouchers_{size}{suffix}.xlsx")]
+    return [os.path.join(output_dir, f"vouchers_{size}_part{part + 1}{suffix}.xlsx") for part in range(n_parts)]
+
+
+def generate(size: str, output_dir: str = DEFAULT_OUTPUT, password: str = None, seed: int = 0) -> list[str]:
+    """
+    Write the workbooks of one size, and the postcode and ward tables covering them
+
+    Returns:
+        list: The paths written
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    n_rows = parse_size(size)
+    written = []
+    located = []
+    plain_paths = workbook_paths(output_dir, size)
+    encrypted_paths = workbook_paths(output_dir, size, encrypted=True)
+    for part, path in enumerate(plain_paths):
+        # Each part gets its own seed, so parts have distinct voucher codes
+        df = generate_vouchers(min(MAX_SHEET_ROWS, n_rows - part * MAX_SHEET_ROWS), seed=seed + part)
+        write_workbook(df, path)
+        written.append(path)
+        located.append(df[["Postcode", "Ward"]])
+        if password is not None:
+            encrypt_workbook(path, encrypted_paths[part], password)
+            written.append(encrypted_paths[part])
+    located = pd.concat(located, ignore_index=True)
+    postcode_lookup(located).to_csv(os.path.join(output_dir, "postcodes.csv"), index=False)
+    ward_table(located).to_csv(os.path.join(output_dir, "wards.csv"), index=False)
+    return written
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Write synthetic voucher exports for the benchmarks.")
+    parser.add_argument("--sizes", nargs="+", default=["5k", "50k"],
+                        help="Row counts to generate, e.g. 5k 50k 500k 5m (default: 5k 50k)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Directory to write the workbooks to")
+    parser.add_argument("--password", help="Also write an encrypted copy of each workbook with this password")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random data (default: 0)")
+    args = parser.parse_args(argv)
+
+    for size in args.sizes:
+        started = datetime.now()
+        paths = generate(size, args.output, args.password, args.seed)
+        seconds = (datetime.now() - started).total_seconds()
+        print(f"{size}: wrote {len(paths)} workbook(s) in {seconds:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Time the ingest and cleaning hot paths against the synthetic exports, and append the timings to a results file.
+
+    python -m benchmarks.generate --sizes 5k 50k --password secret
+    python -m benchmarks.run --sizes 5k 50k --password secret
+
+Each benchmark runs `--repeat` times on a fresh copy of its input and the fastest run is
+kept. One JSON line per size and benchmark is appended to the results file, with the
+commit it was measured at, so results from before and after a change sit side by side.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import dbclean
+import dbclean_1
+from aggregates import geo_locate, ward_population
+from ingest import load_excel
+from benchmarks.generate import DEFAULT_OUTPUT, parse_size, workbook_paths
+
+DEFAULT_RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl")
+BENCHMARKS = ["load_excel", "load_excel_encrypted", "clean_voucher", "clean_geo",
+              "individual_journey_filter", "geo_locate", "ward_population"]
+
+
+def git_commit() -> str:
+    """
+    Return the short hash of the checked out commit, or None outside a git checkout
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def best_time(function, make_input, repeat: int) -> tuple[float, object]:
+    """
+    Return the fastest of `repeat` timed calls of function(make_input()), and the last result
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        argument = make_input()
+        start = time.perf_counter()
+        result = function(argument)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def load_workbooks(paths: list[str], password: str = None) -> pd.DataFrame:
+    """
+    Load each part of an export with load_excel and stack them
+    """
+    frames = []
+    for path in paths:
+        with open(path, "rb") as f:
+            df, success = load_excel(f, password=password)
+        if not success:
+            raise ValueError(f"Failed to load {path}")
+        frames.append(df)
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+def run_size(size: str, data_dir: str, benchmarks: list[str], password: str = None, repeat: int = 1) -> list[dict]:
+    """
+    Run the benchmarks on one size of export
+
+    Benchmarks whose input is missing (e.g. no encrypted workbook was generated) are skipped.
+
+    Returns:
+        list: One record per benchmark run, with "benchmark", "seconds", "rows_in" and "rows_out"
+    """
+    paths = workbook_paths(data_dir, size)
+    if not all(os.path.exists(path) for path in paths):
+        raise FileNotFoundError(f"No {size} export in {data_dir}, run python -m benchmarks.generate --sizes {size}")
+    records = []
+
+    def record(benchmark, seconds, rows_in, result):
+        rows_out = len(result[0] if isinstance(result, tuple) else result) if result is not None else 0
+        records.append({"benchmark": benchmark, "seconds": round(seconds, 4), "rows_in": rows_in, "rows_out": rows_out})
+        print(f"{size:>6} {benchmark:<28} {seconds:9.3f}s  {rows_in:>9,} -> {rows_out:,} rows")
+
+    # Every later benchmark needs the raw frame, so it is loaded even when load_excel is not timed
+    seconds, raw = best_time(lambda paths: load_workbooks(paths), lambda: paths,
+                             repeat if "load_excel" in benchmarks else 1)
+    if "load_excel" in benchmarks:
+        record("load_excel", seconds, parse_size(size), raw)
+
+    encrypted_paths = workbook_paths(data_dir, size, encrypted=True)
+    if "load_excel_encrypted" in benchmarks and password and all(os.path.exists(path) for path in encrypted_paths):
+        seconds, result = best_time(lambda paths: load_workbooks(paths, password), lambda: encrypted_paths, repeat)
+        record("load_excel_encrypted", seconds, parse_size(size), result)
+
+    seconds, voucher_df = best_time(dbclean_1.clean_data, raw.copy, repeat)
+    if "clean_voucher" in benchmarks:
+        record("clean_voucher", seconds, len(raw), voucher_df)
+    seconds, geo_df = best_time(dbclean.clean_data, raw.copy, repeat)
+    if "clean_geo" in benchmarks:
+        record("clean_geo", seconds, len(raw), geo_df)
+    del raw
+
+    if "individual_journey_filter" in benchmarks:
+        seconds, result = best_time(dbclean_1.individual_journey_filter, voucher_df.copy, repeat)
+        record("individual_journey_filter", seconds, len(voucher_df), result[0])
+
+    df_postcodes = pd.read_csv(os.path.join(data_dir, "postcodes.csv"))
+    seconds, located = best_time(lambda df: geo_locate(df, df_postcodes), geo_df.copy, repeat)
+    if "geo_locate" in benchmarks:
+        record("geo_locate", seconds, len(geo_df), located)
+
+    if "ward_population" in benchmarks:
+        df_wards = pd.read_csv(os.path.join(data_dir, "wards.csv"))
+        seconds, result = best_time(lambda df: ward_population(df, df_wards), located.copy, repeat)
+        record("ward_population", seconds, len(located), result)
+    return records
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Time the ingest and cleaning hot paths on synthetic exports.")
+    parser.add_argument("--sizes", nargs="+", default=["5k", "50k"],
+                        help="Export sizes to run, generated beforehand (default: 5k 50k)")
+    parser.add_argument("--data", default=DEFAULT_OUTPUT, help="Directory of the generated exports")
+    parser.add_argument("--password", help="Password of the encrypted exports, to time decryption")
+    parser.add_argument("--benchmarks", nargs="+", default=BENCHMARKS, choices=BENCHMARKS, metavar="BENCHMARK",
+                        help=f"Benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each benchmark, the fastest is kept (default: 3)")
+    parser.add_argument("--output", default=DEFAULT_RESULTS, help="JSON-lines file the results are appended to")
+    args = parser.parse_args(argv)
+
+    run = {"time": datetime.now().isoformat(timespec="seconds"), "commit": git_commit()}
+    with open(args.output, "a", encoding="utf-8") as f:
+        for size in args.sizes:
+            for record in run_size(size, args.data, args.benchmarks, args.password, args.repeat):
+                f.write(json.dumps({**run, "size": size, **record}) + "\n")
+    print(f"Appended the results to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import hashlib
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+from schema import restore_strings
+
+# Where cleaned views are kept between uploads and server restarts
+CACHE_DIR = os.environ.get(
+    "FOODBANK_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "datasets")
+)
+# Total size the cache may grow to before the least recently used files are evicted
+CACHE_MAX_BYTES = int(os.environ.get("FOODBANK_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+# Modules whose source decides what a cleaned view looks like, including the readers that decide which
+# cells reach the cleaning code
+CLEANING_MODULES = [
+    "dbclean.py", "dbclean_1.py", "identity.py", "ingest.py", "pipeline.py", "schema.py", "streaming.py",
+    "xlsx_reader.py",
+]
+
+
+def cleaning_version() -> str:
+    """
+    Return a short hash of the cleaning code, so cached views are rebuilt when it changes
+    """
+    digest = hashlib.sha256()
+    root = os.path.dirname(os.path.abspath(__file__))
+    for module in CLEANING_MODULES:
+        with open(os.path.join(root, module), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def parquet_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return the frame with object columns that mix text with numbers or dates stored as text, which Parquet can hold
+
+    Missing values stay missing. Columns holding a single kind of value are left as they are.
+    """
+    mixed = [
+        column for column in df.columns[df.dtypes == object]
+        if pd.api.types.infer_dtype(df[column], skipna=True) in ("mixed", "mixed-integer")
+    ]
+    if not mixed:
+        return df
+    return df.assign(**{column: df[column].where(df[column].isna(), df[column].astype(str)) for column in mixed})
+
+
+class DatasetCache:
+    """
+    Size-bounded on-disk cache of cleaned views, stored as Parquet files.
+
+    Files are named after the workbook hash, the cleaning code version and the view,
+    and the least recently used ones are evicted once the directory outgrows max_bytes.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = cleaning_version()
+
+    def path(self, key: str, name: str) -> str:
+        return os.path.join(self.directory, f"{key}-{self.version}-{name}.parquet")
+
+    def get(self, key: str, name: str) -> pd.DataFrame:
+        """
+        Return the cached view, or None if it has not been cached for this workbook and code version
+        """
+        path = self.path(key, name)
+        try:
+            df = pd.read_parquet(path)
+        except (OSError, pa.ArrowException):
+            return None
+        # Touch the file so eviction sees it as recently used
+        os.utime(path)
+        return restore_strings(df)
+
+    def put(self, key: str, name: str, df: pd.DataFrame) -> bool:
+        """
+        Write the view to the cache and evict old entries
+
+        Returns:
+            bool: True if the view was cached
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key, name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            df.to_parquet(tmp_path)
+            os.replace(tmp_path, path)
+        except (OSError, ValueError, TypeError, pa.ArrowException):
+            # Columns pyarrow cannot represent are left uncached rather than failing the upload
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+        self.evict()
+        return True
+
+    def entries(self) -> list[os.DirEntry]:
+        if not os.path.isdir(self.directory):
+            return []
+        return [entry for entry in os.scandir(self.directory) if entry.name.endswith(".parquet")]
+
+    def evict(self):
+        """
+        Remove the least recently used files until the cache fits in max_bytes
+        """
+        entries = sorted(self.entries(), key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            total -= entry.stat().st_size
+            os.remove(entry.path)
+
+    def invalidate(self, key: str = None):
+        """
+        Remove the cached views of one workbook, or of every workbook if key is None
+        """
+        for entry in self.entries():
+            if key is None or entry.name.startswith(f"{key}-"):
+                os.remove(entry.path)
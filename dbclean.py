@@ -1,63 +1,72 @@
 import pandas as pd
-import numpy as np
 
-def clean_data(df: pd.DataFrame) -> pd.DataFrame:
+from dbclean_1 import clean_base
+from schema import calendar_columns
+
+# Raw columns the geographical view does not use
+GEO_DROPPED_COLUMNS = [
+    "Voucher code", "Date issued to client", "Signposted date",
+    "Red", "Emergency food box", "Printable", "Crisis cause", "Crisis sub cause", "Crisis cause description", "Parcel days",
+    "Source of income", "Reasons for referral", "Birth year", "Agency", "Issued by",
+    "Consent for contacting about delivery or collection", "Secondary crisis: Benefit changes",
+    "Secondary crisis: Benefit delays", "Secondary crisis: Low income",
+    "Secondary crisis: Refused short term benefit advance", "Secondary crisis: Delayed wages",
+    "Secondary crisis: Debt", "Secondary crisis: Homeless", "Secondary crisis: No recourse to public funds",
+    "Secondary crisis: Domestic abuse", "Secondary crisis: Sickness/ill health", "Secondary crisis: Child holiday meals",
+    "Secondary crisis: Other", "Partner or spouse (usual household structure)", "Parent or carer (usual household structure)",
+    "Partner or spouse (number of people the voucher is for)", "Parent or carer (number of people the voucher is for)",
+    "Client email address", "Client phone number", "Dietary requirements", "Client ID",
+    "Reasons for referral - notes", "Agency contact phone",
+    "Notes regarding parcel requirements", "Collection/Delivery notes",
+    "Reason for needing more than 3 vouchers in the last 6 months",
+    "Reason for needing more than 3 vouchers in the last 6 months - notes",
+    "Collection/Delivery notes", "Consent for holding information about dietary requirements",
+    "The usual household structure pre 4th April 2023: Children (0 - 4 yrs)",
+    "The usual household structure pre 4th April 2023: Children (5 - 11 yrs)",
+    "The usual household structure pre 4th April 2023: Children (12 - 16 yrs)",
+    "The usual household structure pre 4th April 2023: Children (unknown age)",
+    "The usual household structure pre 4th April 2023: Adults (17 - 24 yrs)",
+    "The usual household structure pre 4th April 2023: Adults (25 - 64 yrs)",
+    "The usual household structure pre 4th April 2023: Adults (Over 65 yrs)",
+    "The usual household structure pre 4th April 2023: Adults (unknown age)",
+    "Number of people the voucher is for pre 4th April 2023: Children (0 - 4 yrs)",
+    "Number of people the voucher is for pre 4th April 2023: Children (5 - 11 yrs)",
+    "Number of people the voucher is for pre 4th April 2023: Children (12 - 16 yrs)",
+    "Number of people the voucher is for pre 4th April 2023: Children (unknown age)",
+    "Number of people the voucher is for pre 4th April 2023: Adults (17 - 24 yrs)",
+    "Number of people the voucher is for pre 4th April 2023: Adults (25 - 64 yrs)",
+    "Number of people the voucher is for pre 4th April 2023: Adults (Over 65 yrs)",
+    "Number of people the voucher is for pre 4th April 2023: Adults (unknown age)",
+    "Number of people the voucher is for: Children (0 - 4 yrs)",
+    "Number of people the voucher is for: Children (5 - 11 yrs)",
+    "Number of people the voucher is for: Children (12 - 16 yrs)",
+    "Number of people the voucher is for: Children (not specified)",
+    "Number of people the voucher is for: Adults (17 - 24 yrs)",
+    "Number of people the voucher is for: Adults (25 - 34 yrs)",
+    "Number of people the voucher is for: Adults (35 - 44 yrs)",
+    "Number of people the voucher is for: Adults (45 - 54 yrs)",
+    "Number of people the voucher is for: Adults (55 - 64 yrs)",
+    "Number of people the voucher is for: Adults (65 - 74 yrs)",
+    "Number of people the voucher is for: Adults (75+ yrs)",
+    "Number of people the voucher is for: Adults (not specified)",
+    "Foodbank centre fulfilled at"
+]
+
+
+def clean_geo(base: pd.DataFrame) -> pd.DataFrame:
     """
-    Cleans the data from the specified CSV file.
+    Builds the geographical view from the cleaned base: household size, merged age bands and the household size filter.
 
     Parameters:
-        df (pd.DataFrame): The raw DataFrame.
+        base (pd.DataFrame): The output of dbclean_1.clean_base, left unchanged.
     Returns:
         pd.DataFrame: The cleaned DataFrame.
     """
     # Drop the specified columns
-    cleaned_df = df.drop([
-        "Voucher code", "Date issued to client", "Signposted date",
-        "Red", "Emergency food box", "Printable", "Crisis cause", "Crisis sub cause", "Crisis cause description", "Parcel days",
-        "Source of income", "Reasons for referral", "Birth year", "Agency", "Issued by",
-        "Consent for contacting about delivery or collection", "Secondary crisis: Benefit changes",
-        "Secondary crisis: Benefit delays", "Secondary crisis: Low income",
-        "Secondary crisis: Refused short term benefit advance", "Secondary crisis: Delayed wages",
-        "Secondary crisis: Debt", "Secondary crisis: Homeless", "Secondary crisis: No recourse to public funds",
-        "Secondary crisis: Domestic abuse", "Secondary crisis: Sickness/ill health", "Secondary crisis: Child holiday meals",
-        "Secondary crisis: Other", "Partner or spouse (usual household structure)", "Parent or carer (usual household structure)",
-        "Partner or spouse (number of people the voucher is for)", "Parent or carer (number of people the voucher is for)",
-        "Client email address", "Client phone number", "Dietary requirements", "Client ID",
-        "Reasons for referral - notes", "Agency contact phone",
-        "Notes regarding parcel requirements", "Collection/Delivery notes",
-        "Reason for needing more than 3 vouchers in the last 6 months",
-        "Reason for needing more than 3 vouchers in the last 6 months - notes",
-        "Collection/Delivery notes", "Consent for holding information about dietary requirements",
-        "The usual household structure pre 4th April 2023: Children (0 - 4 yrs)",
-        "The usual household structure pre 4th April 2023: Children (5 - 11 yrs)",
-        "The usual household structure pre 4th April 2023: Children (12 - 16 yrs)",
-        "The usual household structure pre 4th April 2023: Children (unknown age)",
-        "The usual household structure pre 4th April 2023: Adults (17 - 24 yrs)",
-        "The usual household structure pre 4th April 2023: Adults (25 - 64 yrs)",
-        "The usual household structure pre 4th April 2023: Adults (Over 65 yrs)",
-        "The usual household structure pre 4th April 2023: Adults (unknown age)",
-        "Number of people the voucher is for pre 4th April 2023: Children (0 - 4 yrs)",
-        "Number of people the voucher is for pre 4th April 2023: Children (5 - 11 yrs)",
-        "Number of people the voucher is for pre 4th April 2023: Children (12 - 16 yrs)",
-        "Number of people the voucher is for pre 4th April 2023: Children (unknown age)",
-        "Number of people the voucher is for pre 4th April 2023: Adults (17 - 24 yrs)",
-        "Number of people the voucher is for pre 4th April 2023: Adults (25 - 64 yrs)",
-        "Number of people the voucher is for pre 4th April 2023: Adults (Over 65 yrs)",
-        "Number of people the voucher is for pre 4th April 2023: Adults (unknown age)",
-        "Number of people the voucher is for: Children (0 - 4 yrs)",
-        "Number of people the voucher is for: Children (5 - 11 yrs)",
-        "Number of people the voucher is for: Children (12 - 16 yrs)",
-        "Number of people the voucher is for: Children (not specified)",
-        "Number of people the voucher is for: Adults (17 - 24 yrs)",
-        "Number of people the voucher is for: Adults (25 - 34 yrs)",
-        "Number of people the voucher is for: Adults (35 - 44 yrs)",
-        "Number of people the voucher is for: Adults (45 - 54 yrs)",
-        "Number of people the voucher is for: Adults (55 - 64 yrs)",
-        "Number of people the voucher is for: Adults (65 - 74 yrs)",
-        "Number of people the voucher is for: Adults (75+ yrs)",
-        "Number of people the voucher is for: Adults (not specified)",
-        "Foodbank centre fulfilled at"
-    ], axis=1)
+    cleaned_df = base.drop(GEO_DROPPED_COLUMNS, axis=1, errors="ignore")
+
+    # Vouchers without a crisis type are left out of the geographical analysis
+    cleaned_df = cleaned_df.dropna(subset=["Crisis type"])
 
     # Sum specified columns to create the Household size column
     cleaned_df["Household_size"] = cleaned_df[
@@ -105,36 +114,25 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
         "75+"
     ], axis=1, inplace=True)
 
-    # Drop duplicates
+    # Drop vouchers that only differed in the dropped columns
     cleaned_df.drop_duplicates(inplace=True)
 
-    # Replace empty strings with nan
-    cleaned_df.replace("", np.nan, inplace=True)
-
-    # Remove commas from all string values
-    cleaned_df.replace({",": ""}, regex=True)
-
-    # Remove leading and trailing whitespace from specified columns
-    columns_to_strip = ["First name", "Last name", "Address1", "Address2", "Town", "County"]
-    for column in columns_to_strip:
-        cleaned_df[column] = cleaned_df[column].str.strip()
-
-    # Additional cleaning for the "Town" column
-    cleaned_df["Town"] = cleaned_df["Town"].str.rstrip(".")
+    # Convert all column headers to lowercase
+    cleaned_df.columns = cleaned_df.columns.str.lower()
 
-    # Additional cleaning for the "Crisis type" column
-    cleaned_df = cleaned_df.dropna(subset=["Crisis type"])
+    # Integer calendar columns of the creation date, for the monthly and historical charts
+    cleaned_df = cleaned_df.assign(**calendar_columns(cleaned_df["created at"]))
 
-    # Standardize county names
-    cleaned_df["County"] = cleaned_df["County"].replace(
-        ["Glos", "Glos.", "Glouces", "Glouchester", "GloucestershirG", "Gloucestershrie", "Gloucetershire", "Gloucs", "Glouctestershire"],
-        "Gloucestershire"
-    )
+    return cleaned_df
 
-    # Remove postcodes from the "County" column (if applicable)
-    cleaned_df["County"] = cleaned_df["County"].str.replace(r"\s?[A-Z]{1,2}\d{1,2}\s?\d[A-Z]{2}", "", regex=True)
 
-    # Convert all column headers to lowercase
-    cleaned_df.columns = cleaned_df.columns.str.lower()
+def clean_data(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cleans the data from the specified CSV file.
 
-    return cleaned_df
+    Parameters:
+        df (pd.DataFrame): The raw DataFrame.
+    Returns:
+        pd.DataFrame: The cleaned DataFrame.
+    """
+    return clean_geo(clean_base(df))
@@ -2,14 +2,121 @@ import pandas as pd
 import numpy as np
 import re
 
-def clean_data(df: pd.DataFrame) -> pd.DataFrame:
+from journey import ClientIndex
+from profiler import step
+from schema import SECONDARY_CRISIS_BITS, SECONDARY_CRISIS_COLUMNS, apply_schema, calendar_columns
+
+# Misspellings of Gloucestershire seen in the County column
+GLOUCESTERSHIRE_SPELLINGS = {
+    'Gl', "Gloucester", "Glos", "Glos.", "Glouces", "Glouchester", "GloucestershirG", "Gloucestershrie",
+    "Gloucestershirg", "Gloustershire", "Gloucetershire", "Gloucs", "Glouctestershire",
+}
+# Postcodes typed into the County column
+POSTCODE_PATTERN = re.compile(r'\s?[A-Z]{1,2}\d{1,2}\s?\d[A-Z]{2}')
+# Patterns for standardizing county names, checked in order against the lower case county
+COUNTY_PATTERNS = [
+    (re.compile(r'glou.*'), 'Gloucestershire'),  # Match any variations of Gloucestershire
+    (re.compile(r'gl\d*'), 'Gloucestershire'),
+    (re.compile(r'wilt.*'), 'Wiltshire'),        # Match any variations of Wiltshire
+    (re.compile(r'oxon.*'), 'Oxfordshire'),      # Match any variations of Oxfordshire
+    (re.compile(r'cots.*'), 'Cotswolds'),        # Match any variations of Cotswolds
+    (re.compile(r'swindon.*'), 'Swindon'),       # Match any variations of Swindon
+    (re.compile(r'sn\d*'), 'Swindon'),
+    (re.compile(r'norfolk.*'), 'Norfolk'),       # Match any variations of Norfolk
+]
+
+
+def clean_town_name(town):
     """
-    Cleans the data from pd dataframe.
+    Strip, capitalise and remove trailing full stops from one town value, non-text values become NaN
+    """
+    if not isinstance(town, str):
+        return np.nan
+    return town.strip().title().rstrip('.')
+
+
+def clean_county_name(county):
+    """
+    Standardise one county value, missing values become 'Unknown'
+    """
+    if not isinstance(county, str):
+        return 'Unknown'
+    county = county.strip().title()
+    if county in GLOUCESTERSHIRE_SPELLINGS:
+        county = 'Gloucestershire'
+    # Remove postcodes from the county (if applicable)
+    county_str = POSTCODE_PATTERN.sub('', county).strip().lower()
+
+    # Check each pattern to find matches
+    for pattern, replacement in COUNTY_PATTERNS:
+        if pattern.match(county_str):
+            return replacement
+
+    # If no pattern matched, return the county with proper capitalization
+    return county_str.capitalize()
+
+
+# Text layouts tried in order for dates not already read from date cells; day first, as in UK exports
+DATE_FORMATS = ["ISO8601", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y"]
+
+
+def parse_dates(column: pd.Series) -> pd.Series:
+    """
+    Parse a date column with the explicit DATE_FORMATS, leaving columns that are already datetime untouched
+
+    Values matching none of the formats become NaT.
+    """
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column
+    parsed = pd.to_datetime(column, errors='coerce', format=DATE_FORMATS[0])
+    for date_format in DATE_FORMATS[1:]:
+        unparsed = parsed.isna() & column.notna()
+        if not unparsed.any():
+            break
+        parsed[unparsed] = pd.to_datetime(column[unparsed], errors='coerce', format=date_format)
+    return parsed
+
+
+def normalise_distinct(column: pd.Series, normalise) -> pd.Series:
+    """
+    Apply a per-value function to each distinct value of a column and map the results back to every row
+
+    Parameters:
+        column (pd.Series): The column to normalise
+        normalise: Function taking one value, also called once with NaN for missing values
+    Returns:
+        pd.Series: The normalised column, as object dtype
+    """
+    codes, uniques = pd.factorize(column)
+    # Missing values have code -1, which picks the result for NaN appended last
+    results = np.array([normalise(value) for value in uniques] + [normalise(np.nan)], dtype=object)
+    return pd.Series(results[codes], index=column.index, name=column.name)
+
+
+def pack_flags(df: pd.DataFrame, columns: list) -> np.ndarray:
+    """
+    Pack yes/no columns into the bits of one integer per row, the first column in the lowest bit
+
+    Parameters:
+        df (pd.DataFrame): The frame holding the columns
+        columns (list): Up to 16 flag columns, a value equal to 1 (or True) sets the bit
+    Returns:
+        np.ndarray: The packed flags, as uint16
+    """
+    bits = np.zeros(len(df), dtype=np.uint16)
+    for bit, column in enumerate(columns):
+        bits |= df[column].eq(1).fillna(False).to_numpy(dtype=bool).astype(np.uint16) << bit
+    return bits
+
+
+def clean_base(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cleans the columns shared by every view: duplicates, blanks, dates, names, addresses, town and county.
 
     Parameters:
         df (pd.DataFrame): The raw DataFrame.
     Returns:
-        pd.DataFrame: The cleaned DataFrame.
+        pd.DataFrame: The cleaned base, with the original column names.
     """
     
     # Drop the specified columns
@@ -19,7 +126,7 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
         "Reasons for referral - notes", "Agency contact phone",
         "Notes regarding parcel requirements", "Collection/Delivery notes",
         "Reason for needing more than 3 vouchers in the last 6 months - notes"
-    ], axis=1)
+    ], axis=1, errors="ignore")
     # cleaned_df = df[[
     #     "Client ID", "Created at", "Date issued to client", "Fulfilled date",
     #     "First name", "Last name", "County","Crisis type", "Crisis cause", "Crisis sub cause", "Crisis cause description", "Was Covid-19 a contributing factor?",
@@ -65,27 +172,22 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
     # Clean data for crisis type 
     
     # Drop duplicates
-    cleaned_df.drop_duplicates(inplace=True)
+    with step("drop_duplicates", cleaned_df) as record:
+        cleaned_df.drop_duplicates(inplace=True)
+        record["rows_out"] = len(cleaned_df)
 
     # Replace empty strings with nan
     cleaned_df.replace("", np.nan, inplace=True)
 
-    # Remove commas from all string values
-    cleaned_df.replace({",": ""}, regex=True)
-
-    # Remove leading and trailing whitespace from specified columns
-    columns_to_strip = ["First name", "Last name"]
-    for column in columns_to_strip:
-        cleaned_df[column] = cleaned_df[column].str.strip()
-    
-    # Convert necessary date columns to datetime, handling errors
+    # Convert necessary date columns to datetime once, every view and chart reuses them
     date_columns = ["Created at", "Date issued to client", "Fulfilled date"]
-    for col in date_columns:
-        cleaned_df[col] = pd.to_datetime(cleaned_df[col], errors='coerce')
+    with step("to_datetime", cleaned_df):
+        for col in date_columns:
+            cleaned_df[col] = parse_dates(cleaned_df[col])
         
         
     # Remove leading and trailing whitespace from specified columns
-    columns_to_strip = ["First name", "Last name", "Address1", "Address2", "Town", "County"]
+    columns_to_strip = ["First name", "Last name", "Address1", "Address2"]
     for column in columns_to_strip:
         cleaned_df[column] = cleaned_df[column].str.strip()
 
@@ -93,49 +195,26 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
     for column in columns_to_strip + ["Issued by"]:
         cleaned_df[column] = cleaned_df[column].str.title()
 
-    # Additional cleaning for the "Town" column
-    cleaned_df["Town"] = cleaned_df["Town"].str.rstrip('.')
+    # Standardize town and county names, once per distinct spelling rather than once per row
+    with step("town and county", cleaned_df):
+        cleaned_df["Town"] = normalise_distinct(cleaned_df["Town"], clean_town_name)
+        cleaned_df['County'] = normalise_distinct(cleaned_df['County'], clean_county_name)
 
-    # Standardize county names
-    cleaned_df["County"] = cleaned_df["County"].replace(
-        ['Gl',"Gloucester","Glos", "Glos.", "Glouces", "Glouchester", "GloucestershirG", "Gloucestershrie","Gloucestershirg","Gloustershire","Gloucetershire", "Gloucs", "Glouctestershire"],
-        'Gloucestershire'
-    )
+    return cleaned_df
 
-    # Remove postcodes from the "County" column (if applicable)
-    cleaned_df["County"] = cleaned_df["County"].str.replace(r'\s?[A-Z]{1,2}\d{1,2}\s?\d[A-Z]{2}', '', regex=True)
-    
-    def clean_county_name(county):
-        # Check if the county value is NaN
-        if pd.isna(county):
-            return 'Unknown'
-        
-        # Ensure the county is treated as a string and strip whitespace
-        county_str = county.strip().lower()
-        # Define patterns for standardizing county names
-        patterns = {
-            r'glou.*': 'Gloucestershire',  # Match any variations of Gloucestershire
-            r'gl\d*': 'Gloucestershire',
-            r'wilt.*': 'Wiltshire',        # Match any variations of Wiltshire
-            r'oxon.*': 'Oxfordshire',       # Match any variations of Oxfordshire
-            r'cots.*': 'Cotswolds',         # Match any variations of Cotswolds
-            r'swindon.*': 'Swindon',        # Match any variations of Swindon
-            r'sn\d*': 'Swindon',
-            r'norfolk.*': 'Norfolk'         # Match any variations of Norfolk
-        }
-
-        # Check each pattern to find matches
-        for pattern, replacement in patterns.items():
-            if re.match(pattern, county_str):
-                return replacement
-        
-        # If no pattern matched, return the county with proper capitalization
-        return county_str.capitalize()
 
-    # Apply the cleaning function correctly
-    cleaned_df['County'] = cleaned_df['County'].apply(clean_county_name)
-    
-        
+def clean_voucher(base: pd.DataFrame) -> pd.DataFrame:
+    """
+    Builds the voucher view used by the crisis and client journey pages from the cleaned base.
+
+    Parameters:
+        base (pd.DataFrame): The output of clean_base, left unchanged.
+    Returns:
+        pd.DataFrame: The cleaned DataFrame.
+    """
+    # Columns are replaced rather than written in place, so a shallow copy keeps the base intact
+    cleaned_df = base.copy(deep=False)
+
     cleaned_df["Crisis type"] = cleaned_df["Crisis type"].fillna("Unknown")
     
     cols_to_check = ['Number of people the voucher is for pre 4th April 2023: Children (0 - 4 yrs)', 
@@ -159,103 +238,151 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
                      'Number of people the voucher is for: Adults (75+ yrs)', 
                      'Number of people the voucher is for: Adults (not specified)']
     
-    # Check for NaN values before filling
+    # Convert numerical columns to numeric, missing counts become 0 and text that is not a number stays missing
     for col in cols_to_check:
-        cleaned_df[col] = cleaned_df[col].fillna(0)
-
-    # Convert numerical columns to numeric
-    for col in cols_to_check:
-        cleaned_df[col] = pd.to_numeric(cleaned_df[col], errors='coerce')
+        missing = cleaned_df[col].isna()
+        cleaned_df[col] = pd.to_numeric(cleaned_df[col], errors='coerce').mask(missing, 0)
         
     # Create Month-Year column for time-based analysis
     cleaned_df["Month-Year"] = cleaned_df["Date issued to client"].dt.to_period("M")
     
     cleaned_df.columns = cleaned_df.columns.str.lower()
+
+    # Integer calendar columns of the issue date, for grouping by day, week or month
+    cleaned_df = cleaned_df.assign(**calendar_columns(cleaned_df["date issued to client"]))
+
+    # Pack the secondary crisis flags into one small integer, so counting them is a bit operation
+    cleaned_df[SECONDARY_CRISIS_BITS] = pack_flags(cleaned_df, SECONDARY_CRISIS_COLUMNS)
     
+    # Store low-cardinality text as categories and flags/counts in small nullable types
+    cleaned_df = apply_schema(cleaned_df)
 
     return cleaned_df
 
+
+def clean_data(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cleans the data from pd dataframe.
+
+    Parameters:
+        df (pd.DataFrame): The raw DataFrame.
+    Returns:
+        pd.DataFrame: The cleaned DataFrame.
+    """
+    return clean_voucher(clean_base(df))
+
+# Separator of the reasons in the comma-joined "reasons for referral" field
+REASON_SEPARATOR = ", "
+
+
+def split_reasons(values) -> tuple[list, np.ndarray]:
+    """
+    Split distinct "reasons for referral" values into the reasons they name
+
+    Parameters:
+        values: Distinct values of the field, without missing ones
+    Returns:
+        tuple: The reasons in order of first appearance, and a boolean matrix with one row
+        per value and one column per reason
+    """
+    split = [str(value).split(REASON_SEPARATOR) for value in values]
+    vocabulary = list(dict.fromkeys(reason for reasons in split for reason in reasons))
+    position = {reason: i for i, reason in enumerate(vocabulary)}
+    membership = np.zeros((len(split), len(vocabulary)), dtype=bool)
+    for row, reasons in enumerate(split):
+        membership[row, [position[reason] for reason in reasons]] = True
+    return vocabulary, membership
+
+
 def values_in_reasons_for_referral(df:pd.DataFrame) -> list: 
-    df_values = df["reasons for referral"].dropna().unique()
-    values = []
-    for v in df_values:
-        v_list = v.split(", ")
-        for x in v_list:
-            if x not in values:
-                values.append(x)
-    return values
+    """
+    Return every reason named in "reasons for referral", in order of first appearance
+    """
+    return split_reasons(df["reasons for referral"].dropna().unique())[0]
+
+
+def reason_counts(values, counts) -> pd.DataFrame:
+    """
+    Count the vouchers naming each reason, most named first
+
+    Each distinct field value is split once, so the vouchers of a value count towards
+    every reason it names with one matrix product.
+
+    Parameters:
+        values: Distinct "reasons for referral" values, in order of first appearance
+        counts: The number of vouchers of each value
+    Returns:
+        pd.DataFrame: "reason" and "voucher count", reasons named equally often in order of first appearance
+    """
+    vocabulary, membership = split_reasons(values)
+    per_reason = pd.Series(np.asarray(counts, dtype="int64") @ membership, index=vocabulary, dtype="int64")
+    per_reason = per_reason.sort_values(ascending=False, kind="stable")
+    return pd.DataFrame({"reason": per_reason.index, "voucher count": per_reason.to_numpy(dtype="int64")})
+
+
+def voucher_gaps(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return the vouchers that have a client id, sorted by client and issue date, with the days since the client's previous voucher
+
+    Parameters:
+        df (pd.DataFrame): Vouchers with at least "client id" and "date issued to client"
+    Returns:
+        pd.DataFrame: The same columns plus "gap", which is NaN on each client's first voucher
+    """
+    date = "date issued to client"
+    vouchers = df.dropna(subset=["client id"]).sort_values(["client id", date], kind="stable")
+    client = vouchers["client id"].to_numpy()
+    gaps = vouchers[date].diff().dt.days.to_numpy(dtype="float64")
+    # The first voucher of each client has no gap before it
+    if len(gaps):
+        gaps[np.r_[True, client[1:] != client[:-1]]] = np.nan
+    return vouchers.assign(gap=gaps)
+
+
+def client_summary(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Summarise each client's return pattern, one row per client id
+
+    Vouchers are sorted by client and issue date once, so the gaps between a client's
+    vouchers are a single diff over the sorted dates.
+
+    Parameters:
+        df (pd.DataFrame): The voucher view
+    Returns:
+        pd.DataFrame: "client id", "first visit", "last visit", "voucher count", "median gap days",
+        "max gap days", "crisis types" and "centres", in client id order. Clients with a single
+        voucher have no gap.
+    """
+    date = "date issued to client"
+    vouchers = voucher_gaps(df[["client id", date, "crisis type", "foodbank centre fulfilled at"]])
+    summary = vouchers.groupby("client id", sort=True).agg(**{
+        "first visit": (date, "min"),
+        "last visit": (date, "max"),
+        "voucher count": (date, "size"),
+        "median gap days": ("gap", "median"),
+        "max gap days": ("gap", "max"),
+        "crisis types": ("crisis type", "nunique"),
+        "centres": ("foodbank centre fulfilled at", "nunique"),
+    })
+    return summary.reset_index()
 
 
 def individual_journey_filter(df: pd.DataFrame, min_voucher:int=None, max_voucher:int=None, start_date:int=None, end_date:int=None)-> tuple[pd.DataFrame, bool]:
     """
     Filter the data for individual client journey
 
+    Builds a one-off journey.ClientIndex over the frame; the dashboard keeps one index per
+    dataset instead, so repeated filtering does not regroup the vouchers.
+
     Parameters:
-        df (pd.DataFrame): The cleaned DataFrame.
+        df (pd.DataFrame): The cleaned DataFrame, left unchanged.
         min_voucher(int): the min number of voucher for filtering
+        max_voucher(int): the max number of voucher for filtering
+        start_date: the first issue date to include
+        end_date: the last issue date to include
     Returns:
         pd.DataFrame: The formatted DataFrame for indiviual client journey
         
         bool: True if there is a result found, else False
     """
-    
-    # Define column names in lowercase to match the column names in the DataFrame
-    DATE_COL = "Date issued to client".lower()
-    ISSUE_BY_COL = "Issued by".lower()
-    
-    # Convert date column to datetime format if it's not already
-    df[DATE_COL] = pd.to_datetime(df[DATE_COL])
-    
-    # Filter rows within the specified date period
-    if start_date:
-        df = df[df[DATE_COL] >= pd.to_datetime(start_date)]
-    if end_date:
-        df = df[df[DATE_COL] <= pd.to_datetime(end_date)]
-
-    grouped = None
-    # Group by 'client id', 'first name', and 'last name', and collect dates and issued by values per client
-    grouped = df.groupby(['client id', 'first name', 'last name']).apply(
-        lambda x: pd.Series({
-            DATE_COL: list(x[DATE_COL]),
-            ISSUE_BY_COL: list(x[ISSUE_BY_COL])
-        })
-    ).reset_index(drop=False)  # Do not drop columns from the original DataFrame
-    
-    # Apply min_rows and max_rows filters
-    grouped['Voucher Count'] = grouped[DATE_COL].apply(len)
-    if min_voucher:
-        grouped = grouped[grouped['Voucher Count'] >= min_voucher]
-    if max_voucher:
-        grouped = grouped[grouped['Voucher Count'] <= max_voucher]
-        
-    if grouped.shape[0] == 0:
-        return None, False
-    
-    # Expand the dates and apply "Not fulfilled" if voucher status is not "Fulfilled"
-    max_dates = grouped['Voucher Count'].max()
-    date_columns = {
-        f'Voucher Detail {i+1} (Issue Date - Issued by)': grouped.apply(
-            lambda row: (
-                f"{row[DATE_COL][i].strftime('%Y-%m-%d')} - {row[ISSUE_BY_COL][i]}"
-            ) if i < len(row[DATE_COL]) else None,
-            axis=1
-        )
-        for i in range(max_dates)
-    }
-    
-    # Determine the latest date for sorting
-    grouped['latest_date'] = grouped[DATE_COL].apply(lambda x: max(x) if x else None)
-    grouped['latest_date'] = grouped['latest_date'].dt.strftime('%Y-%m-%d')
-    
-    grouped = grouped.rename(columns={
-        'client id': 'Client ID',
-        'first name': 'First Name',
-        'last name': 'Last Name',
-        'latest_date': 'Latest Issue Date'
-    })
-    
-    # Create the final DataFrame with client names, count, and individual date columns
-    result_df = pd.concat([grouped[['Client ID', 'First Name', 'Last Name', 'Voucher Count', 'Latest Issue Date']], pd.DataFrame(date_columns)], axis=1)
-    
-    return result_df.reset_index().drop("index", axis=1), True
-
+    return ClientIndex(df).journey(min_voucher, max_voucher, start_date, end_date)
@@ -0,0 +1,282 @@
+import re
+from collections import Counter
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from profiler import step
+
+# Columns that say who a voucher was for and where they live, the same in the voucher and geo views
+IDENTITY_COLUMNS = ["first name", "last name", "address1", "address2", "postcode"]
+HOUSEHOLD_ID = "household id"
+# Vouchers of the same client are always one household, whatever their names and addresses say
+CLIENT_ID = "client id"
+
+# Least similarity (0 to 1) of two addresses in the same postcode for them to be one household
+ADDRESS_SIMILARITY = 0.85
+# Least similarity of both first and last names for two records in the same postcode to be one person,
+# whose addresses then only need to be roughly alike (or missing) to be one household
+NAME_SIMILARITY = 0.8
+NAME_ADDRESS_SIMILARITY = 0.6
+# Records are only compared with this many neighbours in their block, so a crowded postcode stays linear
+BLOCK_WINDOW = 20
+
+# Street words typed both ways in the Address1 and Address2 columns
+ADDRESS_ABBREVIATIONS = {
+    "rd": "road", "st": "street", "ave": "avenue", "av": "avenue", "ln": "lane", "cl": "close", "ct": "court",
+    "cres": "crescent", "dr": "drive", "gdns": "gardens", "gr": "grove", "pl": "place", "sq": "square",
+    "tce": "terrace", "ter": "terrace", "hse": "house", "apt": "flat",
+}
+NON_ALPHANUMERIC = re.compile(r"[^a-z0-9]+")
+NUMBERS = re.compile(r"\d+")
+# Soundex digits, vowels separate repeated digits and h and w are dropped
+SOUNDEX_DIGITS = str.maketrans("aeiouybfpvcgjkqsxzdtlmnr", "000000111122222222334556", "hw")
+
+
+def normalise_address(address: str) -> str:
+    """
+    Return an address in lower case words, without punctuation and with street abbreviations spelt out
+    """
+    words = NON_ALPHANUMERIC.sub(" ", str(address).lower()).split()
+    return " ".join(ADDRESS_ABBREVIATIONS.get(word, word) for word in words)
+
+
+def soundex(name: str) -> str:
+    """
+    Return the Soundex key of a name (e.g. "Smith" and "Smyth" are both "S530"), "" without letters
+    """
+    letters = "".join(letter for letter in str(name).lower() if "a" <= letter <= "z")
+    if not letters:
+        return ""
+    digits = letters.translate(SOUNDEX_DIGITS)
+    collapsed = [digit for i, digit in enumerate(digits) if i == 0 or digit != digits[i - 1]]
+    return (letters[0].upper() + "".join(digit for digit in collapsed[1:] if digit != "0") + "000")[:4]
+
+
+@lru_cache(maxsize=100_000)
+def similarity(a: str, b: str) -> float:
+    """
+    Return how alike two strings are, from 0 to 1, remembering recent pairs since names repeat a lot
+    """
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def numbers_compatible(a: str, b: str) -> bool:
+    """
+    Return True if two addresses' house and flat numbers agree, a missing number agreeing with any
+
+    The numbers are space separated, in address order. "17" and "17 8" agree (the flat
+    number was left blank on one voucher), "17 8" and "17 9" do not.
+    """
+    if a == b:
+        return True
+    shorter, longer = sorted((a.split(), b.split()), key=len)
+    return Counter(shorter) <= Counter(longer)
+
+
+def numbers_agree(numbers: np.ndarray, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """
+    Return numbers_compatible of each pair of records, checking each distinct pair of numbers once
+    """
+    codes, values = pd.factorize(numbers)
+    pair = codes[left].astype(np.int64) * len(values) + codes[right]
+    distinct, inverse = np.unique(pair, return_inverse=True)
+    agree = np.array([
+        numbers_compatible(values[p // len(values)], values[p % len(values)]) for p in distinct
+    ], dtype=bool)
+    return agree[inverse]
+
+
+def block_pairs(block: np.ndarray, order_by: np.ndarray, window: int = BLOCK_WINDOW) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the candidate pairs of records that share a block
+
+    Records are sorted by block and then by `order_by`, and each is paired with at most
+    `window` records after it in its block, so the pairs grow linearly with the records.
+
+    Parameters:
+        block (np.ndarray): Integer block of each record, -1 for records not to pair
+        order_by (np.ndarray): Sort key within a block, so likely matches sit next to each other
+        window (int): Most records after each record to pair it with
+    Returns:
+        tuple: The left and right record of each pair
+    """
+    order = np.lexsort((order_by, block))
+    order = order[block[order] >= 0]
+    sorted_block = block[order]
+    left, right = [], []
+    for offset in range(1, window + 1):
+        same = sorted_block[offset:] == sorted_block[:-offset]
+        if not same.any():
+            break
+        left.append(order[:-offset][same])
+        right.append(order[offset:][same])
+    if not left:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    return np.concatenate(left), np.concatenate(right)
+
+
+def connected_components(n: int, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """
+    Return the component of each of n records linked by the pairs, labelled by its smallest record
+    """
+    labels = np.arange(n)
+    while True:
+        # Both ends of each link take the smaller label, then labels jump to their label's label
+        low = np.minimum(labels[left], labels[right])
+        np.minimum.at(labels, left, low)
+        np.minimum.at(labels, right, low)
+        labels = labels[labels]
+        if np.array_equal(labels[left], labels[right]):
+            break
+    while not np.array_equal(labels[labels], labels):
+        labels = labels[labels]
+    return labels
+
+
+def households(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Resolve the distinct name and address records of a view into households
+
+    Candidates are only compared within blocks, so the work grows with the records rather
+    than with their pairs. House and flat numbers must agree, where a number left blank on
+    one record (e.g. no flat number) agrees with any (see numbers_compatible).
+    - Distinct addresses in the same postcode that start with the same word (usually the
+      house number) are one household when they are similar. An address missing a flat
+      number only joins a fuller address when exactly one fuller address matches it, so a
+      bare building address does not join up the flats in it.
+    - Records in the same postcode whose last names share a Soundex key are one household
+      when both names are similar and the addresses are roughly alike. This catches a
+      household re-registered under a new client id with its names or address spelt
+      differently.
+    Records whose normalised name and address are identical, and records of the same client
+    id, are always one household.
+
+    Parameters:
+        df (pd.DataFrame): A view with the IDENTITY_COLUMNS, and optionally "client id"
+    Returns:
+        pd.DataFrame: The distinct IDENTITY_COLUMNS and "client id" records and their "household id".
+        The id is a hash of the household's smallest normalised record, so it stays the same when
+        the same vouchers are loaded again.
+    """
+    with step("households", df) as record:
+        columns = IDENTITY_COLUMNS + ([CLIENT_ID] if CLIENT_ID in df.columns else [])
+        records = df[columns].drop_duplicates().reset_index(drop=True)
+        # Normalise each distinct spelling once
+        postcode = records["postcode"].astype(object).str.upper().str.replace(r"\s+", "", regex=True).fillna("")
+        postcode = postcode.to_numpy(dtype=object)
+        address_codes, addresses = pd.factorize(
+            records["address1"].astype(object).fillna("") + " " + records["address2"].astype(object).fillna("")
+        )
+        normalised = np.array([normalise_address(value) for value in addresses], dtype=object)
+        address = normalised[address_codes]
+        numbers = np.array([" ".join(NUMBERS.findall(value)) for value in normalised], dtype=object)[address_codes]
+        first = records["first name"].astype(object).fillna("").str.lower().str.strip().to_numpy(dtype=object)
+        last = records["last name"].astype(object).fillna("").str.lower().str.strip().to_numpy(dtype=object)
+        last_codes, last_names = pd.factorize(last)
+        last_soundex = np.array([soundex(name) for name in last_names], dtype=object)[last_codes]
+        has_postcode = postcode != ""
+
+        key = postcode + "|" + address + "|" + last + "|" + first
+        links = [block_pairs(pd.factorize(key)[0], np.zeros(len(records)), window=1)]
+        if CLIENT_ID in records.columns:
+            links.append(block_pairs(pd.factorize(records[CLIENT_ID])[0], np.zeros(len(records)), window=1))
+
+        # Addresses are compared once per distinct postcode and address, and every record at a linked address follows
+        unit_codes, units = pd.factorize(postcode + "|" + address)
+        unit_first = np.unique(unit_codes, return_index=True)[1]
+        unit_postcode, unit_address = postcode[unit_first], address[unit_first]
+        unit_numbers = np.array([" ".join(NUMBERS.findall(value)) for value in unit_address], dtype=object)
+        house = np.array([value.split(" ", 1)[0] for value in unit_address], dtype=object)
+        unit_block = pd.factorize(unit_postcode + "|" + house)[0]
+        unit_block[(unit_postcode == "") | (unit_address == "")] = -1
+        left, right = block_pairs(unit_block, unit_address)
+        same = unit_numbers[left] == unit_numbers[right]
+        linked = np.array([
+            similarity(unit_address[i], unit_address[j]) >= ADDRESS_SIMILARITY for i, j in zip(left[same], right[same])
+        ], dtype=bool)
+        unit_left, unit_right = [left[same][linked]], [right[same][linked]]
+        # An address missing a number is compared with the start of the fuller address, where the number it lacks
+        # would follow, and only joins it when it matches exactly one fuller address
+        left, right = left[~same], right[~same]
+        unit_counts = np.array([len(numbers.split()) for numbers in unit_numbers], dtype=np.int64)
+        fewer = unit_counts[left] < unit_counts[right]
+        bare, full = np.where(fewer, left, right), np.where(fewer, right, left)
+        agree = numbers_agree(unit_numbers, bare, full)
+        bare, full = bare[agree], full[agree]
+        linked = np.array([
+            similarity(unit_address[i], unit_address[j][:len(unit_address[i])]) >= ADDRESS_SIMILARITY
+            for i, j in zip(bare, full)
+        ], dtype=bool)
+        bare, full = bare[linked], full[linked]
+        unique = np.bincount(bare, minlength=len(units))[bare] == 1
+        unit_left.append(bare[unique])
+        unit_right.append(full[unique])
+        unit_component = connected_components(len(units), np.concatenate(unit_left), np.concatenate(unit_right))
+        links.append(block_pairs(unit_component[unit_codes], np.zeros(len(records)), window=1))
+
+        name_block = pd.factorize(postcode + "|" + last_soundex)[0]
+        name_block[~has_postcode | (last_soundex == "")] = -1
+        left, right = block_pairs(name_block, first)
+        # Numbers are compared for every candidate at once, and only pairs that agree have their strings scored
+        candidate = numbers_agree(numbers, left, right)
+        left, right = left[candidate], right[candidate]
+        linked = np.array([
+            similarity(first[i], first[j]) >= NAME_SIMILARITY
+            and similarity(last[i], last[j]) >= NAME_SIMILARITY
+            and (not address[i] or not address[j] or similarity(address[i], address[j]) >= NAME_ADDRESS_SIMILARITY)
+            for i, j in zip(left, right)
+        ], dtype=bool)
+        links.append((left[linked], right[linked]))
+
+        left = np.concatenate([pair[0] for pair in links])
+        right = np.concatenate([pair[1] for pair in links])
+        component = connected_components(len(records), left, right)
+        # Name each household after its smallest key, which does not depend on the order of the rows
+        first_key = pd.Series(key).groupby(component).transform("min").to_numpy(dtype=object)
+        records[HOUSEHOLD_ID] = pd.util.hash_array(first_key)
+        record["rows_out"] = len(records)
+    return records
+
+
+def household_ids(df: pd.DataFrame, households: pd.DataFrame) -> pd.Series:
+    """
+    Return the household id of each row of a view, on its index
+
+    Parameters:
+        df (pd.DataFrame): A view with the IDENTITY_COLUMNS
+        households (pd.DataFrame): The output of households, over the same vouchers
+    Returns:
+        pd.Series: "household id" of each row. Rows whose record is not in the table are
+        households of their own.
+    """
+    table = households.drop_duplicates(subset=IDENTITY_COLUMNS)
+    keys = df[IDENTITY_COLUMNS].astype(object)
+    ids = keys.merge(table.astype({column: object for column in IDENTITY_COLUMNS}), how="left", on=IDENTITY_COLUMNS)[HOUSEHOLD_ID]
+    missing = ids.isna().to_numpy()
+    if missing.any():
+        ids[missing] = households_of(keys[missing])
+    return pd.Series(ids.to_numpy(dtype=np.uint64), index=df.index, name=HOUSEHOLD_ID)
+
+
+def households_of(records: pd.DataFrame) -> np.ndarray:
+    """
+    Return the household ids of records resolved on their own
+    """
+    resolved = households(records)
+    return records.merge(resolved, how="left", on=IDENTITY_COLUMNS)[HOUSEHOLD_ID].to_numpy()
+
+
+def with_households(dataset, name: str) -> pd.DataFrame:
+    """
+    Return the named view with a "household id" column, building it on first use
+
+    The households are resolved once per dataset over the voucher view, which holds every
+    voucher's name and address, and shared by every view built from the same export.
+    """
+    def build(dataset):
+        df = dataset.view(name)
+        return pd.concat([df, household_ids(df, dataset.view("households"))], axis=1, copy=False)
+    return dataset.view(f"{name} households", build)
@@ -0,0 +1,333 @@
+import hashlib
+import io
+import logging
+import os
+
+import msoffcrypto
+import pandas as pd
+import pyarrow as pa
+from msoffcrypto.exceptions import DecryptionError
+
+import dbclean_1
+import identity
+from cache import DatasetCache
+from pipeline import Pipeline
+from profiler import Profiler, step
+from schema import restore_strings
+from streaming import stream_clean
+from xlsx_reader import READER_ERRORS, read_xlsx
+
+logger = logging.getLogger(__name__)
+
+column_headings = ['Voucher code', 'Created at', 'Date issued to client', 'Fulfilled date',
+       'Signposted date', 'First name', 'Last name', 'No fixed address',
+       'Address1', 'Address2', 'Town', 'County', 'Postcode', 'Birth year',
+       'The usual household structure pre 4th April 2023: Children (0 - 4 yrs)',
+       'The usual household structure pre 4th April 2023: Children (5 - 11 yrs)',
+       'The usual household structure pre 4th April 2023: Children (12 - 16 yrs)',
+       'The usual household structure pre 4th April 2023: Children (unknown age)',
+       'The usual household structure pre 4th April 2023: Adults (17 - 24 yrs)',
+       'The usual household structure pre 4th April 2023: Adults (25 - 64 yrs)',
+       'The usual household structure pre 4th April 2023: Adults (Over 65 yrs)',
+       'The usual household structure pre 4th April 2023: Adults (unknown age)',
+       'The usual household structure: Children (0 - 4 yrs)',
+       'The usual household structure: Children (5 - 11 yrs)',
+       'The usual household structure: Children (12 - 16 yrs)',
+       'The usual household structure: Children (not specified)',
+       'The usual household structure: Adults (17 - 24 yrs)',
+       'The usual household structure: Adults (25 - 34 yrs)',
+       'The usual household structure: Adults (35 - 44 yrs)',
+       'The usual household structure: Adults (45 - 54 yrs)',
+       'The usual household structure: Adults (55 - 64 yrs)',
+       'The usual household structure: Adults (65 - 74 yrs)',
+       'The usual household structure: Adults (75+ yrs)',
+       'The usual household structure: Adults (not specified)', 'Red',
+       'Emergency food box', 'Printable', 'Crisis type', 'Crisis cause',
+       'Crisis sub cause', 'Crisis cause description',
+       'Was Covid-19 a contributing factor?', 'Parcel days',
+       'Consent for contacting about delivery or collection',
+       'Client email address', 'Client phone number',
+       'Secondary crisis: Benefit changes', 'Secondary crisis: Benefit delays',
+       'Secondary crisis: Low income',
+       'Secondary crisis: Refused short term benefit advance',
+       'Secondary crisis: Delayed wages', 'Secondary crisis: Debt',
+       'Secondary crisis: Homeless',
+       'Secondary crisis: No recourse to public funds',
+       'Secondary crisis: Domestic abuse',
+       'Secondary crisis: Sickness/ill health',
+       'Secondary crisis: Child holiday meals', 'Secondary crisis: Other',
+       'Source of income', 'Reasons for referral',
+       'Reasons for referral - notes',
+       'Number of people the voucher is for pre 4th April 2023: Children (0 - 4 yrs)',
+       'Number of people the voucher is for pre 4th April 2023: Children (5 - 11 yrs)',
+       'Number of people the voucher is for pre 4th April 2023: Children (12 - 16 yrs)',
+       'Number of people the voucher is for pre 4th April 2023: Children (unknown age)',
+       'Number of people the voucher is for pre 4th April 2023: Adults (17 - 24 yrs)',
+       'Number of people the voucher is for pre 4th April 2023: Adults (25 - 64 yrs)',
+       'Number of people the voucher is for pre 4th April 2023: Adults (Over 65 yrs)',
+       'Number of people the voucher is for pre 4th April 2023: Adults (unknown age)',
+       'Number of people the voucher is for: Children (0 - 4 yrs)',
+       'Number of people the voucher is for: Children (5 - 11 yrs)',
+       'Number of people the voucher is for: Children (12 - 16 yrs)',
+       'Number of people the voucher is for: Children (not specified)',
+       'Number of people the voucher is for: Adults (17 - 24 yrs)',
+       'Number of people the voucher is for: Adults (25 - 34 yrs)',
+       'Number of people the voucher is for: Adults (35 - 44 yrs)',
+       'Number of people the voucher is for: Adults (45 - 54 yrs)',
+       'Number of people the voucher is for: Adults (55 - 64 yrs)',
+       'Number of people the voucher is for: Adults (65 - 74 yrs)',
+       'Number of people the voucher is for: Adults (75+ yrs)',
+       'Number of people the voucher is for: Adults (not specified)',
+       'Partner or spouse (usual household structure)',
+       'Parent or carer (usual household structure)',
+       'Partner or spouse (number of people the voucher is for)',
+       'Parent or carer (number of people the voucher is for)', 'Ward',
+       'Assigned food bank centre', 'Agency contact phone',
+       'Notes regarding parcel requirements',
+       'Reason for needing more than 3 vouchers in the last 6 months',
+       'Reason for needing more than 3 vouchers in the last 6 months - notes',
+       'Agency', 'Issued by', 'Delivery required', 'Collection/Delivery notes',
+       'Consent for holding information about dietary requirements',
+       'Dietary requirements', 'Client ID', 'Foodbank centre fulfilled at',
+       'Voucher status']
+
+
+# Free-text and contact columns that no cleaned view keeps, so the fast reader skips them
+unused_columns = [
+    "Red", "Emergency food box", "Printable",
+    "Client email address", "Client phone number", "Dietary requirements",
+    "Reasons for referral - notes", "Agency contact phone",
+    "Notes regarding parcel requirements", "Collection/Delivery notes",
+    "Reason for needing more than 3 vouchers in the last 6 months - notes"
+]
+ingest_columns = [column for column in column_headings if column not in unused_columns]
+
+# Conversions the fast reader applies to cells as it reads them
+column_types = {
+    "Created at": "date", "Date issued to client": "date", "Fulfilled date": "date", "Signposted date": "date",
+    "Birth year": "int", "Client ID": "int", "No fixed address": "bool", "Delivery required": "bool",
+}
+column_types.update({
+    column: "bool" for column in column_headings if column.startswith("Secondary crisis:")
+})
+column_types.update({
+    column: "int" for column in column_headings
+    if column.startswith(("The usual household structure", "Number of people the voucher is for"))
+})
+
+
+def file_hash(data: bytes) -> str:
+    """
+    Return the SHA-256 hex digest of the uploaded workbook bytes
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+# Encrypted Office files are OLE compound files (CFB) rather than zip archives
+OLE_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+
+def is_encrypted(data: bytes) -> bool:
+    """
+    Return True if the workbook bytes are an encrypted (OLE/CFB wrapped) workbook
+    """
+    return data[:len(OLE_SIGNATURE)] == OLE_SIGNATURE
+
+
+def open_workbook(data: bytes, password=None, key: str = None, decrypted_cache=None) -> io.BytesIO:
+    """
+    Return a readable buffer of the workbook, decrypting it if it is encrypted
+
+    Parameters:
+        data (bytes): The uploaded workbook
+        password: the password for the excel
+        key (str): The workbook hash, used to look up `decrypted_cache`
+        decrypted_cache: Optional mapping of workbook hash -> decrypted bytes
+    Returns:
+        io.BytesIO: The plain xlsx buffer, or None if decryption failed
+    """
+    if not is_encrypted(data):
+        return io.BytesIO(data)  # Plain xlsx, no password needed
+
+    if decrypted_cache is not None and key in decrypted_cache:
+        return io.BytesIO(decrypted_cache[key])
+    if password is None:
+        return None  # Don't attempt a decrypt until a password has been given
+
+    try:
+        with step("decrypt"):
+            decrypted = io.BytesIO()
+            office_file = msoffcrypto.OfficeFile(io.BytesIO(data))
+            office_file.load_key(password=password)
+            office_file.decrypt(decrypted)
+    except DecryptionError:
+        return None  # Failed to load due to decryption error
+
+    if decrypted_cache is not None:
+        decrypted_cache[key] = decrypted.getvalue()
+    decrypted.seek(0)
+    return decrypted
+
+
+def read_workbook(workbook) -> pd.DataFrame:
+    """
+    Parse a plain xlsx buffer into the raw DataFrame with the expected columns
+
+    The fast reader only parses the columns the cleaned views use; workbooks it cannot
+    read fall back to reading every column through openpyxl, which shows as an "openpyxl"
+    step in the diagnostics panel.
+    """
+    try:
+        with step("read_xlsx") as record:
+            df = read_xlsx(workbook, ingest_columns, column_types)
+            record["rows_out"] = len(df)
+        return df
+    except READER_ERRORS as error:
+        logger.warning("Fast xlsx reader failed (%r), reading the workbook with openpyxl", error)
+        workbook.seek(0)
+        with step("openpyxl") as record:
+            df = pd.read_excel(workbook, engine='openpyxl')
+            record["rows_out"] = len(df)
+        return df[column_headings]
+
+
+def load_excel(uploaded_file, password=None) -> tuple[pd.DataFrame, bool]:
+    """
+    Load the excel file into pd.dataframe
+
+    Parameters:
+        uploaded_file: The excel file to be transftered
+        password: the password for the excel
+    Returns:
+        tuple: A tuple containing:
+            - pd.DataFrame: The pd.DataFrame loaded
+            - bool: True if successfully loaded
+    """
+    workbook = open_workbook(uploaded_file.read(), password=password)
+    if workbook is None:
+        return None, False
+    return read_workbook(workbook), True
+
+
+# Workbooks larger than this are cleaned in batches instead of being parsed whole
+STREAMING_MIN_BYTES = int(os.environ.get("FOODBANK_STREAMING_MB", "20")) * 1024 * 1024
+
+
+def voucher_view(dataset) -> pd.DataFrame:
+    """
+    Build the dbclean_1 view, streaming large workbooks in batches when the raw frame is not loaded
+
+    Workbooks the fast reader cannot stream, or whose cleaned batches Arrow cannot hold, are
+    parsed whole instead. The fallback is logged and shows as a "streaming failed" step in
+    the diagnostics panel. Any other error is a bug and is raised.
+    """
+    if dataset.streaming and dataset._raw is None:
+        try:
+            dataset.workbook.seek(0)
+            table = stream_clean(dataset.workbook, dbclean_1.clean_data, ingest_columns, column_types,
+                                 progress=dataset.progress)
+            return restore_strings(table.to_pandas(split_blocks=True, self_destruct=True))
+        except READER_ERRORS + (pa.ArrowException,) as error:
+            logger.warning("Streaming the workbook failed (%r), parsing it whole", error)
+            with step(f"streaming failed: {type(error).__name__}"):
+                pass
+    return dataset.pipeline.run("voucher")
+
+
+# Cleaned views that can be built from the raw export, by name
+VIEWS = {
+    "voucher": voucher_view,
+    "geo": lambda dataset: dataset.pipeline.run("geo"),
+    # One row per client with their visits, gaps between vouchers and distinct crisis types and centres
+    "clients": lambda dataset: dbclean_1.client_summary(dataset.view("voucher")),
+    # Each distinct name, address and client id with its resolved household, see identity.with_households
+    "households": lambda dataset: identity.households(dataset.view("voucher")),
+}
+
+
+class Dataset:
+    """
+    A parsed upload and the cleaned views built from it.
+
+    The raw frame is only parsed when a view is missing from both memory and the
+    on-disk cache, and every view is built from it the first time a page asks for it,
+    so switching pages or re-uploading the same file reuses the work.
+    """
+
+    def __init__(self, key: str, workbook: io.BytesIO, cache: DatasetCache = None, profiler: Profiler = None):
+        self.key = key
+        self.workbook = workbook
+        self.cache = cache
+        self.streaming = workbook is not None and workbook.getbuffer().nbytes >= STREAMING_MIN_BYTES
+        self.progress = None  # Optional callable taking (rows_read, total_rows) while streaming
+        self.views = {}
+        self.pipeline = Pipeline(lambda: self.raw)  # Cleaning stages shared by the views
+        self.queries = None  # Query engine over the voucher view, see queries.voucher_queries
+        self.clients = None  # Client index over the voucher view, see journey.client_index
+        self.search = None  # Client id and name lookup over the voucher view, see journey.client_search
+        self.profiler = profiler or Profiler(key)  # Timings of each load and cleaning step
+        self._raw = None
+
+    @property
+    def raw(self) -> pd.DataFrame:
+        if self._raw is None:
+            with self.profiler.activate():
+                self.workbook.seek(0)
+                self._raw = read_workbook(self.workbook)
+        return self._raw
+
+    def view(self, name: str, build=None) -> pd.DataFrame:
+        """
+        Return the named cleaned view, building it on first use
+
+        Views listed in VIEWS are also read from and written to the on-disk cache.
+
+        Parameters:
+            name (str): The view name, e.g. "voucher" or "geo"
+            build: Optional callable taking the Dataset, used instead of VIEWS[name]
+        Returns:
+            pd.DataFrame: The cleaned view
+        """
+        if name not in self.views:
+            with self.profiler.activate(), step(f"{name} view") as record:
+                cacheable = build is None and self.cache is not None
+                df = None
+                if cacheable:
+                    with step("cache read"):
+                        df = self.cache.get(self.key, name)
+                if df is None:
+                    df = (build or VIEWS[name])(self)
+                    if cacheable:
+                        with step("cache write"):
+                            self.cache.put(self.key, name, df)
+                record["rows_out"] = len(df)
+            self.views[name] = df
+        return self.views[name]
+
+
+def load_dataset(data: bytes, password=None, current: Dataset = None, cache: DatasetCache = None,
+                 decrypted_cache=None) -> tuple[Dataset, bool]:
+    """
+    Open the workbook bytes as a Dataset, reusing `current` if it holds the same file
+
+    Parameters:
+        data (bytes): The uploaded workbook
+        password: the password for the excel
+        current (Dataset): The dataset already loaded in this session, if any
+        cache (DatasetCache): On-disk cache of cleaned views, if any
+        decrypted_cache: Optional mapping of workbook hash -> decrypted bytes
+    Returns:
+        tuple: A tuple containing:
+            - Dataset: The loaded dataset
+            - bool: True if successfully loaded
+    """
+    key = file_hash(data)
+    if current is not None and current.key == key:
+        return current, True
+
+    profiler = Profiler(key)
+    with profiler.activate():
+        workbook = open_workbook(data, password=password, key=key, decrypted_cache=decrypted_cache)
+    if workbook is None:
+        return None, False
+    return Dataset(key, workbook, cache=cache, profiler=profiler), True
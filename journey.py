@@ -0,0 +1,375 @@
+import numpy as np
+import pandas as pd
+
+# Columns that identify a client in the journey table
+CLIENT_COLUMNS = ["client id", "first name", "last name"]
+DATE_COLUMN = "date issued to client"
+ISSUED_BY_COLUMN = "issued by"
+
+
+class ClientIndex:
+    """
+    The vouchers of the voucher view grouped by client, in compressed sparse row layout.
+
+    Clients are numbered in (client id, first name, last name) order, and the vouchers of
+    client c are the view rows rows[offsets[c]:offsets[c + 1]], sorted by issue date. Each
+    voucher also has a sort key of (client number, issue date rank), so the vouchers of every
+    client within a date range are found with two searchsorted calls instead of a groupby.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        """
+        Parameters:
+            df (pd.DataFrame): The voucher view, kept to format the journey table
+        """
+        self.df = df
+        # Missing dates are the smallest int64, so they sort before every issue date
+        issued = df[DATE_COLUMN].to_numpy(dtype="datetime64[ns]").view("int64")
+        keyed = df[CLIENT_COLUMNS].assign(issued=issued).reset_index(drop=True).dropna(subset=CLIENT_COLUMNS)
+        keyed = keyed.sort_values(CLIENT_COLUMNS + ["issued"], kind="stable")
+        client = keyed.groupby(CLIENT_COLUMNS, sort=False).ngroup().to_numpy()
+
+        self.rows = keyed.index.to_numpy()
+        self.voucher_counts = np.bincount(client, minlength=0)
+        self.offsets = np.concatenate([[0], np.cumsum(self.voucher_counts)])
+        self.max_vouchers = int(self.voucher_counts.max()) if len(self.voucher_counts) else 0
+        # Distinct issue dates, so a date becomes a rank that fits next to the client number
+        self.dates = np.unique(keyed["issued"].to_numpy())
+        self.keys = client.astype(np.int64) * len(self.dates) + np.searchsorted(self.dates, keyed["issued"].to_numpy())
+
+    def __len__(self) -> int:
+        return len(self.voucher_counts)
+
+    def date_bounds(self, start_date=None, end_date=None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return where each client's vouchers issued between the dates start and end in `rows`
+
+        Parameters:
+            start_date: The first issue date to include, or None for no lower bound
+            end_date: The last issue date to include, or None for no upper bound
+        Returns:
+            tuple: Start and end positions in `rows` per client, the vouchers in range are rows[start:end]
+        """
+        if not start_date and not end_date:
+            return self.offsets[:-1], self.offsets[1:]
+        if start_date:
+            low = np.searchsorted(self.dates, pd.Timestamp(start_date).value, side="left")
+        else:
+            # Vouchers without an issue date are outside any date range
+            low = np.searchsorted(self.dates, np.iinfo(np.int64).min, side="right")
+        high = np.searchsorted(self.dates, pd.Timestamp(end_date).value, side="right") if end_date else len(self.dates)
+        base = np.arange(len(self), dtype=np.int64) * len(self.dates)
+        return np.searchsorted(self.keys, base + low), np.searchsorted(self.keys, base + high)
+
+    def select(self, min_voucher: int = None, max_voucher: int = None, start_date=None, end_date=None) -> "Journey":
+        """
+        Return the clients with vouchers in a date range, and a number of them in a range
+
+        Parameters:
+            min_voucher (int): The min number of vouchers in the date range
+            max_voucher (int): The max number of vouchers in the date range
+            start_date: The first issue date to include
+            end_date: The last issue date to include
+        Returns:
+            Journey: The matching clients, in key order
+        """
+        start, end = self.date_bounds(start_date, end_date)
+        counts = end - start
+        keep = counts > 0
+        if min_voucher:
+            keep &= counts >= min_voucher
+        if max_voucher:
+            keep &= counts <= max_voucher
+        return Journey(self, start[keep], counts[keep])
+
+    def journey(self, min_voucher: int = None, max_voucher: int = None, start_date=None,
+                end_date=None) -> tuple[pd.DataFrame, bool]:
+        """
+        Return the client journey table, one row per client with their vouchers side by side
+
+        The table is the same as dbclean_1.individual_journey_filter's: vouchers are listed in
+        the order of the view, and clients in key order.
+
+        Parameters:
+            min_voucher (int): The min number of vouchers in the date range
+            max_voucher (int): The max number of vouchers in the date range
+            start_date: The first issue date to include
+            end_date: The last issue date to include
+        Returns:
+            tuple: The journey table, and True if any client matched (None and False otherwise)
+        """
+        journey = self.select(min_voucher, max_voucher, start_date, end_date)
+        if not len(journey):
+            return None, False
+        return journey.table().reset_index(drop=True), True
+
+
+class Journey:
+    """
+    The clients matching a journey filter, as ranges of a ClientIndex's rows.
+
+    Row i of the journey table is client i here, and only the rows asked for are formatted:
+    a page sorts the clients on the one column it is sorted by, then formats the page's rows.
+    """
+
+    def __init__(self, index: ClientIndex, start: np.ndarray, counts: np.ndarray):
+        """
+        Parameters:
+            index (ClientIndex): The index the clients were selected from
+            start (np.ndarray): Where each client's vouchers in range start in index.rows
+            counts (np.ndarray): Each client's number of vouchers in range
+        """
+        self.index = index
+        self.start = start
+        self.counts = counts
+        # Every page has as many voucher detail columns as the whole table
+        self.width = int(counts.max()) if len(counts) else 0
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    @property
+    def columns(self) -> list:
+        """
+        The journey table's column names
+        """
+        return ['Client ID', 'First Name', 'Last Name', 'Voucher Count', 'Latest Issue Date'] + [
+            f'Voucher Detail {i+1} (Issue Date - Issued by)' for i in range(self.width)
+        ]
+
+    def vouchers(self, clients: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Return the vouchers in range of some clients, grouped by client in the order of the view
+
+        Parameters:
+            clients (np.ndarray): Client positions in the journey
+        Returns:
+            tuple: For each voucher its client (position in `clients`), its place among the
+            client's vouchers and its view row; then the view row of each client's latest voucher
+        """
+        start, counts = self.start[clients], self.counts[clients]
+        # Expand each client's [start, end) range into its vouchers
+        client = np.repeat(np.arange(len(counts)), counts)
+        first = np.cumsum(counts) - counts
+        position = np.arange(len(client)) - first[client]
+        rows = self.index.rows[start[client] + position]
+        # Each client's vouchers are date sorted, so the last one in range is the latest
+        latest_rows = rows[first + counts - 1]
+        # Back to the order of the view within each client
+        return client, position, rows[np.lexsort((rows, client))], latest_rows
+
+    def details(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Return the "issue date - issued by" text of some view rows
+        """
+        vouchers = self.index.df.iloc[rows]
+        return (
+            vouchers[DATE_COLUMN].dt.strftime('%Y-%m-%d') + " - "
+            + vouchers[ISSUED_BY_COLUMN].astype(str).astype(object)
+        ).to_numpy(dtype=object)
+
+    def sort_key(self, column: str) -> pd.Series:
+        """
+        Return a value per client that sorts the clients as the column's text does in the table
+        """
+        clients = np.arange(len(self))
+        df = self.index.df
+        if column == 'Voucher Count':
+            return pd.Series(self.counts)
+        if column == 'Latest Issue Date':
+            # Dates sort as their day's text does, so only the day is compared
+            latest_rows = self.vouchers(clients)[3]
+            return pd.Series(df[DATE_COLUMN].to_numpy()[latest_rows]).dt.normalize()
+        if column.startswith('Voucher Detail '):
+            place = int(column.split()[2]) - 1
+            client, position, rows, _ = self.vouchers(clients)
+            has_detail = position == place
+            key = pd.Series(np.full(len(self), None, dtype=object))
+            key.iloc[client[has_detail]] = self.details(rows[has_detail])
+            return key
+        first_rows = self.index.rows[self.start]
+        column = {'Client ID': 'client id', 'First Name': 'first name', 'Last Name': 'last name'}[column]
+        return df[column].iloc[first_rows].reset_index(drop=True)
+
+    def table(self, clients: np.ndarray = None) -> pd.DataFrame:
+        """
+        Return rows of the journey table, one per client, indexed by client position
+
+        Parameters:
+            clients (np.ndarray): Client positions in the journey, in the order to list them, every client if None
+        Returns:
+            pd.DataFrame: The journey table's rows for the clients
+        """
+        if clients is None:
+            clients = np.arange(len(self))
+        client, position, rows, latest_rows = self.vouchers(clients)
+        date_columns = np.full((len(clients), self.width), None, dtype=object)
+        date_columns[client, position] = self.details(rows)
+
+        df = self.index.df
+        result_df = df[CLIENT_COLUMNS].iloc[self.index.rows[self.start[clients]]].rename(columns={
+            'client id': 'Client ID',
+            'first name': 'First Name',
+            'last name': 'Last Name',
+        }).set_axis(clients)
+        result_df['Voucher Count'] = self.counts[clients]
+        latest_date = df[DATE_COLUMN].iloc[latest_rows].dt.strftime('%Y-%m-%d')
+        result_df['Latest Issue Date'] = latest_date.to_numpy(dtype=object)
+        detail_df = pd.DataFrame(date_columns, index=clients, columns=self.columns[5:])
+        return pd.concat([result_df, detail_df], axis=1)
+
+    def page(self, page: int, page_size: int, sort_by: str = None, ascending: bool = True) -> pd.DataFrame:
+        """
+        Return the rows of one page of the journey table, sorting it by a column first if asked
+
+        Parameters:
+            page (int): The page to show, from 1
+            page_size (int): Rows per page
+            sort_by (str): Optional column to sort by, rows without a value come last
+            ascending (bool): Sort direction
+        Returns:
+            pd.DataFrame: At most page_size rows
+        """
+        start = (page - 1) * page_size
+        if sort_by is None:
+            clients = np.arange(len(self))[start:start + page_size]
+        else:
+            order = self.sort_key(sort_by).sort_values(ascending=ascending, kind="stable", na_position="last")
+            clients = order.index.to_numpy()[start:start + page_size]
+        return self.table(clients)
+
+
+def normalise_name(name: str) -> str:
+    """
+    Return a name in lower case with single spaces, the form names are matched in
+    """
+    return " ".join(str(name).lower().split())
+
+
+def name_trigrams(name: str) -> set:
+    """
+    Return the three-letter pieces of a normalised name, padded so the first letters count the most
+    """
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ClientSearch:
+    """
+    Lookup of the voucher view's rows by client id and by client name, built once per dataset.
+
+    Client ids map straight to their rows. Names are matched on their normalised full name
+    ("first last"), kept sorted for prefix suggestions, with a trigram index over them for
+    suggestions that tolerate typos. Rows are positions in the view, in the view's order.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        """
+        Parameters:
+            df (pd.DataFrame): The voucher view
+        """
+        self.client_rows = df.groupby("client id", sort=False).indices
+
+        # Normalise each distinct spelling of a full name once, then number the normalised names in sorted order
+        first, last = df["first name"], df["last name"]
+        spelling, spellings = pd.factorize(first.astype(object) + "\x1f" + last.astype(object))
+        normalised = [normalise_name(value.replace("\x1f", " ")) for value in spellings]
+        self.names, spelling_name = np.unique(np.array(normalised, dtype=str), return_inverse=True)
+        # Missing first or last names have spelling -1 and are never matched
+        row_name = np.where(spelling >= 0, spelling_name[spelling], -1) if len(spellings) else np.full(len(df), -1)
+
+        # Rows of each name, in compressed sparse row layout like ClientIndex
+        named = np.flatnonzero(row_name >= 0)
+        order = named[np.argsort(row_name[named], kind="stable")]
+        self.name_rows = order
+        self.name_offsets = np.concatenate([[0], np.cumsum(np.bincount(row_name[named], minlength=len(self.names)))])
+        # The name as first written in the view, to show in suggestions
+        self.display_names = np.array([
+            f"{first.iloc[rows[0]]} {last.iloc[rows[0]]}" for rows in
+            (order[start:end] for start, end in zip(self.name_offsets[:-1], self.name_offsets[1:]))
+        ], dtype=object)
+
+        postings = {}
+        for name_id, name in enumerate(self.names):
+            for trigram in name_trigrams(name):
+                postings.setdefault(trigram, []).append(name_id)
+        self.trigrams = {trigram: np.array(ids, dtype=np.int64) for trigram, ids in postings.items()}
+        self.trigram_counts = np.array([len(name_trigrams(name)) for name in self.names], dtype=np.int64)
+
+    def rows_for_client(self, client_id: int) -> np.ndarray:
+        """
+        Return the rows of a client id, empty if it has no vouchers
+        """
+        return self.client_rows.get(client_id, np.array([], dtype=np.int64))
+
+    def rows_for_name(self, name: str) -> np.ndarray:
+        """
+        Return the rows whose full name matches, ignoring case and extra spaces
+        """
+        name = normalise_name(name)
+        position = np.searchsorted(self.names, name)
+        if position == len(self.names) or self.names[position] != name:
+            return np.array([], dtype=np.int64)
+        return np.sort(self.name_rows[self.name_offsets[position]:self.name_offsets[position + 1]])
+
+    def complete(self, prefix: str, limit: int = 10) -> list:
+        """
+        Return up to `limit` full names starting with the typed text, in alphabetical order
+        """
+        prefix = normalise_name(prefix)
+        start = np.searchsorted(self.names, prefix, side="left")
+        # Every name starting with the prefix sorts before the prefix followed by the highest character
+        end = np.searchsorted(self.names, prefix + "\uffff", side="left")
+        return self.display_names[start:min(end, start + limit)].tolist()
+
+    def similar(self, name: str, limit: int = 10, threshold: float = 0.4) -> list:
+        """
+        Return up to `limit` full names sharing most of their trigrams with the typed name, closest first
+
+        Parameters:
+            name (str): The typed name, possibly misspelt
+            limit (int): Most names to return
+            threshold (float): Least Jaccard similarity of the trigram sets, from 0 to 1
+        Returns:
+            list: Display names of the matches
+        """
+        trigrams = name_trigrams(normalise_name(name))
+        postings = [self.trigrams[trigram] for trigram in trigrams if trigram in self.trigrams]
+        if not postings:
+            return []
+        ids, shared = np.unique(np.concatenate(postings), return_counts=True)
+        scores = shared / (len(trigrams) + self.trigram_counts[ids] - shared)
+        matched = scores >= threshold
+        ids, scores = ids[matched], scores[matched]
+        best = ids[np.lexsort((ids, -scores))[:limit]]
+        return self.display_names[best].tolist()
+
+    def suggest(self, text: str, limit: int = 10) -> list:
+        """
+        Return names completing the typed text, followed by names close to it
+        """
+        suggestions = self.complete(text, limit)
+        for name in self.similar(text, limit):
+            if len(suggestions) >= limit:
+                break
+            if name not in suggestions:
+                suggestions.append(name)
+        return suggestions
+
+
+def client_index(dataset) -> ClientIndex:
+    """
+    Return the dataset's client index over its voucher view, building it on first use
+    """
+    if dataset.clients is None:
+        dataset.clients = ClientIndex(dataset.view("voucher"))
+    return dataset.clients
+
+
+def client_search(dataset) -> ClientSearch:
+    """
+    Return the dataset's client search over its voucher view, building it on first use
+    """
+    if dataset.search is None:
+        dataset.search = ClientSearch(dataset.view("voucher"))
+    return dataset.search
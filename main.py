@@ -1,5 +1,7 @@
 import streamlit as st
 
+from session import cache_controls, diagnostics_panel
+
 st.set_page_config(page_title="Cirencester Foodbank Dashboard", layout="wide")
 
 # Define navigation with `st.navigation`
@@ -13,3 +15,6 @@ pages = st.navigation(
 
 # Run the selected page
 pages.run()
+
+cache_controls()
+diagnostics_panel()
@@ -1,8 +1,5 @@
 import streamlit as st
 import pandas as pd
-import io
-import msoffcrypto
-from dbclean import clean_data
 import folium
 import json
 import matplotlib.pyplot as plt
@@ -13,7 +10,10 @@ from branca.colormap import linear
 from streamlit_gsheets import GSheetsConnection
 import plotly.express as px
 import numpy as np
-from msoffcrypto.exceptions import DecryptionError
+from aggregates import AGE_GROUPS, geo_locate, historical_voucher_counts, postcode_counts, ward_population as ward_population_table
+from identity import HOUSEHOLD_ID, with_households
+from queries import monthly_voucher_counts
+from session import upload_dataset
 
 # Create a connection object.
 conn_postcodes = st.connection("gsheets_postcodes", type=GSheetsConnection)
@@ -21,80 +21,7 @@ df_postcodes = conn_postcodes.read(spreadsheet = 'https://docs.google.com/spread
 conn_wards = st.connection("gsheets_wards", type=GSheetsConnection)
 df_wards = conn_wards.read(spreadsheet = 'https://docs.google.com/spreadsheets/d/1tmk5cTIc3TNScbSeJgVMKcsCieVLtiY8YjS1Ma3rRLo/edit?usp=sharing')
 
-column_headings = ['Voucher code', 'Created at', 'Date issued to client', 'Fulfilled date',
-       'Signposted date', 'First name', 'Last name', 'No fixed address',
-       'Address1', 'Address2', 'Town', 'County', 'Postcode', 'Birth year',
-       'The usual household structure pre 4th April 2023: Children (0 - 4 yrs)',
-       'The usual household structure pre 4th April 2023: Children (5 - 11 yrs)',
-       'The usual household structure pre 4th April 2023: Children (12 - 16 yrs)',
-       'The usual household structure pre 4th April 2023: Children (unknown age)',
-       'The usual household structure pre 4th April 2023: Adults (17 - 24 yrs)',
-       'The usual household structure pre 4th April 2023: Adults (25 - 64 yrs)',
-       'The usual household structure pre 4th April 2023: Adults (Over 65 yrs)',
-       'The usual household structure pre 4th April 2023: Adults (unknown age)',
-       'The usual household structure: Children (0 - 4 yrs)',
-       'The usual household structure: Children (5 - 11 yrs)',
-       'The usual household structure: Children (12 - 16 yrs)',
-       'The usual household structure: Children (not specified)',
-       'The usual household structure: Adults (17 - 24 yrs)',
-       'The usual household structure: Adults (25 - 34 yrs)',
-       'The usual household structure: Adults (35 - 44 yrs)',
-       'The usual household structure: Adults (45 - 54 yrs)',
-       'The usual household structure: Adults (55 - 64 yrs)',
-       'The usual household structure: Adults (65 - 74 yrs)',
-       'The usual household structure: Adults (75+ yrs)',
-       'The usual household structure: Adults (not specified)', 'Red',
-       'Emergency food box', 'Printable', 'Crisis type', 'Crisis cause',
-       'Crisis sub cause', 'Crisis cause description',
-       'Was Covid-19 a contributing factor?', 'Parcel days',
-       'Consent for contacting about delivery or collection',
-       'Client email address', 'Client phone number',
-       'Secondary crisis: Benefit changes', 'Secondary crisis: Benefit delays',
-       'Secondary crisis: Low income',
-       'Secondary crisis: Refused short term benefit advance',
-       'Secondary crisis: Delayed wages', 'Secondary crisis: Debt',
-       'Secondary crisis: Homeless',
-       'Secondary crisis: No recourse to public funds',
-       'Secondary crisis: Domestic abuse',
-       'Secondary crisis: Sickness/ill health',
-       'Secondary crisis: Child holiday meals', 'Secondary crisis: Other',
-       'Source of income', 'Reasons for referral',
-       'Reasons for referral - notes',
-       'Number of people the voucher is for pre 4th April 2023: Children (0 - 4 yrs)',
-       'Number of people the voucher is for pre 4th April 2023: Children (5 - 11 yrs)',
-       'Number of people the voucher is for pre 4th April 2023: Children (12 - 16 yrs)',
-       'Number of people the voucher is for pre 4th April 2023: Children (unknown age)',
-       'Number of people the voucher is for pre 4th April 2023: Adults (17 - 24 yrs)',
-       'Number of people the voucher is for pre 4th April 2023: Adults (25 - 64 yrs)',
-       'Number of people the voucher is for pre 4th April 2023: Adults (Over 65 yrs)',
-       'Number of people the voucher is for pre 4th April 2023: Adults (unknown age)',
-       'Number of people the voucher is for: Children (0 - 4 yrs)',
-       'Number of people the voucher is for: Children (5 - 11 yrs)',
-       'Number of people the voucher is for: Children (12 - 16 yrs)',
-       'Number of people the voucher is for: Children (not specified)',
-       'Number of people the voucher is for: Adults (17 - 24 yrs)',
-       'Number of people the voucher is for: Adults (25 - 34 yrs)',
-       'Number of people the voucher is for: Adults (35 - 44 yrs)',
-       'Number of people the voucher is for: Adults (45 - 54 yrs)',
-       'Number of people the voucher is for: Adults (55 - 64 yrs)',
-       'Number of people the voucher is for: Adults (65 - 74 yrs)',
-       'Number of people the voucher is for: Adults (75+ yrs)',
-       'Number of people the voucher is for: Adults (not specified)',
-       'Partner or spouse (usual household structure)',
-       'Parent or carer (usual household structure)',
-       'Partner or spouse (number of people the voucher is for)',
-       'Parent or carer (number of people the voucher is for)', 'Ward',
-       'Assigned food bank centre', 'Agency contact phone',
-       'Notes regarding parcel requirements',
-       'Reason for needing more than 3 vouchers in the last 6 months',
-       'Reason for needing more than 3 vouchers in the last 6 months - notes',
-       'Agency', 'Issued by', 'Delivery required', 'Collection/Delivery notes',
-       'Consent for holding information about dietary requirements',
-       'Dietary requirements', 'Client ID', 'Foodbank centre fulfilled at',
-       'Voucher status']
-
-age_groups = {'0-4': range(0, 5), '5-11': range(5, 12), '12-16': range(12, 17), '17-24': range(17, 25),
-              '25-34': range(25, 35), '35-44': range(35, 45), '45-64': range(45, 65), '65+': range(65, 91)}
+age_groups = AGE_GROUPS
 
 
 if 'data_loaded' not in st.session_state:
@@ -159,75 +86,14 @@ def set_expander_title():
     if st.session_state.expander_title != 'Upload Excel file' and st.session_state.data_loaded:
         st.session_state.expander_title = 'Upload Excel file'
 
-def load_excel(uploaded_file, password=None) -> tuple[pd.DataFrame, bool]:
-    """
-    Load the excel file into pd.dataframe
-
-    Parameters:
-        uploaded_file: The excel file to be transftered
-        password: the password for the excel
-    Returns:
-        tuple: A tuple containing:
-            - pd.DataFrame: The pd.DataFrame loaded
-            - bool: True if successfully loaded
-    """
-
-    try:
-        df = pd.read_excel(uploaded_file, engine='openpyxl')
-        df = df[column_headings]
-        return df, True  # Successfully loaded without password
-    except Exception:
-        try:
-            decrypted = io.BytesIO()
-            office_file = msoffcrypto.OfficeFile(uploaded_file)
-            office_file.load_key(password=password)
-            office_file.decrypt(decrypted)
-            decrypted.seek(0)
-            df = pd.read_excel(decrypted, engine='openpyxl')
-            df = df[column_headings]
-            return df, True  # Successfully loaded with password
-        except DecryptionError:
-            return None, False  # Failed to load due to decryption error
-
-@st.cache_data(show_spinner=False)
-def load_data(file, password=None):
-    df, success = load_excel(file, password=password)
-    if success:
-        cleaned_df = clean_data(df)
-        st.success("File uploaded and cleaned successfully!")
-        unique_postcodes = cleaned_df['postcode'].unique()
-
-        postcode_coords = {
-            row['postcode']: (get_lat_lon(row['postcode']))
-            for _, row in df_postcodes[df_postcodes['postcode'].isin(unique_postcodes)].iterrows()
-        }
-
-        # Add latitude and longitude to cleaned_df using the postcode_coords dictionary
-        cleaned_df['latitude'] = cleaned_df['postcode'].map(lambda x: postcode_coords.get(x, (None, None))[0])
-        cleaned_df['longitude'] = cleaned_df['postcode'].map(lambda x: postcode_coords.get(x, (None, None))[1])
-
-        cleaned_df = cleaned_df.dropna(subset=['latitude', 'longitude'])
-
-        return cleaned_df, success
-    return None, success
-
-def get_lat_lon(postcode):
-    postcode_row = df_postcodes[df_postcodes['postcode'] == postcode]
-    if not postcode_row.empty:
-        return postcode_row['latitude'].values[0], postcode_row['longitude'].values[0]
-    else:
-        return None, None
+def load_data(dataset):
+    # Add latitude and longitude from the postcode lookup, to the vouchers with their resolved households
+    return geo_locate(with_households(dataset, "geo"), df_postcodes)
 
 @st.cache_resource(show_spinner=False)
 def postcode_map(df):
     if df.shape[0] > 0:
-        df['unique_address_pair'] = df[['address1', 'address2']].apply(tuple, axis=1)
-
-        postcode_counts_df = (
-            df.groupby('postcode')
-            .agg(count=('postcode', 'size'), latitude=('latitude', 'first'), longitude=('longitude', 'first'), unique_count=('unique_address_pair', 'nunique'))
-            .reset_index()
-        )
+        postcode_counts_df = postcode_counts(df)
 
         # Define color scale
         colormap = linear.YlOrRd_09.scale(0, postcode_counts_df['count'].max())
@@ -272,38 +138,7 @@ def style_function(feature, colormap):
 
 @st.cache_data(show_spinner=False)
 def ward_population(df):
-    ward_population_df = df.groupby('ward')[['household_size']+list(age_groups.keys())].sum().reset_index()
-
-    df_wards['population'] = df_wards['All ages '].str.replace(',', '').astype(int)
-
-    # Merge with df_wards to get the 'All ages' column
-    ward_population_df = ward_population_df.merge(df_wards,  left_on='ward', right_on='Ward Name', how='left').dropna()
-
-    # Calculate population percentage of 'All ages' for each ward
-    ward_population_df['population_percentage'] = round((ward_population_df['household_size'] / ward_population_df['population']) * 100,2)
-
-    ward_population_df['90'] = ward_population_df['90+']
-    for age_group, ages in age_groups.items():
-        ward_population_df[f"{age_group}_percentage"] = (
-            ward_population_df[age_group]/
-            ward_population_df[[str(age) for age in ages]].sum(axis=1)
-        ) * 100
-
-    # Compute the sum of age group percentages
-    ward_population_df["age_group_total_percentage"] = ward_population_df[[f"{age_group}_percentage" for age_group in age_groups]].sum(axis=1)
-
-    # Compute the scaling factor for each row
-    ward_population_df["scaling_factor"] = ward_population_df["population_percentage"] / ward_population_df["age_group_total_percentage"]
-
-    # Scale each age group percentage
-    for age_group in age_groups:
-        ward_population_df[f"{age_group}_scaled_percentage"] = round((
-            ward_population_df[f"{age_group}_percentage"] * ward_population_df["scaling_factor"]
-        ),2)
-
-    ward_population_df = ward_population_df.drop('Ward Name', axis=1)
-
-    return ward_population_df
+    return ward_population_table(df, df_wards)
 
 
 @st.cache_resource(show_spinner=False)
@@ -359,25 +194,9 @@ def ward_map(df):
 # Monthly Vouchers Graph
 def monthly_voucher_graph(df):
     if df.shape[0] > 0:
-        df["created at"] = pd.to_datetime(df["created at"])
-        df["month_name"] = df["created at"].dt.strftime('%b')
-
-        months_order = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-        df["month_name"] = pd.Categorical(df["month_name"], categories=months_order, ordered=True)
-
-        # Applying filter for selected foodbanks
+        # Monthly counts for selected foodbanks, combined with "All Foodbanks"
         selected_foodbanks = st.session_state.filter_foodbank
-        filtered_df = df[df["assigned food bank centre"].isin(selected_foodbanks)]
-
-        # Monthly counts for selected foodbanks
-        monthly_counts = filtered_df.groupby(["assigned food bank centre", "month_name"]).size().reset_index(name="voucher_count")
-
-        # Combine df for "All Foodbanks"
-        combined_counts = df.groupby("month_name").size().reset_index(name="voucher_count")
-        combined_counts["assigned food bank centre"] = "All Foodbanks"
-
-        # Combine data
-        monthly_counts = pd.concat([monthly_counts, combined_counts], ignore_index=True)
+        monthly_counts = monthly_voucher_counts(df, selected_foodbanks)
 
         # Plotting a line graph
         fig = px.line(
@@ -399,22 +218,9 @@ def monthly_voucher_graph(df):
 #Vouchers Issued Over Time (Historical)
 def historical_voucher_graph(df):
     if df.shape[0] > 0:
-        df["created at"]= pd.to_datetime(df["created at"])
-        df["date"]= df["created at"].dt.date
-
-        #applying foodbank filter
+        #cumulative sum of vouchers by date for the selected foodbanks, with the combined line
         selected_foodbanks = st.session_state.filter_foodbank
-        filtered_df = df[df["assigned food bank centre"].isin(selected_foodbanks)]
-
-        #finding cumulative sum of vouchers by date
-        historical_counts = filtered_df.groupby(["assigned food bank centre", "date"]).size().reset_index(name ="voucher_count")
-        historical_counts["cumulative_voucher_count"] = historical_counts.groupby("assigned food bank centre")["voucher_count"].cumsum()
-
-        #combined line
-        combined_counts = df.groupby("date").size().reset_index(name= "voucher_count")
-        combined_counts["cumulative_voucher_count"]= combined_counts["voucher_count"].cumsum()
-        combined_counts["assigned food bank centre"] = "All Foodbanks"
-        historical_counts = pd.concat([historical_counts, combined_counts], ignore_index=True)
+        historical_counts = historical_voucher_counts(df, selected_foodbanks)
 
         historical_counts_line = historical_counts.groupby("assigned food bank centre").filter(lambda x: len(x) > 1)
 
@@ -492,23 +298,11 @@ def ward_voucher_graph(df):
 st.markdown(f"<h1 style='text-align: center; color: #0A3D2E; font-family: Arial; font-size: 24px;'>Cirencester Foodbank Geo Analysis</h1>", unsafe_allow_html=True)
 set_custom_styles()
 
-# File uploader for Excel files
-uploaded_file = st.file_uploader("Upload your Excel file", type="xlsx")
-
-if uploaded_file:
-        cleaned_df, st.session_state.data_loaded = load_data(uploaded_file)
-        if not st.session_state.data_loaded:
-            # Prompt for a password if the initial load failed
-            password = st.text_input("Enter the password for the Excel file", type="password")
-            if password:
-                cleaned_df, st.session_state.data_loaded = load_data(uploaded_file, password=password)
-                if not st.session_state.data_loaded:
-                    st.error("Failed to load the file. Please check the password or file format.")
-        if st.session_state.data_loaded:
-            st.session_state["df2"] = cleaned_df
-
-if 'df2' in st.session_state:
-    cleaned_df = st.session_state["df2"]
+dataset = upload_dataset()
+st.session_state.data_loaded = dataset is not None
+
+if dataset is not None:
+    cleaned_df = dataset.view("geo_located", load_data)
     with st.sidebar:
         selected_tab = option_menu(
             "",
@@ -661,7 +455,7 @@ if 'df2' in st.session_state:
         filtered_df = filtered_df[cleaned_df[st.session_state.filter_age_group].any(axis=1)]
 
     if not st.session_state.filter_repeat_addresses:
-        filtered_df.drop_duplicates(subset=['address1', 'address2'], keep='first', inplace=True)
+        filtered_df.drop_duplicates(subset=[HOUSEHOLD_ID], keep='first', inplace=True)
 
     if st.session_state.filter_delivery is not None:
         filtered_df = filtered_df[filtered_df["delivery required"] == st.session_state.filter_delivery]
@@ -4,137 +4,21 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
-import io
-import msoffcrypto
-from msoffcrypto.exceptions import DecryptionError
 
 
-from dbclean_1 import individual_journey_filter
-from dbclean_1 import clean_data
+from identity import HOUSEHOLD_ID, with_households
+from journey import client_index, client_search
+from session import upload_dataset
 
 st.title("Individual Client Journey")
 
-column_headings = ['Voucher code', 'Created at', 'Date issued to client', 'Fulfilled date',
-       'Signposted date', 'First name', 'Last name', 'No fixed address',
-       'Address1', 'Address2', 'Town', 'County', 'Postcode', 'Birth year',
-       'The usual household structure pre 4th April 2023: Children (0 - 4 yrs)',
-       'The usual household structure pre 4th April 2023: Children (5 - 11 yrs)',
-       'The usual household structure pre 4th April 2023: Children (12 - 16 yrs)',
-       'The usual household structure pre 4th April 2023: Children (unknown age)',
-       'The usual household structure pre 4th April 2023: Adults (17 - 24 yrs)',
-       'The usual household structure pre 4th April 2023: Adults (25 - 64 yrs)',
-       'The usual household structure pre 4th April 2023: Adults (Over 65 yrs)',
-       'The usual household structure pre 4th April 2023: Adults (unknown age)',
-       'The usual household structure: Children (0 - 4 yrs)',
-       'The usual household structure: Children (5 - 11 yrs)',
-       'The usual household structure: Children (12 - 16 yrs)',
-       'The usual household structure: Children (not specified)',
-       'The usual household structure: Adults (17 - 24 yrs)',
-       'The usual household structure: Adults (25 - 34 yrs)',
-       'The usual household structure: Adults (35 - 44 yrs)',
-       'The usual household structure: Adults (45 - 54 yrs)',
-       'The usual household structure: Adults (55 - 64 yrs)',
-       'The usual household structure: Adults (65 - 74 yrs)',
-       'The usual household structure: Adults (75+ yrs)',
-       'The usual household structure: Adults (not specified)', 'Red',
-       'Emergency food box', 'Printable', 'Crisis type', 'Crisis cause',
-       'Crisis sub cause', 'Crisis cause description',
-       'Was Covid-19 a contributing factor?', 'Parcel days',
-       'Consent for contacting about delivery or collection',
-       'Client email address', 'Client phone number',
-       'Secondary crisis: Benefit changes', 'Secondary crisis: Benefit delays',
-       'Secondary crisis: Low income',
-       'Secondary crisis: Refused short term benefit advance',
-       'Secondary crisis: Delayed wages', 'Secondary crisis: Debt',
-       'Secondary crisis: Homeless',
-       'Secondary crisis: No recourse to public funds',
-       'Secondary crisis: Domestic abuse',
-       'Secondary crisis: Sickness/ill health',
-       'Secondary crisis: Child holiday meals', 'Secondary crisis: Other',
-       'Source of income', 'Reasons for referral',
-       'Reasons for referral - notes',
-       'Number of people the voucher is for pre 4th April 2023: Children (0 - 4 yrs)',
-       'Number of people the voucher is for pre 4th April 2023: Children (5 - 11 yrs)',
-       'Number of people the voucher is for pre 4th April 2023: Children (12 - 16 yrs)',
-       'Number of people the voucher is for pre 4th April 2023: Children (unknown age)',
-       'Number of people the voucher is for pre 4th April 2023: Adults (17 - 24 yrs)',
-       'Number of people the voucher is for pre 4th April 2023: Adults (25 - 64 yrs)',
-       'Number of people the voucher is for pre 4th April 2023: Adults (Over 65 yrs)',
-       'Number of people the voucher is for pre 4th April 2023: Adults (unknown age)',
-       'Number of people the voucher is for: Children (0 - 4 yrs)',
-       'Number of people the voucher is for: Children (5 - 11 yrs)',
-       'Number of people the voucher is for: Children (12 - 16 yrs)',
-       'Number of people the voucher is for: Children (not specified)',
-       'Number of people the voucher is for: Adults (17 - 24 yrs)',
-       'Number of people the voucher is for: Adults (25 - 34 yrs)',
-       'Number of people the voucher is for: Adults (35 - 44 yrs)',
-       'Number of people the voucher is for: Adults (45 - 54 yrs)',
-       'Number of people the voucher is for: Adults (55 - 64 yrs)',
-       'Number of people the voucher is for: Adults (65 - 74 yrs)',
-       'Number of people the voucher is for: Adults (75+ yrs)',
-       'Number of people the voucher is for: Adults (not specified)',
-       'Partner or spouse (usual household structure)',
-       'Parent or carer (usual household structure)',
-       'Partner or spouse (number of people the voucher is for)',
-       'Parent or carer (number of people the voucher is for)', 'Ward',
-       'Assigned food bank centre', 'Agency contact phone',
-       'Notes regarding parcel requirements',
-       'Reason for needing more than 3 vouchers in the last 6 months',
-       'Reason for needing more than 3 vouchers in the last 6 months - notes',
-       'Agency', 'Issued by', 'Delivery required', 'Collection/Delivery notes',
-       'Consent for holding information about dietary requirements',
-       'Dietary requirements', 'Client ID', 'Foodbank centre fulfilled at',
-       'Voucher status']
-
-def load_excel(uploaded_file, password=None):
-    """
-    Load the excel file into pd.dataframe
-
-    Parameters:
-        uploaded_file: The excel file to be transftered
-        password: the password for the excel
-    Returns:
-        tuple: A tuple containing:
-            - pd.DataFrame: The pd.DataFrame loaded
-            - bool: True if successfully loaded
-    """
-    try:
-        df = pd.read_excel(uploaded_file, engine='openpyxl')
-        df = df[column_headings]
-        return df, True  # Successfully loaded without password
-    except Exception:
-        try:
-            decrypted = io.BytesIO()
-            office_file = msoffcrypto.OfficeFile(uploaded_file)
-            office_file.load_key(password=password)
-            office_file.decrypt(decrypted)
-            decrypted.seek(0)
-            df = pd.read_excel(decrypted, engine='openpyxl')
-            df = df[column_headings]
-            return df, True  # Successfully loaded with password
-        except DecryptionError:
-            return None, False  # Failed to load due to decryption error
-
-
-@st.cache_data(show_spinner=False)
-def load_data(file, password=None):
-    df, success = load_excel(file, password=password)
-    if success:
-        return df, success
-    return None, success
-
 def ceildiv(a:int, b:int)->int:
     """
     Return int(ceiling(a/b))
     """
     return -(a // -b)
 
-@st.cache_data(show_spinner=False)
-def split_frame(input_df, rows):
-    df = [input_df.loc[i : i + rows - 1, :] for i in range(0, len(input_df), rows)]
-    return df
-
-def Individual_Client_Journey(df):
+def Individual_Client_Journey(df, clients):
     # Visualize individual client journey part
     st.subheader("Individual Client Journey")
     
@@ -142,8 +26,8 @@ def Individual_Client_Journey(df):
     min_date = df['date issued to client'].min()
     max_date = df['date issued to client'].max()
     
-    # Find the max number of voucher for the filter UI
-    max_num_vouchers = individual_journey_filter(df)[0]["Voucher Count"].max()
+    # Find the max number of voucher for the filter UI, precomputed by the client index
+    max_num_vouchers = clients.max_vouchers
 
     # UI for filtering
     st.sidebar.header("Filter Options")
@@ -165,24 +49,30 @@ def Individual_Client_Journey(df):
         help="Select the start and end dates to filter data."
     )
     
-    filtered_df, have_data = individual_journey_filter(df,
-                                                       min_voucher=min_vouchers, 
-                                                       max_voucher=max_vouchers, 
-                                                       start_date=start_date, 
-                                                       end_date=end_date)
+    journey = clients.select(min_voucher=min_vouchers, 
+                             max_voucher=max_vouchers, 
+                             start_date=start_date, 
+                             end_date=end_date)
     
-    if have_data == True:
+    if len(journey) > 0:
     
         top_menu = st.container()
+
+        # Clients are sorted on the chosen column before the visible page is sliced, only that page is formatted
+        sort_menu = st.columns((4, 1))
+        with sort_menu[0]:
+            sort_by = st.selectbox("Sort by", options=journey.columns, index=0)
+        with sort_menu[1]:
+            sort_direction = st.selectbox("Order", options=["Ascending", "Descending"], index=0)
         
         pagination = st.container()
 
         bottom_menu = st.columns((4, 1, 1))
         with bottom_menu[2]:
-            batch_size = st.number_input("Page Size", value = 10,step=1)
+            batch_size = st.number_input("Page Size", value = 10, min_value=1, step=1)
         with bottom_menu[1]:
             total_pages = (
-                ceildiv(len(filtered_df),batch_size) if int(len(filtered_df) / batch_size) > 0 else 1
+                ceildiv(len(journey),batch_size) if int(len(journey) / batch_size) > 0 else 1
             )
             current_page = st.number_input(
                 "Page", min_value=1, max_value=total_pages, step=1
@@ -190,15 +80,16 @@ def Individual_Client_Journey(df):
         with bottom_menu[0]:
             st.markdown(f"Page **{current_page}** of **{total_pages}** ")
 
-        pages = split_frame(filtered_df, batch_size)
-        pagination.dataframe(data=pages[current_page - 1], use_container_width=True)
+        page_df = journey.page(current_page, batch_size,
+                               sort_by=sort_by, ascending=sort_direction == "Ascending")
+        pagination.dataframe(data=page_df, use_container_width=True)
         
         first_data_index = (current_page-1) * batch_size+1
-        last_data_index = min(current_page * batch_size, filtered_df.shape[0])
+        last_data_index = min(current_page * batch_size, len(journey))
         top_menu.markdown(
                     f"""
                     <div style='text-align: right;'>
-                        Showing results <b>{first_data_index}</b> to <b>{last_data_index}</b> of <b>{filtered_df.shape[0]}</b>
+                        Showing results <b>{first_data_index}</b> to <b>{last_data_index}</b> of <b>{len(journey)}</b>
                         </div>
                     """,unsafe_allow_html=True)
     
@@ -206,48 +97,59 @@ def Individual_Client_Journey(df):
         st.write("No matching result")
 
 def plot_reason_timeline(df, date_col='date issued to client', reason_col='reason'):
-    # Ensure date column is in datetime format
-    df[date_col] = pd.to_datetime(df[date_col])
-
-    # Identify consecutive changes in the reason column
-    df['Group'] = (df[reason_col] != df[reason_col].shift()).cumsum()
-
-    # Aggregate to collect all dates for each reason period
-    timeline_df = df.groupby(['Group', reason_col]).agg(
-        Dates=(date_col, lambda x: sorted(list(x)))  # Collect all dates in sorted order
-    ).reset_index()
+    # Run-length encode the reason column: a new run starts wherever the reason changes
+    reasons = df[reason_col].to_numpy(dtype=object)
+    run_starts = np.ones(len(reasons), dtype=bool)
+    run_starts[1:] = reasons[1:] != reasons[:-1]
+    run = np.cumsum(run_starts) - 1
+
+    # Runs without a reason are left out, and each run lists its dates in sorted order
+    kept = np.flatnonzero(pd.notna(reasons))
+    dates = df[date_col].to_numpy()[kept]
+    order = np.lexsort((dates, run[kept]))
+    rows, dates = kept[order], dates[order]
+    run_id, run_sizes = np.unique(run[rows], return_counts=True)
+    # Number the kept runs from 0, so each one gets its own row of the plot
+    run_number = np.repeat(np.arange(len(run_id)), run_sizes)
+    run_first = np.cumsum(run_sizes) - run_sizes
+    run_reasons = reasons[rows[run_first]]
+    dates = pd.DatetimeIndex(dates)
+    day = pd.Series(dates.strftime('%Y-%m-%d'))
 
     with st.expander("Reason Timeline"):
-        # Display the timeline as text in Streamlit
+        # Display the timeline as one block of text, a line per run
         st.write("### Reason Timeline")
-        for _, row in timeline_df.iterrows():
-            dates = ", ".join(date.strftime('%Y-%m-%d') for date in row['Dates'])
-            st.write(f"{dates}: {row[reason_col]}")
-
-        # Plot the timeline using Plotly
-        fig = go.Figure()
-
-        for i, row in timeline_df.iterrows():
-            # Find the middle index of the period
-            middle_idx = len(row['Dates']) // 2
-
-            # Create the text array: only the middle date in the period gets the reason as text
-            text_array = [" "] * len(row['Dates'])
-            text_array[middle_idx] = row[reason_col]
-            
-            # Add a line for each reason period using the first and last dates
-            fig.add_trace(
-                go.Scatter(
-                    x=row['Dates'],
-                    y=[i] * len(row['Dates']),  # Keep y constant for each reason
-                    mode='lines+markers+text',
-                    name=row[reason_col],
-                    text=text_array,
-                    textposition="top center",
-                    line=dict(width=4),
-                    marker=dict(size=8),
-                )
+        run_dates = day.groupby(run_number, sort=True).agg(", ".join)
+        st.markdown("  \n".join(
+            f"{run_days}: {reason}" for run_days, reason in zip(run_dates, run_reasons)
+        ))
+
+        # Plot every run in one WebGL trace, with a gap after each run so the lines are not joined
+        position = np.arange(len(rows)) + run_number
+        x = np.full(len(rows) + len(run_id) - 1 if len(rows) else 0, None, dtype=object)
+        y = np.full(len(x), None, dtype=object)
+        text = np.full(len(x), " ", dtype=object)
+        x[position] = dates.astype(object)
+        y[position] = run_number
+        # Only the middle date of each run gets the reason as text
+        text[position[run_first + run_sizes // 2]] = run_reasons
+        # Colour each run's markers as its own trace used to be, the gaps are not drawn
+        colours = np.array(px.colors.qualitative.Plotly, dtype=object)
+        marker_colours = np.full(len(x), colours[0], dtype=object)
+        marker_colours[position] = colours[run_number % len(colours)]
+
+        fig = go.Figure(
+            go.Scattergl(
+                x=x,
+                y=y,
+                mode='lines+markers+text',
+                text=text,
+                textposition="top center",
+                line=dict(width=4),
+                marker=dict(size=8, color=marker_colours),
+                connectgaps=False,
             )
+        )
 
         # Format the timeline
         fig.update_layout(
@@ -265,7 +167,7 @@ def plot_reason_timeline(df, date_col='date issued to client', reason_col='reaso
 
 
 
-def Search_Client_History(df):
+def Search_Client_History(df, search, clients):
     st.title("Search Client History")
     
     # Input fields for searching client history
@@ -284,31 +186,39 @@ def Search_Client_History(df):
 )
     
     # Proceed if there is input for client ID or name
-    if client_id or (first_name and last_name):
-        filtered_df = df
+    name = " ".join(part for part in (first_name, last_name) if part)
+    if client_id or name:
+        # Look the rows up in the client search index rather than scanning the view
+        rows = None
         if client_id:
-            if client_id.isdigit():
-                filtered_df = filtered_df[filtered_df['client id'] == int(client_id)]
-            else:
-                st.write("History data not found")
-        if first_name and last_name:
-            filtered_df = filtered_df[
-                (filtered_df['first name'].str.lower() == first_name.lower()) & 
-                (filtered_df['last name'].str.lower() == last_name.lower())
-            ]             
+            rows = search.rows_for_client(int(client_id)) if client_id.isdigit() else np.array([], dtype=np.int64)
+        name_rows = search.rows_for_name(name) if first_name and last_name else None
+        if name and not client_id and (name_rows is None or len(name_rows) == 0):
+            # No exact match yet, offer names completing or close to what was typed
+            suggestion = st.selectbox(
+                "Did you mean",
+                options=search.suggest(name),
+                index=None,
+                placeholder="Choose a client",
+            )
+            if suggestion:
+                name_rows = search.rows_for_name(suggestion)
+        if name_rows is not None:
+            rows = name_rows if rows is None else np.intersect1d(rows, name_rows)
+        filtered_df = df.iloc[rows] if rows is not None else df.iloc[:0]
 
         if not filtered_df.empty:
+            # Work on a copy so the shared session dataset is left untouched
+            filtered_df = filtered_df.copy()
             client_first_name = filtered_df['first name'].dropna().values[0]
             client_last_name = filtered_df['last name'].dropna().values[0]
             target_date = pd.to_datetime('2023-04-04')
              
-            filtered_df["created at_origin"] = pd.to_datetime(filtered_df["created at"])
-            filtered_df['date issued to client'] = pd.to_datetime(filtered_df['date issued to client'])
-            filtered_df['fulfilled date'] = pd.to_datetime(filtered_df['fulfilled date'])
+            # Dates were parsed once when the voucher view was cleaned
             sort_ascending = sort_order == "Ascending"
             filtered_df = filtered_df.sort_values(by="date issued to client", ascending=sort_ascending)
             filtered_df['reason'] = np.where(
-                filtered_df['created at_origin'] < target_date, 
+                filtered_df['created at'] < target_date, 
                 filtered_df['crisis type'], 
                 filtered_df['reasons for referral']
             )
@@ -320,11 +230,25 @@ def Search_Client_History(df):
                         
             st.subheader(f"{client_first_name} {client_last_name}")
             st.write(f"**Client ID**: {filtered_df['client id'].unique()[0]}")
-            if filtered_df["birth year"].dropna().unique():
-                st.write(f"**Birth Year**: {int(filtered_df['birth year'].unique()[0])}")
+            birth_years = filtered_df["birth year"].dropna().unique()
+            if len(birth_years):
+                st.write(f"**Birth Year**: {int(birth_years[0])}")
             else:
                 st.write(f"**Birth Year**: NaN")
             st.write(f"**Voucher Count**: {filtered_df.shape[0]}")
+            # Return pattern from the per-client summary, when the search found a single client
+            summary = clients[clients["client id"].isin(filtered_df["client id"].unique())]
+            if len(summary) == 1:
+                summary = summary.iloc[0]
+                st.write(f"**First Visit**: {summary['first visit'].date()}")
+                st.write(f"**Last Visit**: {summary['last visit'].date()}")
+                if pd.notna(summary["median gap days"]):
+                    st.write(f"**Median Days Between Vouchers**: {summary['median gap days']:g}")
+            # Other client IDs resolved to the same household
+            household_clients = df.loc[df[HOUSEHOLD_ID].isin(filtered_df[HOUSEHOLD_ID].unique()), "client id"].dropna().unique()
+            other_clients = sorted(set(household_clients) - set(filtered_df["client id"].dropna().unique()))
+            if other_clients:
+                st.write(f"**Same Household as Client IDs**: {', '.join(str(int(client)) for client in other_clients)}")
             
             x = address_list.unique()
             address_text = ', '.join(x[x != ''].astype(str))
@@ -338,48 +262,23 @@ def Search_Client_History(df):
             
             st.write("---")
             
-            for index, row in filtered_df.iterrows():
-                # Display the date
-                st.write(f"**Date Issued to Client:** {row['date issued to client'].date()}")
-                
-                if row["created at_origin"] < target_date:
-                    st.write(f"**Crisis Type:** {row['crisis type']}")
-                else:
-                    st.write(f"**Reasons for referral:** {row['reasons for referral']}")
-                st.write(f"**Agency:** {row['agency']}")
-                st.write(f"**Issued by:** {row['issued by']}")
-                st.write(f"**Foodbank Centre Fulfilled at:** {row['foodbank centre fulfilled at']}")
-                
-                # Add a separator
-                st.write("---")
+            # One virtualised table for the whole history, so heavy clients render as fast as new ones
+            history_df = pd.DataFrame({
+                "Date Issued to Client": filtered_df['date issued to client'].dt.strftime('%Y-%m-%d'),
+                "Crisis Type / Reasons for referral": filtered_df['reason'],
+                "Agency": filtered_df['agency'],
+                "Issued by": filtered_df['issued by'],
+                "Foodbank Centre Fulfilled at": filtered_df['foodbank centre fulfilled at'],
+            })
+            st.dataframe(history_df, hide_index=True, use_container_width=True)
         else:
             st.write("History data not found")
 
-# File uploader for Excel files
-uploaded_file = st.file_uploader("Upload your Excel file", type="xlsx")
-
-# Check if a file is uploaded
-if uploaded_file:
-    # Attempt to load data without a password
-    df, success = load_excel(uploaded_file)
-
-    if not success:
-        # Prompt for a password if the initial load failed
-        password = st.text_input("Enter the password for the Excel file", type="password")
-        if password:
-            df, success = load_excel(uploaded_file, password=password)
-            if not success: 
-                st.error("Failed to load the file. Please check the password or file format.")
-
-    if success:
-        # Clean and store data in session state
-        df_cleaned = clean_data(df)
-        st.session_state["df"] = df_cleaned
-        st.success("File uploaded and cleaned successfully!")
+dataset = upload_dataset()
 
 # Check if data exists in session state
-if "df" in st.session_state:
-    Individual_Client_Journey(st.session_state["df"])
-    Search_Client_History(st.session_state["df"])
+if dataset is not None:
+    Individual_Client_Journey(dataset.view("voucher"), client_index(dataset))
+    Search_Client_History(with_households(dataset, "voucher"), client_search(dataset), dataset.view("clients"))
 else:
     st.write("Please upload a file to start.")
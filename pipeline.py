@@ -0,0 +1,49 @@
+import dbclean
+import dbclean_1
+from profiler import step
+
+# Cleaning stages by name: (the stage it reads from, the function that builds it).
+# "raw" is the parsed workbook; "base" is the cleaning shared by every view, and each view branches off it.
+STAGES = {
+    "base": ("raw", dbclean_1.clean_base),
+    "voucher": ("base", dbclean_1.clean_voucher),
+    "geo": ("base", dbclean.clean_geo),
+}
+
+
+class Pipeline:
+    """
+    Runs the named cleaning stages over one raw frame, keeping each stage's output.
+
+    Asking for a view runs only the stages it still needs, so building the geo view after
+    the voucher view reuses the shared base. An intermediate stage is released once every
+    stage that reads from it has been built.
+    """
+
+    def __init__(self, load_raw):
+        """
+        Parameters:
+            load_raw: Callable returning the raw DataFrame, called only when a stage needs it
+        """
+        self.load_raw = load_raw
+        self.results = {}
+
+    def run(self, name: str):
+        """
+        Return the output of the named stage, running it and the stages before it if needed
+        """
+        if name == "raw":
+            return self.load_raw()
+        if name not in self.results:
+            source, stage = STAGES[name]
+            df = self.run(source)
+            with step(name, df) as record:
+                self.results[name] = stage(df)
+                record["rows_out"] = len(self.results[name])
+            self._release(source)
+        return self.results[name]
+
+    def _release(self, name: str):
+        readers = [stage for stage, (source, _) in STAGES.items() if source == name]
+        if all(reader in self.results for reader in readers):
+            self.results.pop(name, None)
@@ -0,0 +1,171 @@
+"""
+Run ingest and cleaning on a workbook without the dashboard, filling the on-disk cache of cleaned views.
+
+    python precompute.py vouchers.xlsx --password ...
+
+Every view the pages use is built and cached, so the dashboard opens the same file
+without cleaning it again. With --output, the aggregates the pages show are also
+written as CSV for use outside the dashboard, which does not read them:
+
+    python precompute.py vouchers.xlsx --output aggregates --postcodes postcodes.csv --wards wards.csv
+
+Aggregates cover every voucher, with the dashboard's default filters.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+import pandas as pd
+
+from aggregates import geo_locate, historical_voucher_counts, postcode_counts, ward_population
+from cache import DatasetCache, cleaning_version
+from dbclean_1 import individual_journey_filter
+from identity import HOUSEHOLD_ID, with_households
+from ingest import VIEWS, Dataset, load_dataset
+from queries import make_queries, monthly_voucher_counts
+from store import STORE_DIR, StoreDataset, VoucherStore
+
+
+def crisis_aggregates(voucher_df: pd.DataFrame) -> dict:
+    """
+    Return the Crisis Analysis charts' data, for every crisis type and the whole date range
+
+    The voucher frame needs its household ids, see identity.with_households.
+    """
+    queries = make_queries(voucher_df)
+    filtered = queries.where(queries.crisis_types(), *queries.date_range())
+    return {
+        "voucher_usage": filtered.voucher_usage(),
+        "household_usage": filtered.voucher_usage(by=HOUSEHOLD_ID),
+        "return_gaps": filtered.return_gaps(),
+        "crisis_summary": filtered.crisis_summary(),
+        "secondary_crisis_summary": filtered.secondary_crisis_summary(),
+        "reason_counts": filtered.reason_counts(),
+        "secondary_crisis_cooccurrence": filtered.secondary_crisis_cooccurrence().rename_axis("secondary crisis").reset_index(),
+        "requests_over_time": filtered.requests_over_time(),
+        "location_summary": filtered.location_summary(),
+    }
+
+
+def geo_aggregates(geo_df: pd.DataFrame, df_postcodes: pd.DataFrame = None, df_wards: pd.DataFrame = None) -> dict:
+    """
+    Return the Geographical Analysis charts' data for every food bank
+
+    Without a postcode lookup the vouchers are counted unlocated, and without a ward
+    population table the per-capita table is left out.
+    """
+    if df_postcodes is not None:
+        geo_df = geo_locate(geo_df, df_postcodes)
+    foodbanks = sorted(geo_df["assigned food bank centre"].dropna().unique())
+    aggregates = {
+        "monthly_voucher_counts": monthly_voucher_counts(geo_df, foodbanks),
+        "historical_voucher_counts": historical_voucher_counts(geo_df, foodbanks),
+        "postcode_counts": postcode_counts(geo_df),
+    }
+    if df_wards is not None:
+        aggregates["ward_per_capita"] = ward_population(geo_df, df_wards)
+    return aggregates
+
+
+def journey_aggregates(dataset: Dataset) -> dict:
+    """
+    Return the Individual Client Journey table and the return pattern summary of every client
+    """
+    client_journey, _ = individual_journey_filter(dataset.view("voucher"))
+    return {
+        "client_journey": client_journey if client_journey is not None else pd.DataFrame(),
+        "client_summary": dataset.view("clients"),
+    }
+
+
+def precompute(dataset: Dataset, df_postcodes: pd.DataFrame = None, df_wards: pd.DataFrame = None) -> dict:
+    """
+    Return every aggregate of the dashboard pages, by name
+
+    Parameters:
+        dataset (Dataset): The loaded workbook
+        df_postcodes (pd.DataFrame): Optional postcode lookup with "postcode", "latitude" and "longitude"
+        df_wards (pd.DataFrame): Optional ward population table
+    Returns:
+        dict: Aggregate name -> DataFrame
+    """
+    return {
+        **crisis_aggregates(with_households(dataset, "voucher")),
+        **geo_aggregates(dataset.view("geo"), df_postcodes, df_wards),
+        **journey_aggregates(dataset),
+    }
+
+
+def warm_views(dataset: Dataset) -> dict:
+    """
+    Build every cleaned view the pages use, writing each to the dataset's on-disk cache
+
+    Returns:
+        dict: View name -> number of rows
+    """
+    return {name: len(dataset.view(name)) for name in VIEWS}
+
+
+def write_aggregates(aggregates: dict, output_dir: str, key: str):
+    """
+    Write each aggregate to <output_dir>/<name>.csv, with a manifest.json describing the run
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    for name, df in aggregates.items():
+        df.to_csv(os.path.join(output_dir, f"{name}.csv"), index=False)
+    manifest = {
+        "workbook": key,
+        "cleaning_version": cleaning_version(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "rows": {name: len(df) for name, df in aggregates.items()},
+    }
+    with open(os.path.join(output_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Clean a voucher export ahead of the dashboard and cache its views.")
+    parser.add_argument("workbook", help="The exported voucher workbook (.xlsx)")
+    parser.add_argument("--password", help="Password of an encrypted workbook")
+    parser.add_argument("--output", help="Directory to also write the pages' aggregates to, as CSV")
+    parser.add_argument("--postcodes", help="CSV of postcode, latitude and longitude, to locate vouchers")
+    parser.add_argument("--wards", help="CSV of the ward population table, for the per-capita table")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or fill the on-disk cache of cleaned views")
+    parser.add_argument("--append", action="store_true",
+                        help="Append the workbook to the voucher store and aggregate the stored history")
+    args = parser.parse_args(argv)
+    if args.no_cache and not args.output:
+        parser.error("--no-cache leaves nothing to do without --output")
+
+    with open(args.workbook, "rb") as f:
+        data = f.read()
+    dataset, success = load_dataset(data, password=args.password, cache=None if args.no_cache else DatasetCache())
+    if not success:
+        print(f"Failed to load {args.workbook}. Please check the password or file format.", file=sys.stderr)
+        return 1
+
+    if args.append:
+        if not STORE_DIR:
+            parser.error("--append needs the voucher store, set FOODBANK_STORE_DIR to its directory")
+        store = VoucherStore(STORE_DIR)
+        added = store.append(dataset.key, dataset.raw)
+        print(f"Appended {added:,} new vouchers to the voucher store")
+        dataset = StoreDataset(store)
+
+    if dataset.cache is not None:
+        rows = warm_views(dataset)
+        print(f"Cached {len(rows)} views of {args.workbook}: " + ", ".join(f"{name} ({n:,} rows)" for name, n in rows.items()))
+
+    if args.output:
+        df_postcodes = pd.read_csv(args.postcodes) if args.postcodes else None
+        df_wards = pd.read_csv(args.wards) if args.wards else None
+        aggregates = precompute(dataset, df_postcodes, df_wards)
+        write_aggregates(aggregates, args.output, dataset.key)
+        print(f"Wrote {len(aggregates)} aggregates to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import contextvars
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+# JSON-lines file each profiled load is appended to, empty to turn the log off
+PROFILE_LOG = os.environ.get(
+    "FOODBANK_PROFILE_LOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "profile.jsonl")
+)
+
+# Fields of each step record, in the order the diagnostics panel shows them. The frame sizes are
+# only recorded by steps that measure the deep memory of their input and output frames
+STEP_COLUMNS = ["step", "calls", "seconds", "rows_in", "rows_out", "memory_delta_mb", "frame_mb_in", "frame_mb_out"]
+# Fields a step adds up over its calls
+SUMMED_FIELDS = ["calls", "seconds", "rows_in", "rows_out", "memory_delta_mb", "frame_mb_in", "frame_mb_out"]
+
+# The profiler collecting steps in this thread, and the path of the step being run
+_current = contextvars.ContextVar("profiler", default=None)
+
+
+def _rss_bytes() -> int:
+    """
+    Return the resident memory of this process, or None where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Profiler:
+    """
+    Wall time, rows in and out, and memory change of each named step of loading and cleaning one workbook.
+
+    Steps are recorded with `step` while the profiler is active, nested steps are keyed by
+    their path ("voucher view > base > drop_duplicates"), and a step that runs more than
+    once (e.g. once per streamed batch) adds up into a single record.
+    """
+
+    def __init__(self, key: str = None, log_path: str = PROFILE_LOG):
+        self.key = key
+        self.log_path = log_path
+        self.steps = {}  # path -> record, in the order the steps first started
+
+    @contextmanager
+    def activate(self):
+        """
+        Record the steps run inside the block, and append them to the log when it ends
+        """
+        current = _current.get()
+        if current is not None and current[0] is self:
+            yield self  # Already active further up the stack
+            return
+        before = {path: dict(record) for path, record in self.steps.items()}
+        token = _current.set((self, ()))
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+            self._write_log(before)
+
+    def frame(self) -> pd.DataFrame:
+        """
+        Return every step recorded so far, one row per step
+        """
+        return pd.DataFrame(list(self.steps.values()), columns=STEP_COLUMNS)
+
+    def _write_log(self, before: dict):
+        if not self.log_path:
+            return
+        lines = []
+        now = datetime.now().isoformat(timespec="seconds")
+        for path, record in self.steps.items():
+            previous = before.get(path, {})
+            if record["calls"] == previous.get("calls", 0):
+                continue
+            entry = {"time": now, "workbook": self.key, "step": record["step"]}
+            for field in SUMMED_FIELDS:
+                value = record[field]
+                if value is not None and previous.get(field) is not None:
+                    value -= previous[field]
+                entry[field] = round(value, 4) if isinstance(value, float) else value
+            lines.append(json.dumps(entry))
+        if not lines:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError:
+            pass  # Diagnostics must never fail an upload
+
+
+@contextmanager
+def step(name: str, df: pd.DataFrame = None):
+    """
+    Time a step of loading or cleaning, when a profiler is active
+
+    Set "rows_out" on the yielded dict to record the rows the step produced.
+
+    Parameters:
+        name (str): The step name, shown in the diagnostics panel
+        df (pd.DataFrame): Optional input of the step, to record the rows in
+    """
+    current = _current.get()
+    result = {}
+    if current is None:
+        yield result
+        return
+    profiler, path = current
+    path = path + (name,)
+    record = profiler.steps.setdefault(path, {
+        "step": " > ".join(path), "calls": 0, "seconds": 0.0, "rows_in": None, "rows_out": None,
+        "memory_delta_mb": None, "frame_mb_in": None, "frame_mb_out": None,
+    })
+    token = _current.set((profiler, path))
+    rss_before = _rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        seconds = time.perf_counter() - start
+        rss_after = _rss_bytes()
+        _current.reset(token)
+        record["calls"] += 1
+        record["seconds"] += seconds
+        if df is not None:
+            record["rows_in"] = (record["rows_in"] or 0) + len(df)
+        for field in ["rows_out", "frame_mb_in", "frame_mb_out"]:
+            if result.get(field) is not None:
+                record[field] = (record[field] or 0) + result[field]
+        if rss_before is not None and rss_after is not None:
+            record["memory_delta_mb"] = (record["memory_delta_mb"] or 0.0) + (rss_after - rss_before) / 1024 ** 2
@@ -0,0 +1,427 @@
+import os
+import threading
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from dbclean_1 import reason_counts, voucher_gaps
+from identity import HOUSEHOLD_ID, with_households
+from schema import SECONDARY_CRISIS_BITS, SECONDARY_CRISIS_COLUMNS, month_starts
+
+# "duckdb" or "pandas", the pandas engine answers the same queries and is the reference the DuckDB one is tested against
+QUERY_ENGINE = os.environ.get("FOODBANK_QUERY_ENGINE", "duckdb")
+
+# Columns of the voucher view the crisis dashboard filters and groups by
+QUERY_COLUMNS = [
+    "client id", "crisis type", "date issued to client", "date issued to client: month", "source of income", "town",
+    "county", "reasons for referral", SECONDARY_CRISIS_BITS, HOUSEHOLD_ID,
+]
+
+
+SECONDARY_CRISES = [column.split(": ", 1)[1] for column in SECONDARY_CRISIS_COLUMNS]
+
+
+def _crisis_flags(bits: np.ndarray) -> np.ndarray:
+    """
+    Unpack secondary crisis bitmasks into a 0/1 matrix with one column per secondary crisis
+    """
+    return (bits.astype(np.int64)[:, None] >> np.arange(len(SECONDARY_CRISIS_COLUMNS))) & 1
+
+
+def _secondary_crisis_summary(bits: np.ndarray, counts: np.ndarray) -> pd.DataFrame:
+    """
+    Turn the number of vouchers of each distinct bitmask into the chart frame, most frequent first
+    """
+    per_crisis = pd.Series(counts @ _crisis_flags(bits), index=SECONDARY_CRISES)
+    per_crisis = per_crisis[per_crisis > 0].sort_values(ascending=False, kind="stable")
+    return pd.DataFrame({"secondary crisis": per_crisis.index, "count": per_crisis.to_numpy(dtype="int64")})
+
+
+def _secondary_crisis_cooccurrence(bits: np.ndarray, counts: np.ndarray) -> pd.DataFrame:
+    """
+    Turn the number of vouchers of each distinct bitmask into a crisis by crisis matrix of vouchers naming both
+    """
+    flags = _crisis_flags(bits)
+    matrix = flags.T @ (flags * counts[:, None])
+    return pd.DataFrame(matrix.astype("int64"), index=SECONDARY_CRISES, columns=SECONDARY_CRISES)
+
+
+class FilterIndex:
+    """
+    The rows of the voucher frame in issue date order, with a bitmap of the rows holding each value of a column.
+
+    A date range is a slice of the date order found with searchsorted, and the categorical
+    filters are ANDs and ORs of the bitmaps over that slice only. Bitmaps are packed eight
+    rows to a byte and built for every value of a column the first time it is filtered on.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        """
+        Parameters:
+            df (pd.DataFrame): The voucher frame, its rows are referred to by position
+        """
+        self.df = df
+        # Missing dates are the smallest int64, so they sort first and fall outside every date range
+        issued = df["date issued to client"].to_numpy(dtype="datetime64[ns]").view("int64")
+        self.order = np.argsort(issued, kind="stable")
+        self.dates = issued[self.order]
+        self.bitmaps = {}
+
+    def bitmap(self, column: str, value) -> np.ndarray:
+        """
+        Return the packed bitmap, in date order, of the rows whose column holds the value (all zeros if none do)
+        """
+        if column not in self.bitmaps:
+            codes, values = pd.factorize(self.df[column])
+            codes = codes[self.order]
+            self.bitmaps[column] = {value: np.packbits(codes == code) for code, value in enumerate(values)}
+        bitmap = self.bitmaps[column].get(value)
+        return bitmap if bitmap is not None else np.zeros(-(-len(self.order) // 8), dtype=np.uint8)
+
+    def select(self, crisis_types: list, start_date, end_date) -> np.ndarray:
+        """
+        Return the positions, in frame order, of the rows PandasQueries.where keeps
+        """
+        low = np.searchsorted(self.dates, pd.Timestamp(start_date).value, side="left")
+        high = np.searchsorted(self.dates, pd.Timestamp(end_date).value, side="right")
+        if low >= high:
+            return np.array([], dtype=np.int64)
+        # Whole bytes covering the date range, the bits either side of it are dropped after unpacking
+        first, last = low // 8, -(-high // 8)
+        bits = np.zeros(last - first, dtype=np.uint8)
+        for crisis_type in crisis_types:
+            bits |= self.bitmap("crisis type", crisis_type)[first:last]
+        bits &= ~self.bitmap("source of income", "Unknown")[first:last]
+        bits &= ~self.bitmap("county", "Unknown")[first:last]
+        selected = np.flatnonzero(np.unpackbits(bits)[low - first * 8:high - first * 8]) + low
+        return np.sort(self.order[selected])
+
+
+class PandasQueries:
+    """
+    Filters and aggregations of the crisis dashboard, computed on the voucher frame with pandas.
+
+    `where` returns a new object over the filtered rows, found with a FilterIndex built once
+    over the whole frame. The filtered rows are only gathered, and only in QUERY_COLUMNS,
+    when an aggregate needs them; each aggregate returns the small frame a chart needs.
+    """
+
+    def __init__(self, df: pd.DataFrame, index: FilterIndex = None, positions: np.ndarray = None):
+        """
+        Parameters:
+            df (pd.DataFrame): The voucher frame
+            index (FilterIndex): The frame's filter index, built on the first `where` if not given
+            positions (np.ndarray): Positions of the filtered rows in the frame, None for every row
+        """
+        self.source = df
+        self.index = index
+        self.positions = positions
+        self._df = None
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """
+        The filtered vouchers' QUERY_COLUMNS, or the whole frame before filtering
+        """
+        if self._df is None:
+            self._df = self.source if self.positions is None else self.source[QUERY_COLUMNS].iloc[self.positions]
+        return self._df
+
+    def crisis_types(self) -> list:
+        """
+        Return the crisis types in order of first appearance
+        """
+        return self.df["crisis type"].dropna().unique().tolist()
+
+    def date_range(self) -> tuple:
+        return self.df["date issued to client"].min(), self.df["date issued to client"].max()
+
+    def rows(self) -> pd.DataFrame:
+        """
+        Return every column of the filtered vouchers
+        """
+        return self.source if self.positions is None else self.source.iloc[self.positions]
+
+    def where(self, crisis_types: list, start_date, end_date):
+        """
+        Keep the vouchers of the selected crisis types issued between the dates, with a known source of income and county
+        """
+        if self.index is None:
+            self.index = FilterIndex(self.source)
+        positions = self.index.select(crisis_types, start_date, end_date)
+        if self.positions is not None:
+            positions = np.intersect1d(self.positions, positions, assume_unique=True)
+        return PandasQueries(self.source, self.index, positions)
+
+    def voucher_usage(self, by: str = "client id") -> pd.DataFrame:
+        """
+        Return the number of vouchers of each client, or of each household when `by` is "household id"
+
+        Most vouchers come first, and clients or households with the same count are in id order.
+        """
+        voucher_usage = self.df[by].value_counts(sort=False).reset_index()
+        voucher_usage.columns = [by, "voucher count"]
+        return voucher_usage.sort_values(["voucher count", by], ascending=[False, True], ignore_index=True)
+
+    def return_gaps(self) -> pd.DataFrame:
+        """
+        Return the median days between the vouchers of each client with more than one, in client id order
+        """
+        gaps = voucher_gaps(self.df[["client id", "date issued to client"]])
+        median = gaps.groupby("client id", sort=True)["gap"].median().dropna()
+        return median.rename("median gap days").reset_index()
+
+    def crisis_summary(self) -> pd.DataFrame:
+        """
+        Return the number of vouchers of each crisis type
+        """
+        df = self.df.dropna(subset=["client id"])
+        return df.groupby("crisis type", observed=True).size().reset_index(name="voucher count")
+
+    def _secondary_crisis_bits(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Return each distinct secondary crisis bitmask and its number of vouchers
+        """
+        histogram = np.bincount(self.df[SECONDARY_CRISIS_BITS].to_numpy(), minlength=1)
+        bits = np.flatnonzero(histogram)
+        return bits, histogram[bits]
+
+    def secondary_crisis_summary(self) -> pd.DataFrame:
+        """
+        Return how many vouchers name each secondary crisis, leaving out those never named
+        """
+        return _secondary_crisis_summary(*self._secondary_crisis_bits())
+
+    def secondary_crisis_cooccurrence(self) -> pd.DataFrame:
+        """
+        Return how many vouchers name each pair of secondary crises, with each crisis's own count on the diagonal
+        """
+        return _secondary_crisis_cooccurrence(*self._secondary_crisis_bits())
+
+    def reason_counts(self) -> pd.DataFrame:
+        """
+        Return how many vouchers name each reason for referral, most named first
+        """
+        codes, values = pd.factorize(self.df["reasons for referral"])
+        return reason_counts(values, np.bincount(codes[codes >= 0], minlength=len(values)))
+
+    def requests_over_time(self) -> pd.DataFrame:
+        """
+        Return the number of vouchers issued in each month, dated on the first of the month
+        """
+        counts = self.df.groupby("date issued to client: month").size()
+        return pd.DataFrame({
+            "date issued to client": month_starts(counts.index),
+            "voucher count": counts.to_numpy(dtype="int64"),
+        })
+
+    def location_summary(self) -> pd.DataFrame:
+        """
+        Return the number of vouchers of each town and county, most vouchers first
+        """
+        df = self.df.dropna(subset=["client id"])
+        location_summary = df.groupby(["town", "county"], observed=True).size().reset_index(name="voucher count")
+        return location_summary.sort_values(by="voucher count", ascending=False, kind="stable")
+
+
+class DuckDBQueries:
+    """
+    The same filters and aggregations as PandasQueries, compiled to SQL over an in-process DuckDB connection.
+
+    The columns the dashboard uses are handed to DuckDB as an Arrow table, so the queries
+    run multi-threaded and only the aggregated rows come back to pandas. The table is in
+    issue date order, so the vouchers of a date range sit together in a few record batches
+    for DuckDB's pushed-down date filter, rather than spread over every batch.
+    """
+
+    def __init__(self, df: pd.DataFrame, connection=None, lock: threading.Lock = None, where: str = "TRUE",
+                 params: list = None):
+        if connection is None:
+            order = np.argsort(df["date issued to client"].to_numpy(dtype="datetime64[ns]"), kind="stable")
+            table = pa.Table.from_pandas(df[QUERY_COLUMNS], preserve_index=False).take(pa.array(order))
+            # Row numbers are positions in the frame, so ordering by them gives the order of first appearance pandas would
+            table = table.append_column("row_number", pa.array(order))
+            connection = duckdb.connect()
+            connection.register("vouchers", table)
+            lock = threading.Lock()
+        self.df = df
+        self.connection = connection
+        self.lock = lock
+        self.clause = where
+        self.params = params or []
+
+    def _query(self, sql: str, params: list = None) -> pd.DataFrame:
+        # One connection serves every rerun of the session, queries take turns on it
+        with self.lock:
+            return self.connection.execute(sql, self.params + (params or [])).df()
+
+    def crisis_types(self) -> list:
+        return self._query(
+            f'''SELECT "crisis type"::VARCHAR AS "crisis type" FROM vouchers
+            WHERE ({self.clause}) AND "crisis type" IS NOT NULL
+            GROUP BY 1 ORDER BY min(row_number)'''
+        )["crisis type"].tolist()
+
+    def date_range(self) -> tuple:
+        dates = self._query(
+            f'SELECT min("date issued to client") AS first, max("date issued to client") AS last '
+            f'FROM vouchers WHERE {self.clause}'
+        )
+        return pd.Timestamp(dates["first"][0]), pd.Timestamp(dates["last"][0])
+
+    def where(self, crisis_types: list, start_date, end_date):
+        if not crisis_types:
+            return DuckDBQueries(self.df, self.connection, self.lock, "FALSE")
+        clause = f'''({self.clause})
+            AND list_contains(?, "crisis type"::VARCHAR)
+            AND "date issued to client" BETWEEN ? AND ?
+            AND "source of income" IS DISTINCT FROM 'Unknown'
+            AND "county" IS DISTINCT FROM 'Unknown'
+        '''
+        params = [list(crisis_types), pd.to_datetime(start_date), pd.to_datetime(end_date)]
+        return DuckDBQueries(self.df, self.connection, self.lock, clause, self.params + params)
+
+    def rows(self) -> pd.DataFrame:
+        row_numbers = self._query(f"SELECT row_number FROM vouchers WHERE {self.clause} ORDER BY row_number")
+        return self.df.iloc[row_numbers["row_number"].to_numpy()]
+
+    def voucher_usage(self, by: str = "client id") -> pd.DataFrame:
+        if by not in ("client id", HOUSEHOLD_ID):
+            raise ValueError(f"Cannot count vouchers by {by!r}")
+        return self._query(
+            f'''SELECT "{by}", count(*) AS "voucher count" FROM vouchers
+            WHERE ({self.clause}) AND "{by}" IS NOT NULL
+            GROUP BY "{by}" ORDER BY "voucher count" DESC, "{by}"'''
+        )
+
+    def return_gaps(self) -> pd.DataFrame:
+        # Whole days since the client's previous voucher, as pandas' Timedelta.days counts them
+        return self._query(
+            f'''SELECT "client id", median(gap) AS "median gap days" FROM (
+                SELECT "client id", floor(epoch("date issued to client" - lag("date issued to client") OVER (
+                    PARTITION BY "client id" ORDER BY "date issued to client")) / 86400) AS gap
+                FROM vouchers WHERE ({self.clause}) AND "client id" IS NOT NULL
+            ) WHERE gap IS NOT NULL GROUP BY 1 ORDER BY 1'''
+        )
+
+    def crisis_summary(self) -> pd.DataFrame:
+        return self._query(
+            f'''SELECT "crisis type"::VARCHAR AS "crisis type", count(*) AS "voucher count" FROM vouchers
+            WHERE ({self.clause}) AND "crisis type" IS NOT NULL AND "client id" IS NOT NULL
+            GROUP BY 1 ORDER BY 1'''
+        )
+
+    def _secondary_crisis_bits(self) -> tuple[np.ndarray, np.ndarray]:
+        histogram = self._query(
+            f'SELECT "{SECONDARY_CRISIS_BITS}" AS bits, count(*) AS vouchers FROM vouchers WHERE {self.clause} GROUP BY 1'
+        )
+        return histogram["bits"].to_numpy(), histogram["vouchers"].to_numpy()
+
+    def secondary_crisis_summary(self) -> pd.DataFrame:
+        return _secondary_crisis_summary(*self._secondary_crisis_bits())
+
+    def secondary_crisis_cooccurrence(self) -> pd.DataFrame:
+        return _secondary_crisis_cooccurrence(*self._secondary_crisis_bits())
+
+    def reason_counts(self) -> pd.DataFrame:
+        counts = self._query(
+            f'''SELECT "reasons for referral"::VARCHAR AS reasons, count(*) AS vouchers FROM vouchers
+            WHERE ({self.clause}) AND "reasons for referral" IS NOT NULL
+            GROUP BY 1 ORDER BY min(row_number)'''
+        )
+        return reason_counts(counts["reasons"], counts["vouchers"].to_numpy())
+
+    def requests_over_time(self) -> pd.DataFrame:
+        counts = self._query(
+            f'''SELECT "date issued to client: month" AS month, count(*) AS "voucher count"
+            FROM vouchers WHERE ({self.clause}) AND "date issued to client: month" IS NOT NULL
+            GROUP BY 1 ORDER BY 1'''
+        )
+        return pd.DataFrame({
+            "date issued to client": month_starts(counts["month"]),
+            "voucher count": counts["voucher count"].to_numpy(dtype="int64"),
+        })
+
+    def location_summary(self) -> pd.DataFrame:
+        return self._query(
+            f'''SELECT "town"::VARCHAR AS "town", "county"::VARCHAR AS "county", count(*) AS "voucher count"
+            FROM vouchers
+            WHERE ({self.clause}) AND "town" IS NOT NULL AND "county" IS NOT NULL AND "client id" IS NOT NULL
+            GROUP BY 1, 2 ORDER BY "voucher count" DESC, 1, 2'''
+        )
+
+
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def monthly_voucher_counts(df: pd.DataFrame, foodbanks: list) -> pd.DataFrame:
+    """
+    Count the vouchers created in each calendar month, per selected food bank and for all food banks
+
+    Every month appears for every food bank in the selection, with a count of 0 where none were created.
+
+    Parameters:
+        df (pd.DataFrame): The filtered geo view
+        foodbanks (list): The food bank centres to count separately
+    Returns:
+        pd.DataFrame: "assigned food bank centre", "month_name" (ordered Jan to Dec) and "voucher_count",
+        with the "All Foodbanks" rows last
+    """
+    centre = "assigned food bank centre"
+    month = df["created at: month of year"]
+    if QUERY_ENGINE == "duckdb":
+        connection = duckdb.connect()
+        connection.register("geo", pd.DataFrame({"centre": df[centre].to_numpy(), "month": month.array}))
+        foodbanks_clause = "list_contains(?, centre)" if foodbanks else "FALSE"
+        counts = connection.execute(f'''
+            WITH months AS (SELECT range + 1 AS month FROM range(12)),
+            filtered AS (SELECT centre, month FROM geo WHERE {foodbanks_clause}),
+            centres AS (SELECT DISTINCT centre FROM filtered WHERE centre IS NOT NULL),
+            per_centre AS (
+                SELECT centres.centre, months.month, count(filtered.month) AS voucher_count
+                FROM centres CROSS JOIN months
+                LEFT JOIN filtered ON filtered.centre = centres.centre AND filtered.month = months.month
+                GROUP BY ALL
+            ),
+            combined AS (
+                SELECT 'All Foodbanks' AS centre, months.month, count(geo.month) AS voucher_count
+                FROM months LEFT JOIN geo ON geo.month = months.month
+                GROUP BY ALL
+            )
+            SELECT *, 0 AS part FROM per_centre UNION ALL SELECT *, 1 AS part FROM combined
+            ORDER BY part, centre, month
+        ''', [list(foodbanks)] if foodbanks else []).df()
+        return pd.DataFrame({
+            centre: counts["centre"],
+            "month_name": pd.Categorical.from_codes(counts["month"] - 1, categories=MONTHS, ordered=True),
+            "voucher_count": counts["voucher_count"].astype("int64"),
+        })
+
+    # Missing months have code -1, which from_codes turns into NaN
+    codes = month.fillna(0).to_numpy(dtype="int64") - 1
+    df = df.assign(month_name=pd.Categorical.from_codes(codes, categories=MONTHS, ordered=True))
+    filtered_df = df[df[centre].isin(foodbanks)]
+    monthly_counts = filtered_df.groupby([centre, "month_name"], observed=False).size().reset_index(name="voucher_count")
+    combined_counts = df.groupby("month_name", observed=False).size().reset_index(name="voucher_count")
+    combined_counts[centre] = "All Foodbanks"
+    return pd.concat([monthly_counts, combined_counts], ignore_index=True)
+
+
+def make_queries(df: pd.DataFrame):
+    """
+    Return the query engine chosen by FOODBANK_QUERY_ENGINE over the voucher frame, with its household ids
+    """
+    if QUERY_ENGINE == "duckdb":
+        return DuckDBQueries(df)
+    return PandasQueries(df)
+
+
+def voucher_queries(dataset):
+    """
+    Return the dataset's query engine over its voucher view, creating it on first use
+    """
+    if dataset.queries is None:
+        dataset.queries = make_queries(with_households(dataset, "voucher"))
+    return dataset.queries
@@ -0,0 +1,138 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from profiler import step
+
+logger = logging.getLogger(__name__)
+
+# Free text is kept in Arrow buffers instead of Python objects
+STRING_DTYPE = pd.StringDtype("pyarrow")
+
+# Low-cardinality text, stored once per distinct value
+CATEGORY_COLUMNS = [
+    "crisis type", "county", "town", "ward", "assigned food bank centre", "voucher status",
+    "issued by", "source of income", "reasons for referral", "agency", "foodbank centre fulfilled at",
+]
+# Free text that is mostly distinct per voucher, stored in Arrow buffers instead of Python objects
+STRING_COLUMNS = ["voucher code", "first name", "last name", "address1", "address2", "postcode"]
+# Yes/no flags, nullable so a blank cell stays missing
+BOOL_COLUMNS = ["no fixed address", "delivery required"]
+BOOL_PREFIXES = ("secondary crisis:",)
+# Counts of people per age band, all well under 128
+COUNT_PREFIXES = ("the usual household structure", "number of people the voucher is for")
+# The secondary crisis flags, packed in this order into the bits of SECONDARY_CRISIS_BITS
+SECONDARY_CRISIS_COLUMNS = [
+    "secondary crisis: benefit changes",
+    "secondary crisis: benefit delays",
+    "secondary crisis: low income",
+    "secondary crisis: refused short term benefit advance",
+    "secondary crisis: delayed wages",
+    "secondary crisis: debt",
+    "secondary crisis: homeless",
+    "secondary crisis: no recourse to public funds",
+    "secondary crisis: domestic abuse",
+    "secondary crisis: sickness/ill health",
+    "secondary crisis: child holiday meals",
+    "secondary crisis: other",
+]
+SECONDARY_CRISIS_BITS = "secondary crisis bits"
+
+
+# Integer calendar columns derived from a date column, named "<date column>: <part>":
+# "day" counts days and "month" counts months since January 1970, "month of year" is 1 to 12
+CALENDAR_PARTS = ["day", "month", "month of year"]
+
+
+def calendar_columns(dates: pd.Series) -> dict:
+    """
+    Return the calendar columns of a parsed date column, so charts group on small integers instead of dates or strings
+
+    Parameters:
+        dates (pd.Series): A datetime64 column, missing dates become <NA> in every part
+    Returns:
+        dict: Column name -> nullable integer Series, in the order of CALENDAR_PARTS
+    """
+    month_of_year = dates.dt.month.astype("Int8")
+    parts = {
+        "day": (dates - pd.Timestamp("1970-01-01")).dt.days.astype("Int32"),
+        "month": ((dates.dt.year.astype("Int32") - 1970) * 12 + month_of_year - 1).astype("Int32"),
+        "month of year": month_of_year,
+    }
+    return {f"{dates.name}: {part}": parts[part] for part in CALENDAR_PARTS}
+
+
+def day_dates(days) -> np.ndarray:
+    """
+    Return the dates of "day" calendar values, as midnight timestamps
+    """
+    return (np.datetime64("1970-01-01", "D") + np.asarray(days, dtype="int64")).astype("datetime64[ns]")
+
+
+def month_starts(months) -> np.ndarray:
+    """
+    Return the first day of the months of "month" calendar values
+    """
+    return (np.datetime64("1970-01", "M") + np.asarray(months, dtype="int64")).astype("datetime64[ns]")
+
+
+def voucher_schema(columns) -> dict:
+    """
+    Return the dtype of each column of the cleaned voucher frame that has a declared one
+    """
+    schema = {}
+    for column in columns:
+        if column in CATEGORY_COLUMNS:
+            schema[column] = "category"
+        elif column in STRING_COLUMNS:
+            schema[column] = STRING_DTYPE
+        elif column in BOOL_COLUMNS or column.startswith(BOOL_PREFIXES):
+            schema[column] = "boolean"
+        elif column.startswith(COUNT_PREFIXES):
+            schema[column] = "Int8"
+        elif column == SECONDARY_CRISIS_BITS:
+            schema[column] = "uint16"
+    return schema
+
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert the cleaned voucher frame to its compact dtypes
+
+    Columns that cannot take their declared dtype (e.g. free text in a count column) are
+    left as they are. The frame's memory before and after is recorded on the "schema"
+    step, so the diagnostics panel shows what the dtypes saved.
+
+    Parameters:
+        df (pd.DataFrame): The cleaned DataFrame, with lower case column names
+    Returns:
+        pd.DataFrame: The same data with compact dtypes
+    """
+    with step("schema", df) as record:
+        record["frame_mb_in"] = df.memory_usage(deep=True).sum() / 1024 ** 2
+        converted = {}
+        for column, dtype in voucher_schema(df.columns).items():
+            try:
+                converted[column] = df[column].astype(dtype)
+            except (ValueError, TypeError):
+                logger.warning("Column %r could not be converted to %s", column, dtype)
+        df = df.assign(**converted)
+        record["rows_out"] = len(df)
+        record["frame_mb_out"] = df.memory_usage(deep=True).sum() / 1024 ** 2
+    return df
+
+
+def restore_strings(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return a frame read back from Parquet or Arrow with its string columns in Arrow storage again
+
+    Readers rebuild string columns with pandas' default storage, which holds Python objects.
+    """
+    columns = [
+        column for column, dtype in df.dtypes.items()
+        if isinstance(dtype, pd.StringDtype) and dtype != STRING_DTYPE
+    ]
+    if not columns:
+        return df
+    return df.astype({column: STRING_DTYPE for column in columns})
@@ -0,0 +1,140 @@
+import os
+
+import streamlit as st
+from cachetools import LRUCache
+
+from cache import DatasetCache
+from ingest import Dataset, load_dataset
+from store import STORE_DIR, StoreDataset, VoucherStore
+
+
+@st.cache_resource(show_spinner=False)
+def dataset_cache() -> DatasetCache:
+    """
+    Return the on-disk cache of cleaned views shared by every session
+    """
+    return DatasetCache()
+
+
+# Memory the decrypted copies of password-protected uploads may use in one session
+DECRYPTED_CACHE_BYTES = int(os.environ.get("FOODBANK_DECRYPTED_CACHE_MB", "100")) * 1024 * 1024
+
+
+def decrypted_cache() -> LRUCache:
+    """
+    Return this session's cache of decrypted workbooks, so each upload is decrypted once
+    """
+    if "decrypted_workbooks" not in st.session_state:
+        st.session_state["decrypted_workbooks"] = LRUCache(maxsize=DECRYPTED_CACHE_BYTES, getsizeof=len)
+    return st.session_state["decrypted_workbooks"]
+
+
+@st.cache_resource(show_spinner=False)
+def voucher_store() -> VoucherStore:
+    """
+    Return the local store of appended exports, or None unless FOODBANK_STORE_DIR is set
+    """
+    return VoucherStore(STORE_DIR) if STORE_DIR else None
+
+
+def store_dataset(store: VoucherStore) -> Dataset:
+    """
+    Return a dataset over the store, reusing the session's one if nothing was appended since
+    """
+    current = current_dataset()
+    if isinstance(current, StoreDataset) and current.key == store.version():
+        return current
+    return StoreDataset(store)
+
+
+def current_dataset() -> Dataset:
+    """
+    Return the dataset loaded in this session, or None if nothing has been uploaded
+    """
+    return st.session_state.get("dataset")
+
+
+def upload_dataset() -> Dataset:
+    """
+    Show the file uploader and password prompt, and keep the parsed upload in session state.
+
+    Every page shares the same session dataset, so a workbook uploaded on one page is
+    parsed once and reused by the others. When the voucher store is enabled, uploads are
+    appended to it and the pages read the stored history, with or without an upload.
+
+    Returns:
+        Dataset: The dataset loaded in this session, or None if nothing has been uploaded
+    """
+    # File uploader for Excel files
+    uploaded_file = st.file_uploader("Upload your Excel file", type="xlsx")
+
+    # Check if a file is uploaded
+    if uploaded_file:
+        data = uploaded_file.getvalue()
+        # Attempt to load data without a password
+        dataset, success = load_dataset(data, current=current_dataset(), cache=dataset_cache(),
+                                        decrypted_cache=decrypted_cache())
+
+        if not success:
+            # Prompt for a password if the initial load failed
+            password = st.text_input("Enter the password for the Excel file", type="password")
+            if password:
+                dataset, success = load_dataset(data, password=password, current=current_dataset(),
+                                                cache=dataset_cache(), decrypted_cache=decrypted_cache())
+                if not success:
+                    st.error("Failed to load the file. Please check the password or file format.")
+
+        store = voucher_store()
+        if success and store is not None:
+            if not store.contains(dataset.key):
+                with st.spinner("Adding new vouchers to the stored history..."):
+                    added = store.append(dataset.key, dataset.raw)
+                st.success(f"File uploaded: {added:,} new vouchers added to the stored history.")
+            st.session_state["dataset"] = store_dataset(store)
+        elif success:
+            if dataset.streaming and "voucher" not in dataset.views:
+                # Large workbooks are cleaned in batches, show how far the load has got
+                bar = st.progress(0.0, text="Loading workbook...")
+                def show_progress(rows_read, total_rows):
+                    if total_rows:
+                        bar.progress(min(rows_read / total_rows, 1.0), text=f"Loaded {rows_read:,} of {total_rows:,} rows")
+                dataset.progress = show_progress
+                dataset.view("voucher")
+                dataset.progress = None
+                bar.empty()
+            st.session_state["dataset"] = dataset
+            st.success("File uploaded and cleaned successfully!")
+
+    # Without an upload, show the exports stored on earlier visits
+    store = voucher_store()
+    if current_dataset() is None and store is not None and not store.is_empty():
+        st.session_state["dataset"] = store_dataset(store)
+
+    return current_dataset()
+
+
+def diagnostics_panel():
+    """
+    Show how long each step of loading and cleaning the session's dataset took, in a collapsed panel
+    """
+    dataset = current_dataset()
+    if dataset is None or not dataset.profiler.steps:
+        return
+    with st.expander("Diagnostics"):
+        st.caption("Time, rows and memory change of each load and cleaning step in this session. "
+                   "The schema step also shows the voucher frame's size in MB before and after its compact dtypes.")
+        st.dataframe(dataset.profiler.frame(), hide_index=True, use_container_width=True)
+
+
+def cache_controls():
+    """
+    Show sidebar buttons that clear the on-disk cache of cleaned views and the stored exports
+    """
+    if st.sidebar.button("Clear cached datasets", help="Remove cleaned data kept on disk from earlier uploads."):
+        dataset_cache().invalidate()
+        st.sidebar.success("Cached datasets cleared.")
+    store = voucher_store()
+    if store is not None and st.sidebar.button("Clear stored vouchers", help="Remove every export appended to the stored history."):
+        store.clear()
+        st.session_state.pop("dataset", None)
+        st.sidebar.success("Stored vouchers cleared.")
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from cache import cleaning_version, parquet_safe
+from ingest import Dataset, ingest_columns
+from pipeline import Pipeline
+from schema import restore_strings
+
+# Where appended exports are kept. The store is off unless this is set, since appending an upload
+# parses the whole workbook up front instead of streaming it into the cached views
+STORE_DIR = os.environ.get("FOODBANK_STORE_DIR", "")
+
+# Cleaned views kept alongside the raw rows, built by the cleaning pipeline
+STORED_VIEWS = ["voucher", "geo"]
+
+
+class VoucherStore:
+    """
+    Local store of every voucher exported so far, as partitioned Parquet.
+
+    Each appended export adds one part per table (the raw rows plus each cleaned view),
+    holding only the vouchers whose code was not already stored. Vouchers without a code
+    are always added. manifest.json records the workbooks appended and the cleaning code
+    version each part was built with. Columns mixing text with numbers or dates are stored
+    as text, see cache.parquet_safe.
+    """
+
+    def __init__(self, directory: str = STORE_DIR):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "manifest.json")
+
+    def manifest(self) -> list[dict]:
+        if not os.path.exists(self.manifest_path):
+            return []
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest: list[dict]):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _part_path(self, table: str, part: int) -> str:
+        return os.path.join(self.directory, table, f"part-{part:05d}.parquet")
+
+    def _write_views(self, raw: pd.DataFrame, part: int):
+        pipeline = Pipeline(lambda: raw)
+        for name in STORED_VIEWS:
+            parquet_safe(pipeline.run(name)).to_parquet(self._part_path(name, part))
+
+    def is_empty(self) -> bool:
+        return not any(entry["rows"] for entry in self.manifest())
+
+    def version(self) -> str:
+        """
+        Return a key that changes whenever rows are appended
+        """
+        return "store-" + hashlib.sha256(json.dumps(self.manifest()).encode()).hexdigest()
+
+    def contains(self, key: str) -> bool:
+        """
+        Return True if the workbook with this hash has already been appended
+        """
+        return any(entry["file"] == key for entry in self.manifest())
+
+    def voucher_codes(self) -> pd.Index:
+        parts = [
+            pd.read_parquet(self._part_path("raw", entry["part"]), columns=["Voucher code"])["Voucher code"]
+            for entry in self.manifest() if entry["rows"]
+        ]
+        return pd.Index(pd.concat(parts) if parts else [])
+
+    def append(self, key: str, raw: pd.DataFrame) -> int:
+        """
+        Add the vouchers of an export that are not already stored, cleaning only those rows
+
+        Parameters:
+            key (str): The workbook hash, so the same file is never appended twice
+            raw (pd.DataFrame): The raw export
+        Returns:
+            int: The number of vouchers added
+        """
+        if self.contains(key):
+            return 0
+        raw = parquet_safe(raw)
+        # Codes are compared as text, since a column that once mixed numbers and text was stored as text
+        codes = raw["Voucher code"].astype(str).where(raw["Voucher code"].notna())
+        stored = codes.notna() & codes.isin(self.voucher_codes().astype(str))
+        new = raw[~stored & (~codes.duplicated() | codes.isna())]
+
+        manifest = self.manifest()
+        part = max((entry["part"] for entry in manifest), default=0) + 1
+        if len(new):
+            for table in ["raw", *STORED_VIEWS]:
+                os.makedirs(os.path.join(self.directory, table), exist_ok=True)
+            new.to_parquet(self._part_path("raw", part))
+            self._write_views(new, part)
+        manifest.append({"file": key, "part": part, "rows": len(new), "version": cleaning_version()})
+        self._write_manifest(manifest)
+        return len(new)
+
+    def read(self, table: str) -> pd.DataFrame:
+        """
+        Return every stored row of the raw table or a cleaned view, with no rows if nothing is stored
+
+        Parts cleaned by an older version of the cleaning code are rebuilt from their raw rows first.
+        """
+        version = cleaning_version()
+        manifest = self.manifest()
+        frames = []
+        for entry in manifest:
+            if not entry["rows"]:
+                continue
+            if table != "raw" and entry["version"] != version:
+                self._write_views(pd.read_parquet(self._part_path("raw", entry["part"])), entry["part"])
+                entry["version"] = version
+                self._write_manifest(manifest)
+            frames.append(pd.read_parquet(self._part_path(table, entry["part"])))
+        if not frames:
+            raw = pd.DataFrame(columns=ingest_columns)
+            return raw if table == "raw" else Pipeline(lambda: raw).run(table)
+        return concat_parts(frames)
+
+    def clear(self):
+        """
+        Remove every stored export
+        """
+        for entry in self.manifest():
+            for table in ["raw", *STORED_VIEWS]:
+                path = self._part_path(table, entry["part"])
+                if os.path.exists(path):
+                    os.remove(path)
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+
+
+def concat_parts(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenate stored parts, keeping categorical columns categorical
+
+    Each part's categories are the values of its own vouchers, and pd.concat turns columns whose
+    categories differ into object, so the categories are unioned first.
+    """
+    frames = [frame.copy() for frame in frames] if len(frames) > 1 else frames
+    for column in frames[0].columns:
+        if len(frames) > 1 and all(isinstance(frame[column].dtype, pd.CategoricalDtype) for frame in frames):
+            categories = union_categoricals([frame[column] for frame in frames], ignore_order=True).categories
+            for frame in frames:
+                frame[column] = frame[column].cat.set_categories(categories)
+    return restore_strings(pd.concat(frames, ignore_index=True))
+
+
+class StoreDataset(Dataset):
+    """
+    A Dataset whose raw rows and cleaned views are read from a VoucherStore instead of an upload
+    """
+
+    def __init__(self, store: VoucherStore):
+        super().__init__(store.version(), workbook=None)
+        self.store = store
+
+    @property
+    def raw(self) -> pd.DataFrame:
+        if self._raw is None:
+            self._raw = self.store.read("raw")
+        return self._raw
+
+    def view(self, name: str, build=None) -> pd.DataFrame:
+        if build is None and name in STORED_VIEWS and name not in self.views:
+            self.views[name] = self.store.read(name)
+        return super().view(name, build)
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pandas.util import hash_array
+
+from xlsx_reader import iter_xlsx, sheet_row_count
+
+# Rows parsed and cleaned at a time when streaming a workbook
+BATCH_SIZE = 10_000
+
+
+def _unify(tables: list[pa.Table]) -> pa.Table:
+    """
+    Concatenate batch tables whose column types differ only where a batch had no values
+    """
+    types = {}
+    for table in tables:
+        for field, column in zip(table.schema, table.columns):
+            if column.null_count < len(column):
+                types.setdefault(field.name, field.type)
+    unified = []
+    for table in tables:
+        for i, (field, column) in enumerate(zip(table.schema, table.columns)):
+            target = types.get(field.name)
+            if target is not None and field.type != target and column.null_count == len(column):
+                table = table.set_column(i, pa.field(field.name, target), pa.nulls(len(column), target))
+        unified.append(table)
+    return pa.concat_tables(unified, promote_options="permissive")
+
+
+def _row_hashes(batch: pd.DataFrame) -> np.ndarray:
+    """
+    Hash each row so equal rows match across batches, even where a batch inferred a different
+    dtype for a column (missing values all hash the same, whatever the column dtype)
+    """
+    row_hashes = np.zeros(len(batch), dtype=np.uint64)
+    for _, column in batch.items():
+        if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+            values = column.to_numpy(dtype="float64")
+        elif pd.api.types.is_datetime64_dtype(column):
+            values = column.to_numpy()
+        else:
+            values = column.to_numpy(dtype=object)
+        hashes = hash_array(values)
+        hashes[column.isna().to_numpy()] = 0
+        row_hashes = row_hashes * np.uint64(1_000_003) ^ hashes
+    return row_hashes
+
+
+def stream_clean(workbook, clean, columns: list[str], types: dict = None, batch_size: int = BATCH_SIZE, progress=None) -> pa.Table:
+    """
+    Read and clean a workbook one batch of rows at a time, collecting the result in an Arrow table
+
+    Only one batch of raw rows is held as Python objects at any time. Rows that repeat an
+    earlier row anywhere in the sheet are dropped before cleaning, using a 64-bit hash per
+    row, so the result matches cleaning the whole sheet at once.
+
+    Parameters:
+        workbook: A path or file-like object of a plain (decrypted) xlsx
+        clean: The cleaning function applied to each batch, e.g. dbclean_1.clean_data
+        columns (list): The column headings to read
+        types (dict): Optional column heading -> "date", "int" or "bool" conversions
+        batch_size (int): Rows per batch
+        progress: Optional callable taking (rows_read, total_rows), total_rows may be None
+    Returns:
+        pa.Table: The cleaned rows
+    """
+    total_rows = sheet_row_count(workbook)
+    workbook.seek(0)
+    seen = np.empty(0, dtype=np.uint64)  # Sorted hashes of every row kept so far
+    tables = []
+    rows_read = 0
+    for batch in iter_xlsx(workbook, columns, types, batch_size=batch_size):
+        rows_read += len(batch)
+        hashes = _row_hashes(batch)
+        new = ~pd.Series(hashes).duplicated().to_numpy()
+        if len(seen):
+            positions = np.minimum(np.searchsorted(seen, hashes), len(seen) - 1)
+            new &= seen[positions] != hashes
+        if new.any():
+            batch_hashes = np.sort(hashes[new])
+            seen = np.insert(seen, np.searchsorted(seen, batch_hashes), batch_hashes)
+            cleaned = clean(batch[new])
+            tables.append(pa.Table.from_pandas(cleaned, preserve_index=False))
+        if progress is not None:
+            progress(rows_read, total_rows)
+
+    if not tables:
+        return pa.Table.from_pandas(clean(pd.DataFrame(columns=columns)), preserve_index=False)
+    return _unify(tables)
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Tests do not append to the profile log or use the voucher store
+os.environ["FOODBANK_PROFILE_LOG"] = ""
+os.environ["FOODBANK_STORE_DIR"] = ""
+
+# The app's modules live at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,324 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.generate import generate_vouchers
+from dbclean_1 import (
+    DATE_FORMATS, clean_county_name, clean_data, clean_town_name, client_summary, individual_journey_filter,
+    normalise_distinct, pack_flags, parse_dates, reason_counts, values_in_reasons_for_referral,
+)
+from queries import _crisis_flags
+from schema import SECONDARY_CRISIS_BITS, SECONDARY_CRISIS_COLUMNS, calendar_columns, day_dates, month_starts
+
+
+def baseline_town(town: pd.Series) -> pd.Series:
+    """
+    The row-wise town cleaning clean_data used before it normalised each distinct spelling once
+    """
+    return town.str.strip().str.title().str.rstrip('.')
+
+
+def baseline_county(county: pd.Series) -> pd.Series:
+    """
+    The row-wise county cleaning clean_data used before it normalised each distinct spelling once
+    """
+    county = county.str.strip().str.title()
+    county = county.replace(
+        ['Gl', "Gloucester", "Glos", "Glos.", "Glouces", "Glouchester", "GloucestershirG", "Gloucestershrie",
+         "Gloucestershirg", "Gloustershire", "Gloucetershire", "Gloucs", "Glouctestershire"],
+        'Gloucestershire'
+    )
+    county = county.str.replace(r'\s?[A-Z]{1,2}\d{1,2}\s?\d[A-Z]{2}', '', regex=True)
+
+    def clean_county_name(county):
+        if pd.isna(county):
+            return 'Unknown'
+        county_str = county.strip().lower()
+        patterns = {
+            r'glou.*': 'Gloucestershire',
+            r'gl\d*': 'Gloucestershire',
+            r'wilt.*': 'Wiltshire',
+            r'oxon.*': 'Oxfordshire',
+            r'cots.*': 'Cotswolds',
+            r'swindon.*': 'Swindon',
+            r'sn\d*': 'Swindon',
+            r'norfolk.*': 'Norfolk'
+        }
+        for pattern, replacement in patterns.items():
+            if re.match(pattern, county_str):
+                return replacement
+        return county_str.capitalize()
+
+    return county.apply(clean_county_name)
+
+
+def assert_same(actual: pd.Series, expected: pd.Series):
+    # Missing values are compared as missing, whether they come out as None or NaN
+    actual, expected = actual.astype(object), expected.astype(object)
+    pd.testing.assert_series_equal(
+        actual.where(actual.notna(), np.nan), expected.where(expected.notna(), np.nan), check_names=False
+    )
+
+
+EDGE_CASES = [
+    np.nan, None, "", "   ", 42, 3.5,
+    "cirencester", "CIRENCESTER", "cIrEnCeStEr", "  Cirencester  ", "Cirencester.", " cirencester. ", "Cirencester..",
+    "stow-on-the-wold", "st. briavels", "Atlantis", "  unknown town  ",
+    "Glos", "glos.", " GLOS ", "Gl", "gl7", "Gloucestershrie", "Gloucestershire GL7 1AB", "GL7 1AB", "gl50 3pp",
+    "Wilts", "wiltshire ", "OXON", "Cotswolds", "swindon borough", "SN1", "sn25 4ab", "Norfolk", "Narnia",
+]
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_town_matches_baseline_on_generated_exports(seed):
+    town = generate_vouchers(3000, seed)["Town"]
+    assert_same(normalise_distinct(town, clean_town_name), baseline_town(town))
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_county_matches_baseline_on_generated_exports(seed):
+    county = generate_vouchers(3000, seed)["County"]
+    assert_same(normalise_distinct(county, clean_county_name), baseline_county(county))
+
+
+def test_town_matches_baseline_on_edge_cases():
+    town = pd.Series(EDGE_CASES, dtype=object, index=np.arange(len(EDGE_CASES)) * 2)
+    assert_same(normalise_distinct(town, clean_town_name), baseline_town(town))
+
+
+def test_county_matches_baseline_on_edge_cases():
+    county = pd.Series(EDGE_CASES, dtype=object, index=np.arange(len(EDGE_CASES)) * 2)
+    assert_same(normalise_distinct(county, clean_county_name), baseline_county(county))
+
+
+def test_missing_and_non_text_values():
+    values = pd.Series([np.nan, None, 7, "  tetbury. "], dtype=object)
+    assert normalise_distinct(values, clean_town_name).isna().tolist() == [True, True, True, False]
+    assert normalise_distinct(values, clean_town_name).iloc[3] == "Tetbury"
+    assert normalise_distinct(values, clean_county_name).tolist() == ["Unknown", "Unknown", "Unknown", "Tetbury."]
+
+
+def baseline_reasons(df: pd.DataFrame) -> list:
+    """
+    values_in_reasons_for_referral's original loop over the distinct field values
+    """
+    values = []
+    for v in df["reasons for referral"].dropna().unique():
+        for x in v.split(", "):
+            if x not in values:
+                values.append(x)
+    return values
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_reasons_match_baseline(seed):
+    df = clean_data(generate_vouchers(2000, seed))
+    assert values_in_reasons_for_referral(df) == baseline_reasons(df)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_reason_counts_match_exploded_field(seed):
+    reasons = clean_data(generate_vouchers(2000, seed))["reasons for referral"].astype(object)
+    codes, values = pd.factorize(reasons)
+    counts = reason_counts(values, np.bincount(codes[codes >= 0], minlength=len(values)))
+    # Every reason a voucher names, one row each
+    exploded = reasons.dropna().str.split(", ").explode()
+    expected = exploded.value_counts(sort=False).reindex(pd.unique(exploded))
+    expected = expected.sort_values(ascending=False, kind="stable")
+    assert counts["reason"].tolist() == expected.index.tolist()
+    assert counts["voucher count"].tolist() == expected.tolist()
+
+
+def test_reason_counts_without_reasons():
+    counts = reason_counts([], np.array([], dtype=np.int64))
+    assert counts.empty and list(counts.columns) == ["reason", "voucher count"]
+
+
+def test_unpacked_flags_match_flag_columns():
+    df = clean_data(generate_vouchers(2000, 4))
+    flags = df[SECONDARY_CRISIS_COLUMNS].eq(1).fillna(False).to_numpy(dtype=bool)
+    assert flags.any(axis=0).all()
+    np.testing.assert_array_equal(_crisis_flags(df[SECONDARY_CRISIS_BITS].to_numpy()), flags)
+
+
+def test_pack_flags_bit_order_and_missing_values():
+    df = pd.DataFrame({
+        "a": pd.array([1, 0, None, 1], dtype="Int8"),
+        "b": [True, False, True, None],
+        "c": [0.0, 1.0, np.nan, 1.0],
+    })
+    bits = pack_flags(df, ["a", "b", "c"])
+    assert bits.dtype == np.uint16
+    assert bits.tolist() == [0b011, 0b100, 0b010, 0b101]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("2023-04-03", "2023-04-03"),
+    ("2023-04-03 10:15:00", "2023-04-03 10:15"),
+    ("2023-04-03T10:15:30", "2023-04-03 10:15:30"),
+    ("03/04/2023", "2023-04-03"),
+    ("13/04/2023 10:00", "2023-04-13 10:00"),
+    ("03/04/2023 10:00:30", "2023-04-03 10:00:30"),
+])
+def test_parse_dates_reads_iso_and_day_first_text(text, expected):
+    # Each format on its own, and after ISO dates in the same column
+    assert parse_dates(pd.Series([text], dtype=object)).tolist() == [pd.Timestamp(expected)]
+    mixed = parse_dates(pd.Series(["2020-01-01", text, None], dtype=object))
+    assert mixed.tolist()[:2] == [pd.Timestamp("2020-01-01"), pd.Timestamp(expected)]
+    assert mixed.isna().tolist() == [False, False, True]
+
+
+@pytest.mark.parametrize("text", ["not a date", "", "31/02/2023", "2023-13-01", "04-03-2023", "3rd April 2023"])
+def test_parse_dates_leaves_unparseable_text_missing(text):
+    assert parse_dates(pd.Series(["03/04/2023", text], dtype=object)).tolist() == [pd.Timestamp("2023-04-03"), pd.NaT]
+
+
+def test_parse_dates_keeps_parsed_columns_and_tries_iso_first():
+    parsed = pd.Series(pd.to_datetime(["2023-04-03", None]))
+    assert parse_dates(parsed) is parsed
+    assert DATE_FORMATS[0] == "ISO8601"
+
+
+def test_calendar_columns_round_trip():
+    dates = pd.Series(pd.to_datetime(["1970-01-01 00:00", "2023-04-30 23:59", None, "2024-02-29 12:00"]), name="when")
+    parts = calendar_columns(dates)
+    assert list(parts) == ["when: day", "when: month", "when: month of year"]
+    kept = dates.notna()
+    assert all(part[~kept].isna().all() for part in parts.values())
+    np.testing.assert_array_equal(day_dates(parts["when: day"][kept]), dates[kept].dt.normalize().to_numpy())
+    np.testing.assert_array_equal(
+        month_starts(parts["when: month"][kept]), dates[kept].dt.to_period("M").dt.start_time.to_numpy()
+    )
+    assert parts["when: month of year"].tolist() == [1, 4, pd.NA, 2]
+
+
+def baseline_journey(df: pd.DataFrame, min_voucher:int=None, max_voucher:int=None, start_date:int=None, end_date:int=None)-> tuple[pd.DataFrame, bool]:
+    """
+    individual_journey_filter as it was before it was vectorised, with a groupby apply per client and per voucher column
+    """
+    # Define column names in lowercase to match the column names in the DataFrame
+    DATE_COL = "Date issued to client".lower()
+    ISSUE_BY_COL = "Issued by".lower()
+    
+    # Convert date column to datetime format if it's not already
+    df[DATE_COL] = pd.to_datetime(df[DATE_COL])
+    
+    # Filter rows within the specified date period
+    if start_date:
+        df = df[df[DATE_COL] >= pd.to_datetime(start_date)]
+    if end_date:
+        df = df[df[DATE_COL] <= pd.to_datetime(end_date)]
+
+    grouped = None
+    # Group by 'client id', 'first name', and 'last name', and collect dates and issued by values per client
+    grouped = df.groupby(['client id', 'first name', 'last name']).apply(
+        lambda x: pd.Series({
+            DATE_COL: list(x[DATE_COL]),
+            ISSUE_BY_COL: list(x[ISSUE_BY_COL])
+        })
+    ).reset_index(drop=False)  # Do not drop columns from the original DataFrame
+    
+    # Apply min_rows and max_rows filters
+    grouped['Voucher Count'] = grouped[DATE_COL].apply(len)
+    if min_voucher:
+        grouped = grouped[grouped['Voucher Count'] >= min_voucher]
+    if max_voucher:
+        grouped = grouped[grouped['Voucher Count'] <= max_voucher]
+        
+    if grouped.shape[0] == 0:
+        return None, False
+    
+    # Expand the dates and apply "Not fulfilled" if voucher status is not "Fulfilled"
+    max_dates = grouped['Voucher Count'].max()
+    date_columns = {
+        f'Voucher Detail {i+1} (Issue Date - Issued by)': grouped.apply(
+            lambda row: (
+                f"{row[DATE_COL][i].strftime('%Y-%m-%d')} - {row[ISSUE_BY_COL][i]}"
+            ) if i < len(row[DATE_COL]) else None,
+            axis=1
+        )
+        for i in range(max_dates)
+    }
+    
+    # Determine the latest date for sorting
+    grouped['latest_date'] = grouped[DATE_COL].apply(lambda x: max(x) if x else None)
+    grouped['latest_date'] = grouped['latest_date'].dt.strftime('%Y-%m-%d')
+    
+    grouped = grouped.rename(columns={
+        'client id': 'Client ID',
+        'first name': 'First Name',
+        'last name': 'Last Name',
+        'latest_date': 'Latest Issue Date'
+    })
+    
+    # Create the final DataFrame with client names, count, and individual date columns
+    result_df = pd.concat([grouped[['Client ID', 'First Name', 'Last Name', 'Voucher Count', 'Latest Issue Date']], pd.DataFrame(date_columns)], axis=1)
+    
+    return result_df.reset_index().drop("index", axis=1), True
+
+
+@pytest.fixture(scope="module")
+def vouchers():
+    return clean_data(generate_vouchers(1500, 6))
+
+
+def journey_filters(df: pd.DataFrame) -> dict:
+    dates = df["date issued to client"]
+    return {
+        "everything": (None, None, None, None),
+        "voucher counts": (2, 4, None, None),
+        "dates": (None, None, dates.quantile(0.25), dates.quantile(0.75)),
+        "edge dates": (1, 10, dates.min(), dates.max()),
+        "start date only": (3, None, dates.quantile(0.5), None),
+        "end date only": (None, 2, None, dates.quantile(0.5)),
+        "no match": (10 ** 6, None, None, None),
+    }
+
+
+@pytest.mark.filterwarnings("ignore::DeprecationWarning", "ignore::FutureWarning")
+@pytest.mark.parametrize("name", [
+    "everything", "voucher counts", "dates", "edge dates", "start date only", "end date only", "no match",
+])
+def test_journey_matches_baseline(vouchers, name):
+    selection = journey_filters(vouchers)[name]
+    expected, expected_found = baseline_journey(vouchers.copy(), *selection)
+    actual, found = individual_journey_filter(vouchers, *selection)
+    assert found == expected_found
+    if expected_found:
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_categorical=False)
+    else:
+        assert actual is None
+
+
+def baseline_summary(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The client summary computed one client at a time, sorting each client's own dates
+    """
+    rows = []
+    for client_id, vouchers in df.groupby("client id", sort=True):
+        dates = vouchers["date issued to client"].sort_values()
+        gaps = dates.diff().dt.days.dropna()
+        rows.append({
+            "client id": client_id,
+            "first visit": dates.min(),
+            "last visit": dates.max(),
+            "voucher count": len(vouchers),
+            "median gap days": gaps.median(),
+            "max gap days": gaps.max(),
+            "crisis types": vouchers["crisis type"].nunique(),
+            "centres": vouchers["foodbank centre fulfilled at"].nunique(),
+        })
+    return pd.DataFrame(rows)
+
+
+@pytest.mark.parametrize("undated", [False, True])
+def test_client_summary_matches_baseline(vouchers, undated):
+    df = vouchers.copy()
+    if undated:
+        df.loc[df.index[::13], "date issued to client"] = pd.NaT
+    summary = client_summary(df)
+    assert summary["client id"].is_unique
+    assert summary["median gap days"].notna().any() and summary["median gap days"].isna().any()
+    pd.testing.assert_frame_equal(summary, baseline_summary(df), check_dtype=False)
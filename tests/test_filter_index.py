@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.generate import generate_vouchers
+from dbclean_1 import clean_data
+from queries import FilterIndex, PandasQueries
+
+
+@pytest.fixture(scope="module")
+def vouchers():
+    df = clean_data(generate_vouchers(1000, 17))
+    # Some vouchers without an issue date, spread through the frame
+    df.loc[df.index[::37], "date issued to client"] = pd.NaT
+    return df
+
+
+def mask_filter(df: pd.DataFrame, crisis_types: list, start_date, end_date) -> np.ndarray:
+    """
+    The Crisis page's original boolean-mask filter, as positions in frame order
+    """
+    mask = (
+        (df['crisis type'].isin(crisis_types)) &
+        (df['date issued to client'] >= pd.to_datetime(start_date)) &
+        (df['date issued to client'] <= pd.to_datetime(end_date)) &
+        (df['source of income'] != "Unknown") &
+        (df['county'] != "Unknown")
+    )
+    return np.flatnonzero(mask.to_numpy())
+
+
+def selections(df: pd.DataFrame):
+    dates = df["date issued to client"].dropna().sort_values()
+    crisis_types = sorted(df["crisis type"].dropna().unique())
+    first, last = dates.iloc[0], dates.iloc[-1]
+    return {
+        "everything": (crisis_types, first, last),
+        "first date only": (crisis_types, first, first),
+        "last date only": (crisis_types, last, last),
+        "inside the edge dates": (crisis_types, first + pd.Timedelta(1, "ns"), last - pd.Timedelta(1, "ns")),
+        "wider than the data": (crisis_types, first - pd.Timedelta(days=400), last + pd.Timedelta(days=400)),
+        "one crisis type": (crisis_types[:1], dates.iloc[len(dates) // 4], dates.iloc[3 * len(dates) // 4]),
+        "an unknown crisis type": (["No such crisis"], first, last),
+        "no crisis types": ([], first, last),
+        "reversed dates": (crisis_types, last, first),
+        "before the data": (crisis_types, first - pd.Timedelta(days=30), first - pd.Timedelta(days=1)),
+    }
+
+
+@pytest.mark.parametrize("name", [
+    "everything", "first date only", "last date only", "inside the edge dates", "wider than the data",
+    "one crisis type", "an unknown crisis type", "no crisis types", "reversed dates", "before the data",
+])
+def test_select_matches_boolean_mask(vouchers, name):
+    selection = selections(vouchers)[name]
+    np.testing.assert_array_equal(FilterIndex(vouchers).select(*selection), mask_filter(vouchers, *selection))
+
+
+def test_missing_dates_are_never_selected(vouchers):
+    selected = FilterIndex(vouchers).select(*selections(vouchers)["wider than the data"])
+    assert vouchers["date issued to client"].iloc[selected].notna().all()
+
+
+def test_no_crisis_types_selects_nothing(vouchers):
+    assert len(FilterIndex(vouchers).select(*selections(vouchers)["no crisis types"])) == 0
+
+
+def test_where_keeps_the_masked_rows(vouchers):
+    selection = selections(vouchers)["one crisis type"]
+    expected = vouchers.iloc[mask_filter(vouchers, *selection)]
+    pd.testing.assert_frame_equal(PandasQueries(vouchers).where(*selection).rows(), expected)
+
+
+def test_index_is_reused_across_selections(vouchers):
+    index = FilterIndex(vouchers)
+    for selection in selections(vouchers).values():
+        np.testing.assert_array_equal(index.select(*selection), mask_filter(vouchers, *selection))
@@ -0,0 +1,62 @@
+import pandas as pd
+import pytest
+
+from benchmarks.generate import generate_vouchers
+from dbclean_1 import clean_data
+from identity import HOUSEHOLD_ID, household_ids, households, numbers_compatible
+
+
+def records(rows: list) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=["client id", "first name", "last name", "address1", "address2", "postcode"])
+
+
+@pytest.fixture(scope="module", params=[0, 1])
+def vouchers(request):
+    return clean_data(generate_vouchers(3000, request.param))
+
+
+def test_households_do_not_outnumber_clients(vouchers):
+    ids = household_ids(vouchers, households(vouchers))
+    assert ids.nunique() <= vouchers["client id"].nunique()
+
+
+def test_each_client_is_one_household(vouchers):
+    ids = household_ids(vouchers, households(vouchers))
+    assert (ids.groupby(vouchers["client id"]).nunique() == 1).all()
+
+
+@pytest.mark.parametrize("a, b, expected", [
+    ("17", "17", True),
+    ("17", "17 8", True),
+    ("", "17 8", True),
+    ("17 8", "17 9", False),
+    ("17", "18 8", False),
+])
+def test_numbers_compatible(a, b, expected):
+    assert numbers_compatible(a, b) is expected
+    assert numbers_compatible(b, a) is expected
+
+
+def test_missing_flat_number_joins_the_one_flat_it_matches():
+    resolved = households(records([
+        [1, "Ann", "Lee", "17 Victoria Road", "Flat 8", "GL7 1AB"],
+        [2, "Andrew", "Smith", "17 Victoria Rd", None, "GL7 1AB"],
+    ]))
+    assert resolved[HOUSEHOLD_ID].nunique() == 1
+
+
+def test_building_address_does_not_join_up_its_flats():
+    resolved = households(records([
+        [1, "Ann", "Lee", "17 Victoria Road", "Flat 8", "GL7 1AB"],
+        [2, "Bob", "Ray", "17 Victoria Road", "Flat 9", "GL7 1AB"],
+        [3, "Cat", "Kim", "17 Victoria Road", None, "GL7 1AB"],
+    ]))
+    assert resolved[HOUSEHOLD_ID].nunique() == 3
+
+
+def test_records_of_one_client_are_one_household():
+    resolved = households(records([
+        [100016, "Ann", "Lee", "17 Victoria Road", "Flat 8", "GL7 1AB"],
+        [100016, "Ann", "Lee", "2 Mill Lane", None, "GL7 2CD"],
+    ]))
+    assert resolved[HOUSEHOLD_ID].nunique() == 1
@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.generate import generate_vouchers
+from dbclean_1 import clean_data
+from journey import CLIENT_COLUMNS, DATE_COLUMN, ClientIndex, ClientSearch, name_trigrams, normalise_name
+
+
+@pytest.fixture(scope="module")
+def vouchers():
+    return clean_data(generate_vouchers(1500, 23))
+
+
+def full_table_page(table: pd.DataFrame, page: int, page_size: int, sort_by: str = None, ascending: bool = True):
+    """
+    The page sliced from the whole formatted journey table, sorted by its column text
+    """
+    if sort_by is not None:
+        table = table.sort_values(sort_by, ascending=ascending, kind="stable", na_position="last")
+    return table.iloc[(page - 1) * page_size:page * page_size]
+
+
+@pytest.mark.parametrize("ascending", [True, False])
+@pytest.mark.parametrize("page", [1, 4, 1000])
+def test_page_matches_the_sorted_table(vouchers, page, ascending):
+    dates = vouchers["date issued to client"]
+    journey = ClientIndex(vouchers).select(1, 5, dates.quantile(0.2), dates.quantile(0.8))
+    table = journey.table()
+    assert list(table.columns) == journey.columns
+    for sort_by in journey.columns[:7] + [None]:
+        expected = full_table_page(table, page, 9, sort_by, ascending)
+        pd.testing.assert_frame_equal(journey.page(page, 9, sort_by, ascending), expected, check_index_type=False)
+
+
+def test_no_matching_clients(vouchers):
+    journey = ClientIndex(vouchers).select(min_voucher=10 ** 6)
+    assert len(journey) == 0
+    assert journey.page(1, 10, "Latest Issue Date").empty
+    assert ClientIndex(vouchers).journey(min_voucher=10 ** 6) == (None, False)
+
+
+@pytest.fixture(scope="module")
+def undated(vouchers):
+    # Some vouchers without an issue date, which only count when no date range is given
+    df = vouchers.copy()
+    df.loc[df.index[::29], DATE_COLUMN] = pd.NaT
+    return df
+
+
+def baseline_counts(df: pd.DataFrame, start_date=None, end_date=None) -> pd.Series:
+    """
+    Vouchers per client in the date range with a boolean mask and a groupby, 0 for clients with none
+    """
+    in_range = pd.Series(True, index=df.index)
+    if start_date:
+        in_range &= df[DATE_COLUMN] >= pd.Timestamp(start_date)
+    if end_date:
+        in_range &= df[DATE_COLUMN] <= pd.Timestamp(end_date)
+    return in_range.groupby([df[column] for column in CLIENT_COLUMNS], sort=True, observed=True).sum()
+
+
+def date_ranges(df: pd.DataFrame) -> list:
+    dates = df[DATE_COLUMN]
+    return [
+        (None, None), (dates.min(), dates.max()), (dates.quantile(0.3), dates.quantile(0.6)),
+        (dates.quantile(0.5), None), (None, dates.quantile(0.5)), (dates.max() + pd.Timedelta(days=1), None),
+    ]
+
+
+def test_index_layout(undated):
+    index = ClientIndex(undated)
+    counts = baseline_counts(undated)
+    assert len(index) == len(counts)
+    assert index.max_vouchers == counts.max()
+    np.testing.assert_array_equal(index.voucher_counts, counts.to_numpy())
+    # Each client's rows are their vouchers, missing dates first then in date order
+    keys = undated[CLIENT_COLUMNS].iloc[index.rows]
+    for client, (start, end) in enumerate(zip(index.offsets[:-1], index.offsets[1:])):
+        assert (keys.iloc[start:end] == counts.index[client]).all(axis=None)
+        dates = undated[DATE_COLUMN].iloc[index.rows[start:end]]
+        assert dates.isna().is_monotonic_decreasing
+        assert dates.dropna().is_monotonic_increasing
+
+
+@pytest.mark.parametrize("which", range(6))
+def test_date_bounds_match_masks(undated, which):
+    start_date, end_date = date_ranges(undated)[which]
+    start, end = ClientIndex(undated).date_bounds(start_date, end_date)
+    np.testing.assert_array_equal(end - start, baseline_counts(undated, start_date, end_date).to_numpy())
+
+
+@pytest.mark.parametrize("min_voucher, max_voucher", [(None, None), (2, None), (None, 3), (2, 3), (4, 2)])
+def test_select_matches_groupby(undated, min_voucher, max_voucher):
+    start_date, end_date = date_ranges(undated)[2]
+    counts = baseline_counts(undated, start_date, end_date)
+    keep = counts > 0
+    if min_voucher:
+        keep &= counts >= min_voucher
+    if max_voucher:
+        keep &= counts <= max_voucher
+    journey = ClientIndex(undated).select(min_voucher, max_voucher, start_date, end_date)
+    np.testing.assert_array_equal(journey.counts, counts[keep].to_numpy())
+    table = journey.table()
+    assert list(table[["Client ID", "First Name", "Last Name"]].itertuples(index=False)) == list(counts[keep].index)
+
+
+@pytest.fixture(scope="module")
+def search(vouchers):
+    return ClientSearch(vouchers)
+
+
+def baseline_name_rows(df: pd.DataFrame, first_name: str, last_name: str) -> np.ndarray:
+    """
+    The rows the search page found by scanning the view, before the search index
+    """
+    mask = (df['first name'].str.lower() == first_name.lower()) & (df['last name'].str.lower() == last_name.lower())
+    return np.flatnonzero(mask.fillna(False).to_numpy(dtype=bool))
+
+
+def baseline_names(df: pd.DataFrame) -> list:
+    """
+    Every normalised full name of the view, sorted
+    """
+    names = df["first name"].astype(object) + " " + df["last name"].astype(object)
+    return sorted({normalise_name(name) for name in names.dropna()})
+
+
+def test_rows_for_client_match_scan(vouchers, search):
+    client_ids = vouchers["client id"]
+    for client_id in client_ids.dropna().unique()[:200]:
+        np.testing.assert_array_equal(search.rows_for_client(client_id), np.flatnonzero(client_ids == client_id))
+    assert len(search.rows_for_client(-1)) == 0
+
+
+def test_rows_for_name_match_scan(vouchers, search):
+    pairs = vouchers[["first name", "last name"]].dropna().drop_duplicates().head(200)
+    for first_name, last_name in pairs.itertuples(index=False):
+        expected = baseline_name_rows(vouchers, first_name, last_name)
+        np.testing.assert_array_equal(search.rows_for_name(f"{first_name} {last_name}"), expected)
+        # Case and extra spaces are ignored
+        np.testing.assert_array_equal(search.rows_for_name(f"  {first_name.upper()}   {last_name.lower()} "), expected)
+    assert len(search.rows_for_name("nobody at all")) == 0
+
+
+@pytest.mark.parametrize("prefix", ["", "a", "j", "ma", "zz", "jo s"])
+def test_complete_matches_sorted_scan(vouchers, search, prefix):
+    expected = [name for name in baseline_names(vouchers) if name.startswith(prefix)][:10]
+    assert [normalise_name(name) for name in search.complete(prefix)] == expected
+
+
+def test_similar_matches_brute_force_jaccard(vouchers, search):
+    names = baseline_names(vouchers)
+    for typed in [names[0][:-1], names[len(names) // 2].replace("a", "e", 1), "jhon smyth", "qqq"]:
+        trigrams = name_trigrams(normalise_name(typed))
+        scores = {}
+        for name in names:
+            other = name_trigrams(name)
+            score = len(trigrams & other) / len(trigrams | other)
+            if score >= 0.4:
+                scores[name] = score
+        expected = sorted(scores, key=lambda name: (-scores[name], names.index(name)))[:10]
+        assert [normalise_name(name) for name in search.similar(typed)] == expected
+
+
+def test_suggest_puts_completions_first(vouchers, search):
+    name = baseline_names(vouchers)[5]
+    typo = name[:2] + name[3:]
+    suggestions = search.suggest(name[:3])
+    assert suggestions[:len(search.complete(name[:3]))] == search.complete(name[:3])
+    assert len(suggestions) == len(set(suggestions)) <= 10
+    assert name in [normalise_name(suggestion) for suggestion in search.suggest(typo)]
@@ -0,0 +1,72 @@
+import pandas as pd
+import pytest
+
+from benchmarks.generate import generate_vouchers
+from dbclean_1 import clean_data
+from identity import HOUSEHOLD_ID, household_ids, households
+from queries import DuckDBQueries, PandasQueries
+
+# Every aggregate the Crisis Analysis page draws, called on a filtered engine
+AGGREGATES = {
+    "voucher_usage": lambda queries: queries.voucher_usage(),
+    "household_usage": lambda queries: queries.voucher_usage(by=HOUSEHOLD_ID),
+    "return_gaps": lambda queries: queries.return_gaps(),
+    "crisis_summary": lambda queries: queries.crisis_summary(),
+    "secondary_crisis_summary": lambda queries: queries.secondary_crisis_summary(),
+    "secondary_crisis_cooccurrence": lambda queries: queries.secondary_crisis_cooccurrence().reset_index(),
+    "reason_counts": lambda queries: queries.reason_counts(),
+    "requests_over_time": lambda queries: queries.requests_over_time(),
+    "location_summary": lambda queries: queries.location_summary(),
+}
+
+
+@pytest.fixture(scope="module")
+def vouchers():
+    df = clean_data(generate_vouchers(1500, 11))
+    return pd.concat([df, household_ids(df, households(df))], axis=1)
+
+
+@pytest.fixture(scope="module")
+def engines(vouchers):
+    return PandasQueries(vouchers), DuckDBQueries(vouchers)
+
+
+def filters(queries):
+    first, last = queries.date_range()
+    crisis_types = queries.crisis_types()
+    middle = first + (last - first) / 2
+    return {
+        "everything": (crisis_types, first, last),
+        "some crisis types": (crisis_types[:2], middle, last),
+        "no crisis types": ([], first, last),
+        "one day": (crisis_types, middle.normalize(), middle.normalize() + pd.Timedelta(hours=23, minutes=59)),
+        "reversed dates": (crisis_types, last, first),
+    }
+
+
+def assert_same(pandas_result: pd.DataFrame, duckdb_result: pd.DataFrame):
+    pd.testing.assert_frame_equal(
+        pandas_result.reset_index(drop=True), duckdb_result.reset_index(drop=True),
+        check_dtype=False, check_categorical=False,
+    )
+
+
+def test_unfiltered_options_match(engines):
+    pandas_queries, duckdb_queries = engines
+    assert pandas_queries.crisis_types() == duckdb_queries.crisis_types()
+    assert pandas_queries.date_range() == duckdb_queries.date_range()
+
+
+@pytest.mark.parametrize("name", list(AGGREGATES))
+@pytest.mark.parametrize("filter_name", ["everything", "some crisis types", "no crisis types", "one day", "reversed dates"])
+def test_aggregates_match(engines, name, filter_name):
+    pandas_queries, duckdb_queries = engines
+    selection = filters(pandas_queries)[filter_name]
+    assert_same(AGGREGATES[name](pandas_queries.where(*selection)), AGGREGATES[name](duckdb_queries.where(*selection)))
+
+
+@pytest.mark.parametrize("filter_name", ["everything", "some crisis types", "no crisis types"])
+def test_filtered_rows_match(engines, filter_name):
+    pandas_queries, duckdb_queries = engines
+    selection = filters(pandas_queries)[filter_name]
+    pd.testing.assert_frame_equal(pandas_queries.where(*selection).rows(), duckdb_queries.where(*selection).rows())
@@ -0,0 +1,84 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import store
+from benchmarks.generate import generate_vouchers
+from ingest import read_workbook
+from store import StoreDataset, VoucherStore, concat_parts
+
+
+@pytest.fixture(scope="module")
+def export():
+    # An export read the way uploads are, with distinct voucher codes
+    f = io.BytesIO()
+    generate_vouchers(300, 5).drop_duplicates(subset="Voucher code").to_excel(f, index=False)
+    f.seek(0)
+    return read_workbook(f)
+
+
+@pytest.fixture
+def raw(export):
+    return export.copy()
+
+
+@pytest.fixture
+def voucher_store(tmp_path):
+    return VoucherStore(str(tmp_path))
+
+
+def test_only_vouchers_not_already_stored_are_appended(voucher_store, raw):
+    assert voucher_store.append("first", raw.iloc[:200]) == 200
+    assert voucher_store.append("second", raw.iloc[100:]) == len(raw) - 200
+    assert voucher_store.append("second", raw) == 0
+    assert voucher_store.read("raw")["Voucher code"].tolist() == raw["Voucher code"].tolist()
+
+
+def test_vouchers_without_a_code_are_always_appended(voucher_store, raw):
+    raw = raw.iloc[:10].copy()
+    raw.loc[[2, 3], "Voucher code"] = np.nan
+    assert voucher_store.append("first", raw) == 10
+    assert voucher_store.append("second", raw) == 2
+    assert voucher_store.read("raw")["Voucher code"].isna().sum() == 4
+
+
+def test_columns_mixing_numbers_and_text_are_stored(voucher_store, raw):
+    raw = raw.iloc[:10].copy()
+    raw["Voucher code"] = [1001, 1002, *raw["Voucher code"].iloc[2:]]
+    raw.loc[0, "Postcode"] = 12345
+    assert voucher_store.append("first", raw) == 10
+    stored = voucher_store.read("raw")
+    assert stored["Voucher code"].tolist()[:2] == ["1001", "1002"]
+    assert stored.loc[0, "Postcode"] == "12345"
+    # The numeric codes are recognised as stored when the export is appended again
+    assert voucher_store.append("second", raw) == 0
+
+
+def test_parts_cleaned_by_older_code_are_rebuilt(voucher_store, raw, monkeypatch):
+    voucher_store.append("first", raw)
+    expected = voucher_store.read("voucher")
+    monkeypatch.setattr(store, "cleaning_version", lambda: "newer")
+    rebuilt = voucher_store.read("voucher")
+    pd.testing.assert_frame_equal(rebuilt, expected)
+    assert [entry["version"] for entry in voucher_store.manifest()] == ["newer"]
+
+
+def test_empty_store_reads_as_empty_views(voucher_store, raw):
+    assert voucher_store.read("raw").columns.tolist() == raw.columns.tolist()
+    voucher = StoreDataset(voucher_store).view("voucher")
+    assert len(voucher) == 0 and "client id" in voucher.columns
+
+
+def test_concat_parts_keeps_categories_from_every_part():
+    parts = [
+        pd.DataFrame({"town": pd.Categorical(["Stroud", "Tetbury"]), "n": [1, 2]}),
+        pd.DataFrame({"town": pd.Categorical(["Cirencester", None]), "n": [3, 4]}),
+    ]
+    combined = concat_parts(parts)
+    assert isinstance(combined["town"].dtype, pd.CategoricalDtype)
+    assert combined["town"].tolist() == ["Stroud", "Tetbury", "Cirencester", np.nan]
+    assert combined["n"].tolist() == [1, 2, 3, 4]
+    # The parts themselves are left as they were
+    assert parts[0]["town"].cat.categories.tolist() == ["Stroud", "Tetbury"]
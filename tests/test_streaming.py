@@ -0,0 +1,88 @@
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import ingest
+from benchmarks.generate import generate_vouchers
+from dbclean_1 import clean_data
+from ingest import column_types, ingest_columns, load_dataset
+from schema import restore_strings
+from streaming import _unify, stream_clean
+from xlsx_reader import read_xlsx
+
+
+def missing_as_nan(df: pd.DataFrame) -> pd.DataFrame:
+    # Text columns read back from Arrow hold None where pandas holds NaN, both are missing
+    text = df.columns[df.dtypes == object]
+    return df.assign(**{column: df[column].where(df[column].notna(), float("nan")) for column in text})
+
+
+def workbook(df: pd.DataFrame) -> io.BytesIO:
+    f = io.BytesIO()
+    df.to_excel(f, index=False)
+    f.seek(0)
+    return f
+
+
+def test_rows_repeated_across_batches_are_dropped():
+    df = pd.DataFrame({
+        "code": ["a", "b", "a", "c", "b", "d", "a", None, None],
+        "count": [1, 2, 1, 3, 2, 4, 5, None, None],
+    })
+    f = workbook(df)
+    streamed = stream_clean(f, lambda batch: batch, ["code", "count"], batch_size=2).to_pandas()
+    f.seek(0)
+    expected = read_xlsx(f, ["code", "count"]).drop_duplicates().reset_index(drop=True)
+    pd.testing.assert_frame_equal(streamed, expected)
+
+
+@pytest.mark.parametrize("batch_size", [64, 1000])
+def test_streamed_voucher_view_matches_cleaning_the_whole_sheet(batch_size):
+    raw = generate_vouchers(400, 3)
+    # Repeat some vouchers further down the sheet, so duplicates fall in different batches
+    f = workbook(pd.concat([raw, raw.iloc[::7]], ignore_index=True))
+    streamed = restore_strings(
+        stream_clean(f, clean_data, ingest_columns, column_types, batch_size=batch_size).to_pandas()
+    )
+    f.seek(0)
+    expected = clean_data(read_xlsx(f, ingest_columns, column_types)).reset_index(drop=True)
+    assert (streamed.dtypes.astype(str) == expected.dtypes.astype(str)).all()
+    pd.testing.assert_frame_equal(missing_as_nan(streamed), missing_as_nan(expected), check_categorical=False)
+
+
+def test_unify_takes_each_column_type_from_batches_with_values():
+    tables = [
+        pa.table({"a": pa.array([None, None], pa.null()), "b": pa.array(["x", "y"])}),
+        pa.table({"a": pa.array([1, 2], pa.int64()), "b": pa.array([None], pa.string()).take([0, 0])}),
+        pa.table({"a": pa.array([None], pa.string()), "b": pa.array(["z"])}),
+    ]
+    unified = _unify(tables)
+    assert unified.schema.field("a").type == pa.int64()
+    assert unified.schema.field("b").type == pa.string()
+    assert unified.column("a").to_pylist() == [None, None, 1, 2, None]
+
+
+def streaming_dataset(monkeypatch, error: Exception):
+    def fail(*args, **kwargs):
+        raise error
+    monkeypatch.setattr(ingest, "STREAMING_MIN_BYTES", 0)
+    monkeypatch.setattr(ingest, "stream_clean", fail)
+    f = workbook(generate_vouchers(50, 4))
+    dataset, success = load_dataset(f.getvalue())
+    assert success and dataset.streaming
+    return dataset
+
+
+def test_streaming_falls_back_to_the_whole_workbook_on_reader_errors(monkeypatch):
+    dataset = streaming_dataset(monkeypatch, KeyError("xl/workbook.xml"))
+    voucher = dataset.view("voucher")
+    pd.testing.assert_frame_equal(voucher, dataset.pipeline.run("voucher"))
+    assert "voucher view > streaming failed: KeyError" in dataset.profiler.frame()["step"].tolist()
+
+
+def test_streaming_raises_other_errors(monkeypatch):
+    dataset = streaming_dataset(monkeypatch, RuntimeError("bug"))
+    with pytest.raises(RuntimeError):
+        dataset.view("voucher")
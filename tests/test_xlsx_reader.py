@@ -0,0 +1,28 @@
+import io
+from datetime import datetime
+
+import openpyxl
+import pandas as pd
+
+from dbclean_1 import parse_dates
+from xlsx_reader import read_xlsx
+
+
+def workbook(rows: list) -> io.BytesIO:
+    wb = openpyxl.Workbook()
+    for row in rows:
+        wb.active.append(row)
+    f = io.BytesIO()
+    wb.save(f)
+    f.seek(0)
+    return f
+
+
+def test_text_dates_are_left_for_parse_dates_to_read_day_first():
+    f = workbook([["when"], ["03/04/2023"], ["13/04/2023 10:00"], [datetime(2023, 4, 6)]])
+    column = read_xlsx(f, ["when"], {"when": "date"})["when"]
+    f.seek(0)
+    pd.testing.assert_series_equal(column, pd.read_excel(f)["when"])
+    assert parse_dates(column).tolist() == [
+        pd.Timestamp("2023-04-03"), pd.Timestamp("2023-04-13 10:00"), pd.Timestamp("2023-04-06"),
+    ]
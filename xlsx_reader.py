@@ -0,0 +1,260 @@
+import posixpath
+from datetime import datetime
+import xml.etree.ElementTree as ET
+import zipfile
+
+import numpy as np
+import pandas as pd
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.cell import column_index_from_string
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel
+
+NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+# Errors reading a workbook the fast reader does not understand (a missing part or column, malformed XML or
+# cell values), which callers answer by reading it another way
+READER_ERRORS = (KeyError, ValueError, IndexError, zipfile.BadZipFile, ET.ParseError)
+
+# Strings pandas reads as missing values
+NA_STRINGS = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+}
+TRUE_STRINGS = {"True", "TRUE", "true"}
+FALSE_STRINGS = {"False", "FALSE", "false"}
+
+
+def _first_sheet_path(archive: zipfile.ZipFile) -> str:
+    workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+    sheet = workbook.find(f"{NS}sheets/{NS}sheet")
+    rel_id = sheet.get(f"{REL_NS}id")
+    rels = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    for rel in rels.iter(f"{PKG_REL_NS}Relationship"):
+        if rel.get("Id") == rel_id:
+            target = rel.get("Target")
+            if target.startswith("/"):
+                return target.lstrip("/")
+            return posixpath.normpath(posixpath.join("xl", target))
+    raise KeyError(f"Relationship {rel_id} not found in workbook")
+
+
+def _epoch(archive: zipfile.ZipFile):
+    """
+    Return the date serials' epoch, workbooks saved with the 1904 date system count days from 1904
+    """
+    properties = ET.fromstring(archive.read("xl/workbook.xml")).find(f"{NS}workbookPr")
+    if properties is not None and properties.get("date1904", "").lower() in ("1", "true"):
+        return CALENDAR_MAC_1904
+    return CALENDAR_WINDOWS_1900
+
+
+def _shared_strings(archive: zipfile.ZipFile) -> list[str]:
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+    strings = []
+    with archive.open("xl/sharedStrings.xml") as f:
+        for _, element in ET.iterparse(f):
+            if element.tag == f"{NS}si":
+                text = element.findtext(f"{NS}t")
+                if text is None:
+                    # Rich text is split into runs; phonetic hints (rPh) are not part of the value
+                    text = "".join(run.findtext(f"{NS}t") or "" for run in element.findall(f"{NS}r"))
+                strings.append(text)
+                element.clear()
+    return strings
+
+
+def _date_styles(archive: zipfile.ZipFile) -> set[int]:
+    """
+    Return the indices of the cell styles whose number format is a date
+    """
+    if "xl/styles.xml" not in archive.namelist():
+        return set()
+    styles = ET.fromstring(archive.read("xl/styles.xml"))
+    formats = dict(BUILTIN_FORMATS)
+    for num_fmt in styles.iter(f"{NS}numFmt"):
+        formats[int(num_fmt.get("numFmtId"))] = num_fmt.get("formatCode")
+    cell_xfs = styles.find(f"{NS}cellXfs")
+    if cell_xfs is None:
+        return set()
+    return {
+        index for index, xf in enumerate(cell_xfs.findall(f"{NS}xf"))
+        if is_date_format(formats.get(int(xf.get("numFmtId", 0)), ""))
+    }
+
+
+def _cell_value(cell: ET.Element, shared_strings: list[str], date_styles: set[int], epoch=CALENDAR_WINDOWS_1900):
+    cell_type = cell.get("t", "n")
+    if cell_type == "inlineStr":
+        return "".join(t.text or "" for t in cell.iter(f"{NS}t"))
+    value = cell.findtext(f"{NS}v")
+    if value is None:
+        return None
+    if cell_type == "s":
+        return shared_strings[int(value)]
+    if cell_type == "b":
+        return value == "1"
+    if cell_type == "e":
+        return None
+    if cell_type == "str":
+        return value
+    if cell_type == "d":
+        return datetime.fromisoformat(value)
+    if int(cell.get("s", 0)) in date_styles:
+        return from_excel(float(value), epoch=epoch)
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def _typed_column(values: list, kind: str) -> pd.Series:
+    """
+    Build a column from parsed cell values, converting text the way pandas would for the declared kind
+
+    Date columns of date cells come out as datetime64. Dates typed as text stay text, as
+    pd.read_excel leaves them, for dbclean_1.parse_dates to read with its day-first
+    formats rather than pandas guessing month-first.
+    """
+    values = [None if isinstance(v, str) and v in NA_STRINGS else v for v in values]
+    if all(v is None for v in values):
+        return pd.Series(np.nan, index=range(len(values)))  # Empty columns read as float NaN
+    if kind == "bool":
+        values = [True if v in TRUE_STRINGS else False if v in FALSE_STRINGS else v for v in values]
+    column = pd.Series(values, dtype=object).infer_objects()
+    if column.dtype == object:
+        column = column.where(column.notna(), np.nan)
+    if kind == "int" and column.dtype == object:
+        try:
+            column = pd.to_numeric(column)
+        except (ValueError, TypeError):
+            pass  # Leave free text in a numeric column as it is, like pd.read_excel
+    return column
+
+
+def _frame(data: dict, n_rows: int, types: dict, start: int) -> pd.DataFrame:
+    return pd.DataFrame(
+        {column: _typed_column(values[:n_rows], types.get(column)) for column, values in data.items()}
+    ).set_axis(range(start, start + n_rows))
+
+
+def sheet_row_count(workbook) -> int:
+    """
+    Return the number of data rows the first sheet declares in its dimension, or None if it has none
+    """
+    with zipfile.ZipFile(workbook) as archive:
+        with archive.open(_first_sheet_path(archive)) as f:
+            for _, element in ET.iterparse(f, events=("start",)):
+                if element.tag == f"{NS}dimension":
+                    last_cell = element.get("ref", "").split(":")[-1]
+                    digits = last_cell.lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+                    return int(digits) - 1 if digits else None
+                if element.tag == f"{NS}sheetData":
+                    return None
+    return None
+
+
+def iter_xlsx(workbook, columns: list[str], types: dict = None, batch_size: int = None):
+    """
+    Read only the named columns of the first sheet of an xlsx workbook, in batches of rows
+
+    The header row is used to resolve which cell positions hold the wanted columns, and
+    every other cell is skipped without being converted. Each batch keeps the row
+    positions of the sheet as its index, rows left out of the sheet's XML count as blank
+    rows, and dates follow the workbook's 1900 or 1904 date system.
+
+    Parameters:
+        workbook: A path or file-like object of a plain (decrypted) xlsx
+        columns (list): The column headings to read
+        types (dict): Optional column heading -> "date", "int" or "bool" conversions
+        batch_size (int): Rows per batch, or None to read the whole sheet as one batch
+    Yields:
+        pd.DataFrame: The wanted columns of the next batch of rows, in the order given
+    """
+    types = types or {}
+    with zipfile.ZipFile(workbook) as archive:
+        shared_strings = _shared_strings(archive)
+        date_styles = _date_styles(archive)
+        epoch = _epoch(archive)
+
+        positions = None  # cell position -> heading, resolved from the header row
+        letter_positions = {}
+        data = {column: [] for column in columns}
+        start = 0
+        n_rows = 0
+        last_row_with_data = 0
+        header_row = None
+        with archive.open(_first_sheet_path(archive)) as f:
+            for _, element in ET.iterparse(f):
+                if element.tag != f"{NS}row":
+                    continue
+                row = {}
+                has_data = False
+                row_number = element.get("r")
+                for position, cell in enumerate(element.iter(f"{NS}c")):
+                    ref = cell.get("r")
+                    if ref:
+                        letters = ref.rstrip("0123456789")
+                        if letters not in letter_positions:
+                            letter_positions[letters] = column_index_from_string(letters) - 1
+                        position = letter_positions[letters]
+                    if positions is None:
+                        row[position] = _cell_value(cell, shared_strings, date_styles, epoch)
+                    elif position in positions:
+                        value = _cell_value(cell, shared_strings, date_styles, epoch)
+                        if value is not None and value != "":
+                            row[positions[position]] = value
+                            has_data = True
+                    elif not has_data and (cell.find(f"{NS}v") is not None or cell.find(f"{NS}is") is not None):
+                        has_data = True
+                element.clear()
+
+                if positions is None:
+                    header_row = int(row_number or 1)
+                    # Keep the first occurrence of each wanted heading, as df[columns] would
+                    positions = {}
+                    for position, heading in sorted(row.items()):
+                        if heading in data and heading not in positions.values():
+                            positions[position] = heading
+                    missing = set(columns) - set(positions.values())
+                    if missing:
+                        raise KeyError(f"Columns not found in workbook: {sorted(missing)}")
+                    continue
+
+                # Rows missing from the sheet are blank rows, as openpyxl and pd.read_excel read them
+                expected = header_row + start + n_rows + 1
+                gap = int(row_number) - expected if row_number else 0
+                for column in columns:
+                    data[column].extend([None] * gap)
+                    data[column].append(row.get(column))
+                n_rows += gap + 1
+                if has_data:
+                    last_row_with_data = n_rows
+
+                if batch_size and last_row_with_data >= batch_size:
+                    yield _frame(data, last_row_with_data, types, start)
+                    # Carry any empty rows over, they only count if more data follows
+                    data = {column: values[last_row_with_data:] for column, values in data.items()}
+                    start += last_row_with_data
+                    n_rows -= last_row_with_data
+                    last_row_with_data = 0
+
+    # Trailing empty rows are dropped, as pd.read_excel does
+    if last_row_with_data:
+        yield _frame(data, last_row_with_data, types, start)
+
+
+def read_xlsx(workbook, columns: list[str], types: dict = None) -> pd.DataFrame:
+    """
+    Read only the named columns of the first sheet of an xlsx workbook
+
+    Parameters:
+        workbook: A path or file-like object of a plain (decrypted) xlsx
+        columns (list): The column headings to read
+        types (dict): Optional column heading -> "date", "int" or "bool" conversions
+    Returns:
+        pd.DataFrame: The wanted columns, in the order given
+    """
+    for batch in iter_xlsx(workbook, columns, types):
+        return batch
+    return pd.DataFrame(columns=columns)